@@ -0,0 +1,96 @@
+import os
+import shlex
+import logging
+import subprocess
+
+"""
+Ways of starting a miniwdl run, used by RunQueue.py.
+Every backend runs the same shell command, which writes the exit code of miniwdl to a file of the output directory
+when it ends: the queue reads that file to know that a run finished, and only asks the backend
+whether a run without exit code is still alive (to detect runs that were killed).
+- tmux: one detached session per run, named after the run id (as tmuxLaunchTrio.sh did)
+- local: a background process of this node
+- slurm: one sbatch job per run
+"""
+
+class TmuxBackend:
+	name = "tmux"
+
+	def start(self, run_id, command, log_path, walltime=None):
+		"""
+		Returns: job identifier (the tmux session name)
+		"""
+		#The session of a previous attempt is kept open once miniwdl is done (see alive): it is closed before the retry
+		if self.alive(run_id):
+			subprocess.run(["tmux", "kill-session", "-t", run_id], check=True)
+		subprocess.run(["tmux", "new-session", "-d", "-s", run_id], check=True)
+		subprocess.run(["tmux", "send-keys", "-t", run_id, f"{command} 2>&1 | tee -a {shlex.quote(log_path)}", "Enter"], check=True)
+		return run_id
+
+	def alive(self, job):
+		#The session stays open once miniwdl is done, so that its output can still be read
+		return subprocess.run(["tmux", "has-session", "-t", job], capture_output=True).returncode == 0
+
+class LocalBackend:
+	name = "local"
+
+	def __init__(self):
+		self._processes = {}
+
+	def start(self, run_id, command, log_path, walltime=None):
+		"""
+		Returns: job identifier (the pid)
+		"""
+		with open(log_path, 'a') as log:
+			process = subprocess.Popen(["bash", "-lc", command], stdout=log, stderr=subprocess.STDOUT,
+				stdin=subprocess.DEVNULL, start_new_session=True)
+		self._processes[str(process.pid)] = process
+		return str(process.pid)
+
+	def alive(self, job):
+		if job in self._processes:
+			return self._processes[job].poll() is None
+		#Started by a previous launcher
+		try:
+			os.kill(int(job), 0)
+		except (OSError, ValueError):
+			return False
+		return True
+
+class SlurmBackend:
+	"""
+	- `options`: extra sbatch options (ex.: ["--account=def-xxx", "--cpus-per-task=4", "--mem=16G"])
+	- `sbatch`, `squeue`: commands to call, replaceable by stubs to test the launcher without SLURM
+	"""
+	name = "slurm"
+
+	def __init__(self, options=(), sbatch="sbatch", squeue="squeue"):
+		self.options	= list(options)
+		self.sbatch		= sbatch
+		self.squeue		= squeue
+
+	def start(self, run_id, command, log_path, walltime=None):
+		"""
+		- `walltime`: time limit of the job in minutes, None for the default of the partition
+		Returns: job identifier (the SLURM job id)
+		"""
+		argv = [self.sbatch, "--parsable", f"--job-name={run_id}", f"--output={log_path}"] + self.options
+		if walltime is not None:
+			argv.append(f"--time={int(walltime)}")
+		argv.append(f"--wrap=bash -lc {shlex.quote(command)}")
+		result = subprocess.run(argv, capture_output=True, text=True, check=True)
+		#--parsable prints "jobid" or "jobid;cluster"
+		return result.stdout.strip().split(";")[0]
+
+	def alive(self, job):
+		result = subprocess.run([self.squeue, "-h", "-j", job, "-o", "%T"], capture_output=True, text=True)
+		if result.returncode != 0:
+			#Jobs purged from slurmctld are unknown to squeue. Any other error (timeout, RPC failure...)
+			#says nothing about the job, which is then considered still running until the next check
+			if "invalid job id" in (result.stderr + result.stdout).lower():
+				return False
+			logging.warning(f"squeue failed for job {job}, checking it again later: {result.stderr.strip()}")
+			return True
+		return result.stdout.strip() not in ("", "COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL")
+
+BACKENDS = {backend.name: backend for backend in (TmuxBackend, LocalBackend, SlurmBackend)}
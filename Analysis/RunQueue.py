@@ -0,0 +1,231 @@
+import os,sys
+import json
+import time
+import fcntl
+import shlex
+import logging
+import subprocess
+from contextlib import contextmanager
+from Backends import BACKENDS
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from atomicWrite import write_json
+
+"""
+Queue of miniwdl runs (families or singletons) started with at most `max_running` runs at once.
+Each run is identified by its samplesheet name ({sample_sheet_path}/{run_id}.json) and writes to {output_path}/{run_id},
+as with tmuxLaunchTrio.sh. The workflow (family.wdl or singleton.wdl) is chosen from the samplesheet inputs.
+The state of every run (queued, running, succeeded, failed, lost) is kept in a JSON state file shared by all launchers,
+locked while it is updated, so that runs started by another launcher count towards the limit.
+A run is finished when miniwdl wrote its exit code in {output}/EXIT_CODE_FILE, and lost when it has no exit code
+and its backend no longer knows it (killed session, cancelled job...).
+"""
+
+WDL_DIR			= os.path.join(os.path.dirname(os.path.abspath(__file__)), "HiFi-human-WGS-WDL", "workflows")
+EXIT_CODE_FILE	= ".launcher_exit_code"
+LOG_FILE		= "launcher.log"
+#Prefix of the samplesheet inputs: workflow file
+WORKFLOWS = {
+	"humanwgs_family":		"family.wdl",
+	"humanwgs_singleton":	"singleton.wdl",
+}
+ACTIVE = ("queued", "running")
+
+def workflow_for(samplesheet):
+	"""
+	- `samplesheet`: Dict of a samplesheet json
+	Returns: workflow file name (family.wdl or singleton.wdl)
+	Raises: ValueError if the inputs are not those of a known workflow
+	"""
+	prefixes = {key.split(".", 1)[0] for key in samplesheet}
+	workflows = {WORKFLOWS[prefix] for prefix in prefixes if prefix in WORKFLOWS}
+	if len(workflows) != 1:
+		raise ValueError(f"Cannot tell the workflow from the samplesheet inputs ({', '.join(sorted(prefixes))})")
+	return workflows.pop()
+
+def fix_affected(samplesheet):
+	"""
+	Older samplesheets have "affected": "True"/"False" strings, while the family workflow expects booleans
+	Returns: True if the samplesheet was changed
+	"""
+	changed = False
+	for sample in samplesheet.get("humanwgs_family.family", {}).get("samples", []):
+		if isinstance(sample.get("affected"), str):
+			sample["affected"] = sample["affected"].strip().lower() == "true"
+			changed = True
+	return changed
+
+class RunQueue:
+	"""
+	- `state_path`: JSON state file
+	- `backend`: backend instance (see Backends.py) used to start the runs
+	- `setup`: shell command run before miniwdl (ex.: "module load apptainer/1.3.5")
+	- `backend_options`: Dict {backend name: kwargs} to check runs started with another backend
+	"""
+	def __init__(self, state_path, backend, sample_sheet_path, output_path, miniwdl_cfg, max_running=4,
+			wdl_dir=WDL_DIR, setup="", backend_options=None):
+		self.state_path			= state_path
+		self.backend			= backend
+		self.sample_sheet_path	= sample_sheet_path
+		self.output_path		= output_path
+		self.miniwdl_cfg		= miniwdl_cfg
+		self.max_running		= max_running
+		self.wdl_dir			= wdl_dir
+		self.setup				= setup
+		self.backend_options	= backend_options or {}
+		self._backends			= {backend.name: backend}
+
+	@contextmanager
+	def _state(self):
+		"""
+		Yields the runs of the state file {run_id: run}, written back at the end, with the file locked in between
+		"""
+		with open(f"{self.state_path}.lock", 'w') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			runs = {}
+			if os.path.isfile(self.state_path):
+				with open(self.state_path) as fr:
+					runs = json.load(fr)["runs"]
+			yield runs
+			write_json(self.state_path, {"runs": runs})
+
+	def _backend(self, name):
+		if name not in self._backends:
+			self._backends[name] = BACKENDS[name](**self.backend_options.get(name, {}))
+		return self._backends[name]
+
+	def add(self, run_ids, retry=False, estimates=None):
+		"""
+		Queue runs, unless already queued, running or succeeded
+		- `retry`: queue again the runs that failed or were lost
+		- `estimates`: Dict {run_id: {"estimate": hours, "walltime": minutes}} of the runtime model (see RuntimeModel.py)
+		Returns: Dict {run_id: status after the call}
+		"""
+		added = {}
+		estimates = estimates or {}
+		with self._state() as runs:
+			#A lost run that finished since the last check is not queued again by retry
+			self._refresh(runs)
+			for run_id in run_ids:
+				run = runs.get(run_id)
+				if run is None or (retry and run["status"] in ("failed", "lost")):
+					runs[run_id] = {"status": "queued", "queued": time.time(),
+						"samplesheet": os.path.join(self.sample_sheet_path, f"{run_id}.json"),
+						"output": os.path.join(self.output_path, run_id)}
+				if runs[run_id]["status"] == "queued":
+					runs[run_id].update(estimates.get(run_id, {}))
+				added[run_id] = runs[run_id]["status"]
+		return added
+
+	def _refresh(self, runs):
+		"""
+		Read the exit code of the running runs, and of the lost runs that wrote one after all
+		(ex.: a job reported gone while SLURM was not responding)
+		"""
+		for run_id, run in runs.items():
+			if run["status"] not in ("running", "lost"):
+				continue
+			exit_path = os.path.join(run["output"], EXIT_CODE_FILE)
+			if os.path.isfile(exit_path):
+				with open(exit_path) as fr:
+					code = fr.read().strip()
+				run["exit_code"] = int(code) if code.lstrip("-").isdigit() else None
+				run["status"] = "succeeded" if run["exit_code"] == 0 else "failed"
+				run["finished"] = os.path.getmtime(exit_path)
+			elif run["status"] == "running" and not self._backend(run["backend"]).alive(run["job"]):
+				logging.warning(f"{run_id} ({run['backend']} {run['job']}) ended without an exit code")
+				run["status"] = "lost"
+				run["finished"] = time.time()
+
+	def _start(self, run_id, run):
+		"""
+		Prepare the samplesheet and output directory of a run, then start it with the backend
+		"""
+		with open(run["samplesheet"]) as fr:
+			samplesheet = json.load(fr)
+		run["workflow"] = workflow_for(samplesheet)
+		if fix_affected(samplesheet):
+			write_json(run["samplesheet"], samplesheet)
+		os.makedirs(run["output"], exist_ok=True)
+		exit_path = os.path.join(run["output"], EXIT_CODE_FILE)
+		if os.path.exists(exit_path):
+			os.remove(exit_path)
+
+		miniwdl = " ".join(shlex.quote(arg) for arg in ["miniwdl", "run", os.path.join(self.wdl_dir, run["workflow"]),
+			"-i", run["samplesheet"], "--cfg", self.miniwdl_cfg, "-v", "-d", run["output"]])
+		setup = f"{self.setup} && " if self.setup else ""
+		command = f"({setup}{miniwdl}; echo $? > {shlex.quote(exit_path)})"
+		run["job"] = self.backend.start(run_id, command, os.path.join(run["output"], LOG_FILE), walltime=run.get("walltime"))
+		run["backend"] = self.backend.name
+		run["started"] = time.time()
+		run["status"] = "running"
+
+	def refresh(self):
+		"""
+		Update the runs that finished, without starting any
+		Returns: Dict {run_id: run} of the state file
+		"""
+		with self._state() as runs:
+			self._refresh(runs)
+		return runs
+
+	def step(self):
+		"""
+		Update the finished runs, then start queued runs (see start_order) while fewer than max_running are running
+		Returns: Dict {run_id: run} of the runs started
+		"""
+		started = {}
+		with self._state() as runs:
+			self._refresh(runs)
+			running = sum(run["status"] == "running" for run in runs.values())
+			for run_id in self.start_order(runs):
+				if running >= self.max_running:
+					break
+				run = runs[run_id]
+				try:
+					self._start(run_id, run)
+				except (OSError, ValueError, KeyError, RuntimeError, subprocess.CalledProcessError) as e:
+					logging.warning(f"Could not start {run_id}: {e}")
+					run["status"] = "failed"
+					run["error"] = str(e)
+					run["finished"] = time.time()
+					continue
+				running += 1
+				started[run_id] = run
+		return started
+
+	def start_order(self, runs):
+		"""
+		Returns: List of the queued run ids, in the order in which they should start:
+		longest estimated runs first (so that the shorter ones fill the end of the batch), then in queue order
+		"""
+		queued = [run_id for run_id, run in runs.items() if run["status"] == "queued"]
+		return sorted(queued, key=lambda run_id: (-(runs[run_id].get("estimate") or 0), runs[run_id]["queued"]))
+
+	def wait(self, run_ids=None, poll_interval=60, on_change=None):
+		"""
+		Start and follow the runs until none of `run_ids` (default: all the runs of the state file) is queued or running
+		- `on_change`: called with the runs each time one of them started or finished
+		Returns: Dict {run_id: run} of the runs followed
+		"""
+		previous = None
+		while True:
+			self.step()
+			runs = self.runs()
+			if run_ids is not None:
+				runs = {run_id: runs[run_id] for run_id in run_ids if run_id in runs}
+			statuses = {run_id: run["status"] for run_id, run in runs.items()}
+			if statuses != previous and on_change is not None:
+				on_change(runs)
+			previous = statuses
+			if not any(status in ACTIVE for status in statuses.values()):
+				return runs
+			time.sleep(poll_interval)
+
+	def runs(self):
+		"""
+		Returns: Dict {run_id: run} of the state file, without updating it
+		"""
+		if not os.path.isfile(self.state_path):
+			return {}
+		with open(self.state_path) as fr:
+			return json.load(fr)["runs"]
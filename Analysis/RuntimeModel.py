@@ -0,0 +1,267 @@
+import os,sys
+import json
+import math
+import glob
+import time
+import argparse
+import logging
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from atomicWrite import write_json
+from configLoader import load_config
+
+"""
+Runtime model of the WGS pipeline, mined from the completed miniwdl runs of the output_path
+({output_path}/{run_id}/{timestamp}_{workflow}/, with workflow.log, inputs.json, outputs.json and call-*/task.log).
+For every run, the wall time of the workflow and of each task is read from the first and last timestamps of its logs,
+and the HiFi BAM size and family size from the hifi_reads of its inputs.
+The model is a least squares fit of hours = a + b * BAM GB + c * family size, saved as JSON
+({output_path}/runtimeModel.json) with the mined runs, so that only new runs are read when it is fitted again.
+launchRuns.py uses it to request SLURM walltimes and to start the longest runs first.
+"""
+
+MODEL_VERSION		= 1
+FEATURES			= ["intercept", "bam_gb", "family_size"]
+#miniwdl log lines start with "2024-01-15 10:23:45.123"
+TIMESTAMP_FORMAT	= "%Y-%m-%d %H:%M:%S"
+
+def log_span(log_path):
+	"""
+	Returns: tuple (first, last) timestamps (seconds since the epoch) of a miniwdl log, or None if it has none
+	Only the start and the end of the file are read
+	"""
+	def timestamp(line):
+		try:
+			return time.mktime(time.strptime(line[:19], TIMESTAMP_FORMAT))
+		except ValueError:
+			return None
+
+	with open(log_path, 'rb') as fr:
+		first = None
+		for line in fr:
+			first = timestamp(line.decode(errors="replace"))
+			if first is not None:
+				break
+		fr.seek(max(0, os.path.getsize(log_path) - 65536))
+		last = None
+		for line in fr.read().decode(errors="replace").splitlines():
+			last = timestamp(line) or last
+	if first is None or last is None:
+		return None
+	return first, last
+
+def samplesheet_features(samplesheet):
+	"""
+	- `samplesheet`: Dict of a samplesheet json, or of the inputs.json of a run
+	Returns: Dict {"bam_gb": total size of the HiFi BAMs, "family_size": number of samples}, bam_gb is None if a BAM is missing
+	"""
+	if "humanwgs_family.family" in samplesheet:
+		bams = [sample.get("hifi_reads", []) for sample in samplesheet["humanwgs_family.family"].get("samples", [])]
+	else:
+		bams = [samplesheet.get("humanwgs_singleton.hifi_reads", [])]
+	try:
+		bam_gb = sum(os.path.getsize(bam) for sample_bams in bams for bam in sample_bams) / 1e9
+	except OSError:
+		bam_gb = None
+	return {"bam_gb": bam_gb, "family_size": len(bams)}
+
+def task_name(call_dir):
+	#call-pbmm2_align_wgs-2 -> pbmm2_align_wgs (scattered calls are numbered)
+	name = os.path.basename(call_dir).removeprefix("call-")
+	base, _, index = name.rpartition("-")
+	return base if base and index.isdigit() else name
+
+def mine_run(run_dir):
+	"""
+	- `run_dir`: miniwdl run directory ({output_path}/{run_id}/{timestamp}_{workflow})
+	Returns: Dict {"run_dir", "workflow", "hours", "bam_gb", "family_size", "tasks": {task: wall hours}}, or None if the run did not complete
+	Tasks scattered over samples or regions count from the start of the first call to the end of the last one
+	"""
+	if not os.path.isfile(os.path.join(run_dir, "outputs.json")):
+		return None
+	span = log_span(os.path.join(run_dir, "workflow.log"))
+	if span is None:
+		return None
+	with open(os.path.join(run_dir, "inputs.json")) as fr:
+		features = samplesheet_features(json.load(fr))
+
+	task_spans = {}
+	for task_log in glob.glob(os.path.join(run_dir, "**", "call-*", "task.log"), recursive=True):
+		task_span = log_span(task_log)
+		if task_span is None:
+			continue
+		name = task_name(os.path.dirname(task_log))
+		start, end = task_spans.get(name, task_span)
+		task_spans[name] = (min(start, task_span[0]), max(end, task_span[1]))
+	return {
+		"run_dir": run_dir,
+		"workflow": os.path.basename(run_dir).split("_", 2)[-1],
+		"hours": (span[1] - span[0]) / 3600,
+		**features,
+		"tasks": {name: (end - start) / 3600 for name, (start, end) in sorted(task_spans.items())}}
+
+def reusable_runs(known):
+	"""
+	Returns: Dict {run_dir realpath: run} of the runs of `known` that do not need to be mined again
+	"""
+	#{run_id}/_LAST links to the latest run of run_id, which is mined under its own directory.
+	#Runs mined while their BAMs were missing are mined again, in case the BAMs are back
+	return {os.path.realpath(run_dir): run for run_dir, run in known.items()
+		if os.path.basename(run_dir) != "_LAST" and run.get("bam_gb") is not None}
+
+def mine_runs(output_path, known=None):
+	"""
+	- `known`: Dict {run_dir: run} already mined (completed runs do not change, except for the size of their BAMs)
+	Returns: List of the runs of mine_run, for every completed run of output_path
+	"""
+	known = reusable_runs(known or {})
+	runs, seen = [], set()
+	for workflow_log in sorted(glob.glob(os.path.join(output_path, "*", "*", "workflow.log"))):
+		if os.path.basename(os.path.dirname(workflow_log)) == "_LAST":
+			continue
+		run_dir = os.path.realpath(os.path.dirname(workflow_log))
+		if run_dir in seen:
+			continue
+		seen.add(run_dir)
+		if run_dir in known:
+			runs.append(known[run_dir])
+			continue
+		try:
+			run = mine_run(run_dir)
+		except (OSError, ValueError) as e:
+			logging.warning(f"Skipping {run_dir}: {e}")
+			continue
+		if run is not None:
+			runs.append(run)
+	return runs
+
+def least_squares(rows, targets):
+	"""
+	Solve the normal equations of rows @ x = targets (Gaussian elimination)
+	Returns: List of coefficients, or None if the features are collinear
+	"""
+	size = len(rows[0])
+	matrix = [[sum(row[i] * row[j] for row in rows) for j in range(size)] + [sum(row[i] * target for row, target in zip(rows, targets))] for i in range(size)]
+	for column in range(size):
+		pivot = max(range(column, size), key=lambda line: abs(matrix[line][column]))
+		if abs(matrix[pivot][column]) < 1e-9:
+			return None
+		matrix[column], matrix[pivot] = matrix[pivot], matrix[column]
+		for line in range(size):
+			if line != column:
+				factor = matrix[line][column] / matrix[column][column]
+				matrix[line] = [value - factor * pivot_value for value, pivot_value in zip(matrix[line], matrix[column])]
+	return [matrix[line][size] / matrix[line][line] for line in range(size)]
+
+class RuntimeModel:
+	"""
+	- `coefficients`: Dict {feature: hours per unit} for FEATURES
+	- `sigma`: standard deviation of the residuals (hours)
+	- `runs`: the mined runs the model was fitted on
+	"""
+	def __init__(self, coefficients, sigma, runs=()):
+		self.coefficients	= coefficients
+		self.sigma			= sigma
+		self.runs			= list(runs)
+
+	@classmethod
+	def fit(cls, runs):
+		"""
+		Fit the model on the runs whose BAM size is known.
+		The family size, then the BAM size, are left out when the runs do not allow to estimate them (ex.: only singletons)
+		Raises: ValueError if there are fewer than 3 usable runs
+		"""
+		usable = [run for run in runs if run["bam_gb"] is not None]
+		if len(usable) < 3:
+			raise ValueError(f"{len(usable)} completed runs with their BAMs, at least 3 are needed")
+		targets = [run["hours"] for run in usable]
+		for features in (FEATURES, FEATURES[:2], FEATURES[:1]):
+			rows = [[1.0 if feature == "intercept" else run[feature] for feature in features] for run in usable]
+			solution = least_squares(rows, targets)
+			if solution is not None:
+				break
+		coefficients = {feature: 0.0 for feature in FEATURES}
+		coefficients.update(zip(features, solution))
+		model = cls(coefficients, 0.0, runs)
+		residuals = [run["hours"] - model.estimate(run["bam_gb"], run["family_size"]) for run in usable]
+		model.sigma = math.sqrt(sum(residual ** 2 for residual in residuals) / max(1, len(usable) - len(features)))
+		return model
+
+	def estimate(self, bam_gb, family_size):
+		"""
+		Returns: expected wall time in hours (at least 0)
+		"""
+		return max(0.0, self.coefficients["intercept"] + self.coefficients["bam_gb"] * bam_gb + self.coefficients["family_size"] * family_size)
+
+	def walltime(self, bam_gb, family_size, margin=2.0, minimum_hours=1, maximum_hours=168):
+		"""
+		- `margin`: number of residual standard deviations added to the estimate
+		Returns: walltime to request in minutes, rounded up to 30 minutes, between minimum_hours and maximum_hours
+		"""
+		hours = self.estimate(bam_gb, family_size) + margin * self.sigma
+		minutes = math.ceil(hours * 2) * 30
+		return int(min(max(minutes, minimum_hours * 60), maximum_hours * 60))
+
+	def task_hours(self):
+		"""
+		Returns: Dict {task: (number of runs, mean hours, max hours)} over the mined runs, longest mean first
+		"""
+		hours = {}
+		for run in self.runs:
+			for task, task_hours in run["tasks"].items():
+				hours.setdefault(task, []).append(task_hours)
+		summary = {task: (len(values), sum(values) / len(values), max(values)) for task, values in hours.items()}
+		return dict(sorted(summary.items(), key=lambda item: -item[1][1]))
+
+	def save(self, path):
+		write_json(path, {"version": MODEL_VERSION, "coefficients": self.coefficients, "sigma": self.sigma, "runs": self.runs})
+
+	@classmethod
+	def load(cls, path):
+		"""
+		Returns: the saved model, or None if there is none (or of another version)
+		"""
+		if not os.path.isfile(path):
+			return None
+		with open(path) as fr:
+			saved = json.load(fr)
+		if saved.get("version") != MODEL_VERSION:
+			return None
+		return cls(saved["coefficients"], saved["sigma"], saved["runs"])
+
+def default_model_path(configs):
+	return os.path.join(configs.Paths.output_path, "runtimeModel.json")
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		prog = 'RuntimeModel.py',
+		usage = "python3 %(prog)s [-m model_json] [-t number_of_tasks] [--config config_file (optional)]",
+		description='Fit the runtime model of the WGS pipeline on the completed runs of the output_path, used by launchRuns.py')
+	parser.add_argument('-m', '--model', help='Model file (default: {output_path}/runtimeModel.json)')
+	parser.add_argument('-t', '--tasks', type=int, default=10, help='Number of the longest tasks to print')
+	parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
+	args = parser.parse_args(argv)
+
+	configs = load_config(args.config)
+	model_path = args.model or default_model_path(configs)
+	previous = RuntimeModel.load(model_path)
+	known = {run["run_dir"]: run for run in previous.runs} if previous is not None else {}
+	runs = mine_runs(configs.Paths.output_path, known)
+	mined = reusable_runs(known)
+	new_runs = [run for run in runs if os.path.realpath(run["run_dir"]) not in mined]
+	print(f"{len(runs)} completed runs in {configs.Paths.output_path} ({len(new_runs)} new or mined again)")
+	try:
+		model = RuntimeModel.fit(runs)
+	except ValueError as e:
+		print(f"Cannot fit the runtime model: {e}")
+		sys.exit(1)
+	model.save(model_path)
+
+	coefficients = model.coefficients
+	print(f"hours = {coefficients['intercept']:.2f} + {coefficients['bam_gb']:.3f} * BAM GB + {coefficients['family_size']:.2f} * family size (residual sd {model.sigma:.2f}h)")
+	print(f"Longest tasks (runs, mean hours, max hours):")
+	for task, (count, mean, longest) in list(model.task_hours().items())[:args.tasks]:
+		print(f"\t{task}\t{count}\t{mean:.2f}\t{longest:.2f}")
+	print(f"Model written to {model_path}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,142 @@
+import os, sys
+import time
+import json
+import argparse
+from RunQueue import RunQueue, WDL_DIR
+from Backends import BACKENDS
+from RuntimeModel import RuntimeModel, samplesheet_features, default_model_path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from configLoader import load_config
+
+#Launch the WGS pipeline (miniwdl) for a list of families and singletons, with at most N runs at once
+#Each id is the name of a samplesheet of the configured sample_sheet_path (pXXX for pXXX.json), and its outputs go to {output_path}/{id}
+#The launcher follows the runs until they are all done, starting the queued ones as the others finish.
+#With --no-wait, it only starts what it can and exits: running it again (even without ids) starts the next ones.
+#When a runtime model was fitted (RuntimeModel.py), the longest runs start first and SLURM jobs request the estimated walltime.
+
+def analysis_option(configs, key, default):
+	#Optional "Analysis" section of the config. Sections and lists are returned as plain dicts and lists, not ConfigNodes
+	analysis = configs.get("Analysis", None)
+	value = default if analysis is None else analysis.get(key, default)
+	return getattr(value, "data", value)
+
+def read_run_ids(list_path):
+	"""
+	Read the run ids of a list file: one id per line, or batch files written by the samplesheet scripts
+	({run_id}_samples: name,samplesheet.json,bam lines; {family_id}.txt: family_id,samplesheet.json then member lines)
+	Returns: List of run ids
+	"""
+	run_ids = []
+	with open(list_path) as fr:
+		for line in fr:
+			fields = [field.strip() for field in line.strip().split(',')]
+			samplesheets = [field for field in fields if field.endswith(".json")]
+			if samplesheets:
+				run_ids.append(os.path.basename(samplesheets[0]).removesuffix(".json"))
+			elif len(fields) == 1 and fields[0] != "":
+				run_ids.append(fields[0].removesuffix(".json"))
+	return list(dict.fromkeys(run_ids))
+
+def estimate_runs(model, run_ids, sample_sheet_path, margin=2.0, minimum_hours=1, maximum_hours=168):
+	"""
+	Returns: Dict {run_id: {"estimate": hours, "walltime": minutes}} for the runs whose BAMs are found
+	"""
+	estimates = {}
+	for run_id in run_ids:
+		try:
+			with open(os.path.join(sample_sheet_path, f"{run_id}.json")) as fr:
+				features = samplesheet_features(json.load(fr))
+		except (OSError, ValueError) as e:
+			print(f"Cannot read the samplesheet of {run_id}, no runtime estimate: {e}")
+			continue
+		if features["bam_gb"] is None:
+			print(f"BAM not found for {run_id}, no runtime estimate")
+			continue
+		estimates[run_id] = {
+			"estimate": round(model.estimate(features["bam_gb"], features["family_size"]), 2),
+			"walltime": model.walltime(features["bam_gb"], features["family_size"], margin, minimum_hours, maximum_hours)}
+	return estimates
+
+def print_runs(runs):
+	now = time.time()
+	print(f"------{time.strftime('%Y-%m-%d %H:%M:%S')}------")
+	for run_id, run in runs.items():
+		duration = ""
+		if "started" in run:
+			duration = f"{(run.get('finished', now) - run['started']) / 3600:.1f}h"
+		job = f"{run['backend']} {run['job']}" if "job" in run else ""
+		detail = run.get("error", f"exit code {run['exit_code']}" if run.get("exit_code") is not None else "")
+		if not detail and "estimate" in run:
+			detail = f"estimated {run['estimate']:.1f}h"
+		print(f"{run_id}\t{run['status']}\t{run.get('workflow', '')}\t{job}\t{duration}\t{detail}")
+	sys.stdout.flush()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		prog = 'launchRuns.py',
+		usage = "python3 %(prog)s [-i run_id [run_id ...]] [-l list_file] [-n max_runs] [-b tmux|local|slurm] [--no-wait] [--retry] [--status] [--state state_json] [--model model_json] [--config config_file (optional)]",
+		description='Queue and launch miniwdl runs of families and singletons, with at most N runs at once')
+	parser.add_argument('-i', '--ids', nargs='+', default=[], help='Run ids (samplesheet names without .json)')
+	parser.add_argument('-l', '--list', help='File with one run id per line, or a batch file of singletonSampleSheet.py/jointCallSampleSheet.py')
+	parser.add_argument('-n', '--max-runs', type=int, help='Maximum number of runs at once (default: "max_runs" of the Analysis config section, or 4)')
+	parser.add_argument('-b', '--backend', choices=list(BACKENDS), help='How runs are started (default: "backend" of the Analysis config section, or tmux)')
+	parser.add_argument('--no-wait', action='store_true', help='Start what can be started and exit, instead of following the runs')
+	parser.add_argument('--retry', action='store_true', help='Queue again the given runs that failed or were lost')
+	parser.add_argument('--status', action='store_true', help='Only print the state of the runs')
+	parser.add_argument('--state', help='State file of the launcher (default: {output_path}/launchState.json)')
+	parser.add_argument('--model', help='Runtime model of RuntimeModel.py (default: {output_path}/runtimeModel.json, ignored if absent)')
+	parser.add_argument('--poll', type=int, default=60, help='Seconds between checks of the runs')
+	parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
+	args = parser.parse_args(argv)
+
+	configs = load_config(args.config)
+	for path in [configs.Paths.sample_sheet_path, configs.Paths.miniwdl_cfg]:
+		if not os.path.exists(path):
+			print(f"{path} not found, check the Paths of {args.config}")
+			sys.exit(1)
+	backend_options = {"slurm": analysis_option(configs, "slurm", {})}
+	backend_name = args.backend or analysis_option(configs, "backend", "tmux")
+	queue = RunQueue(
+		state_path			= args.state or os.path.join(configs.Paths.output_path, "launchState.json"),
+		backend				= BACKENDS[backend_name](**backend_options.get(backend_name, {})),
+		sample_sheet_path	= configs.Paths.sample_sheet_path,
+		output_path			= configs.Paths.output_path,
+		miniwdl_cfg			= configs.Paths.miniwdl_cfg,
+		max_running			= args.max_runs or analysis_option(configs, "max_runs", 4),
+		wdl_dir				= analysis_option(configs, "wdl_dir", WDL_DIR),
+		setup				= analysis_option(configs, "setup", "module load apptainer/1.3.5"),
+		backend_options		= backend_options)
+
+	if args.status:
+		print_runs(queue.refresh())
+		return
+
+	run_ids = list(args.ids)
+	if args.list is not None:
+		run_ids += read_run_ids(args.list)
+	missing = [run_id for run_id in run_ids if not os.path.isfile(os.path.join(configs.Paths.sample_sheet_path, f"{run_id}.json"))]
+	if missing:
+		print(f"SampleSheet not found in {configs.Paths.sample_sheet_path} for: {', '.join(missing)}")
+		sys.exit(1)
+	estimates = {}
+	model = RuntimeModel.load(args.model or default_model_path(configs))
+	if model is not None:
+		estimates = estimate_runs(model, run_ids, configs.Paths.sample_sheet_path,
+			margin			= analysis_option(configs, "walltime_margin", 2.0),
+			minimum_hours	= analysis_option(configs, "min_walltime_hours", 1),
+			maximum_hours	= analysis_option(configs, "max_walltime_hours", 168))
+	for run_id, status in queue.add(run_ids, retry=args.retry, estimates=estimates).items():
+		if status != "queued":
+			print(f"{run_id} is already {status}" + (" (use --retry to run it again)" if status in ("failed", "lost") else ""))
+
+	if args.no_wait:
+		queue.step()
+		runs = queue.runs()
+		print_runs({run_id: runs[run_id] for run_id in run_ids} if run_ids else runs)
+		return
+	runs = queue.wait(run_ids or None, poll_interval=args.poll, on_change=print_runs)
+	if any(run["status"] in ("failed", "lost") for run in runs.values()):
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -2,7 +2,7 @@
 
 #This is meant to be a second version of tmuxTrios.sh meant to accomodate duos and 
 #families containing a different amount of members. 
-#Still uses a samplesheet in format:
+#Kept for compatibility: launchRuns.py launches lists of families and singletons.
 
 set -euo pipefail
 #!/bin/bash
@@ -38,27 +38,7 @@ if [ ! -f "${config_file}" ]; then
 	exit 1
 fi
 
-generic_samplesheet_path=$(python3 -c "import json; print(json.load(open('${config_file}'))['Paths']['sample_sheet_path'])")
-if [ ! -f "${generic_samplesheet_path}/$id.json" ]; then
-	echo "SampleSheet path not found! Need json for $id in ${generic_samplesheet_path}"
-	exit 1
-fi
-sample_sheet_path="${generic_samplesheet_path}/$id.json"
-
-miniwdl_cfg_path=$(python3 -c "import json; print(json.load(open('${config_file}'))['Paths']['miniwdl_cfg'])")
-if [ ! -f "${miniwdl_cfg_path}" ]; then
-	echo "Miniwdl config file not found!"
-	exit 1
-fi
-
-output_dir=$(python3 -c "import json; print(json.load(open('${config_file}'))['Paths']['output_path'])")
-output="${output_dir}/$id"
-
-module load apptainer/1.3.5
-#First row contains info on family
-mkdir -p $output
-sed -i -e 's/"affected": "False"/"affected": false/g' $sample_sheet_path
-sed -i -e 's/"affected": "True"/"affected": true/g' $sample_sheet_path
-tmux new -d -s $id
-tmux send-keys -t $id "module load apptainer/1.3.5" Enter
-tmux send-keys -t $id "miniwdl run Analysis/HiFi-human-WGS-WDL/workflows/family.wdl -i ${sample_sheet_path} --cfg ${miniwdl_cfg_path} -v -d $output" Enter
\ No newline at end of file
+#Queue the run with the Python launcher (Analysis/launchRuns.py), which picks family.wdl or singleton.wdl from the samplesheet,
+#starts it in a detached tmux session named after the id (module load apptainer/1.3.5 first) unless too many runs are active,
+#and records it in {output_path}/launchState.json. Run "python3 Analysis/launchRuns.py -c config --no-wait" to start queued runs.
+exec python3 "$(dirname "$0")/launchRuns.py" -c "${config_file}" -b tmux -i "${id}" --no-wait
@@ -0,0 +1,115 @@
+import time
+import logging
+import threading
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+class HttpClient:
+	"""
+	Shared HTTP layer used by the Emedgene, Phenotips and GeneYX API wrappers.
+	Keeps one keep-alive session (connection pool) per host, applies timeouts,
+	retries with exponential backoff on 5xx, 429 and connection errors and records the latency of each request.
+	The optional "Http" section of the config can override the defaults:
+	{"connect_timeout": 10, "read_timeout": 120, "retries": 3, "backoff": 1.0, "pool_size": 16}
+	"""
+	_sessions	= {}
+	_lock		= threading.Lock()
+	#(method, host, path, status, seconds) for every request sent by this process
+	latencies	= []
+
+	def __init__(self, connect_timeout=10, read_timeout=120, retries=3, backoff=1.0, pool_size=16):
+		self.timeout	= (connect_timeout, read_timeout)
+		self.retries	= retries
+		self.backoff	= backoff
+		self.pool_size	= pool_size
+
+	@classmethod
+	def from_config(cls, configs):
+		"""
+		Build a client from the "Http" section of a loaded config, if it exists
+		"""
+		http_configs = configs.get("Http", None)
+		if http_configs is None:
+			return cls()
+		return cls(
+			connect_timeout	= http_configs.get("connect_timeout", 10),
+			read_timeout	= http_configs.get("read_timeout", 120),
+			retries			= http_configs.get("retries", 3),
+			backoff			= http_configs.get("backoff", 1.0),
+			pool_size		= http_configs.get("pool_size", 16))
+
+	def session(self, url):
+		"""
+		Returns the session for the host of `url`, created on first use and shared by all clients
+		"""
+		parts = urlsplit(url)
+		host = f"{parts.scheme}://{parts.netloc}"
+		with HttpClient._lock:
+			if host not in HttpClient._sessions:
+				session = requests.Session()
+				adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+				session.mount(host, adapter)
+				HttpClient._sessions[host] = session
+			return HttpClient._sessions[host]
+
+	def request(self, method, url, **kwargs):
+		"""
+		Sends the request, retrying on connection errors, timeouts, 5xx and 429 (rate limited) responses.
+		Waits backoff * 2^attempt seconds between attempts, or the Retry-After delay of a 429 response.
+		Returns: requests.Response (the last one received if every attempt returned 5xx or 429)
+		"""
+		kwargs.setdefault("timeout", self.timeout)
+		session = self.session(url)
+		parts = urlsplit(url)
+		for attempt in range(self.retries + 1):
+			start = time.monotonic()
+			try:
+				response = session.request(method, url, **kwargs)
+			except (requests.ConnectionError, requests.Timeout) as e:
+				self._record(method, parts, "error", time.monotonic() - start)
+				if attempt == self.retries:
+					raise
+				logging.warning(f"{method} {parts.netloc}{parts.path} failed ({e.__class__.__name__}), retrying")
+			else:
+				self._record(method, parts, response.status_code, time.monotonic() - start)
+				if (response.status_code < 500 and response.status_code != 429) or attempt == self.retries:
+					return response
+				logging.warning(f"{method} {parts.netloc}{parts.path} returned {response.status_code}, retrying")
+				retry_after = response.headers.get("Retry-After", "")
+				if response.status_code == 429 and retry_after.isdigit():
+					time.sleep(int(retry_after))
+					continue
+			time.sleep(self.backoff * 2 ** attempt)
+
+	def get(self, url, **kwargs):
+		return self.request("GET", url, **kwargs)
+
+	def post(self, url, **kwargs):
+		return self.request("POST", url, **kwargs)
+
+	def _record(self, method, parts, status, seconds):
+		logging.debug(f"{method} {parts.netloc}{parts.path} [{status}] {seconds:.3f}s")
+		with HttpClient._lock:
+			HttpClient.latencies.append((method, parts.netloc, parts.path, status, seconds))
+
+	@classmethod
+	def latency_summary(cls):
+		"""
+		Returns: Dict {host: {"requests": N, "total": seconds, "mean": seconds, "max": seconds}}
+		"""
+		summary = {}
+		with cls._lock:
+			for method, host, path, status, seconds in cls.latencies:
+				stats = summary.setdefault(host, {"requests": 0, "total": 0.0, "max": 0.0})
+				stats["requests"] += 1
+				stats["total"] += seconds
+				stats["max"] = max(stats["max"], seconds)
+		for stats in summary.values():
+			stats["mean"] = stats["total"] / stats["requests"]
+		return summary
+
+	@classmethod
+	def print_latency_summary(cls):
+		for host, stats in cls.latency_summary().items():
+			print(f"{host}: {stats['requests']} requests, {stats['total']:.1f}s total, {stats['mean']:.2f}s mean, {stats['max']:.2f}s max")
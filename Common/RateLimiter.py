@@ -0,0 +1,25 @@
+import time
+import threading
+
+class RateLimiter:
+	"""
+	Spaces out the calls made from several threads so that at most `rate` of them start per second.
+	A rate of 0 or None disables the limit.
+	"""
+	def __init__(self, rate):
+		self.interval	= 1.0 / rate if rate else 0.0
+		self._next		= 0.0
+		self._lock		= threading.Lock()
+
+	def wait(self):
+		"""
+		Block until the calling thread may send its request
+		"""
+		if not self.interval:
+			return
+		with self._lock:
+			now = time.monotonic()
+			slot = max(now, self._next)
+			self._next = slot + self.interval
+		if slot > now:
+			time.sleep(slot - now)
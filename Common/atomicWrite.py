@@ -0,0 +1,51 @@
+import os
+import json
+import stat
+import tempfile
+import threading
+
+"""
+Write files atomically: the content goes to a temporary file in the same directory,
+which then replaces the destination. Readers never see a partially written file.
+"""
+
+_umask_lock = threading.Lock()
+
+def current_umask():
+	#Read from /proc when possible: os.umask can only be read by changing it
+	try:
+		with open("/proc/self/status") as fr:
+			for line in fr:
+				if line.startswith("Umask:"):
+					return int(line.split()[1], 8)
+	except (OSError, ValueError):
+		pass
+	with _umask_lock:
+		umask = os.umask(0o022)
+		os.umask(umask)
+	return umask
+
+def file_mode(path):
+	"""
+	Returns: the permissions of the file being replaced, or those open() would give a new file (0666 minus the umask).
+	mkstemp creates its files readable by their owner only, which would otherwise be kept by the replace
+	"""
+	try:
+		return stat.S_IMODE(os.stat(path).st_mode)
+	except FileNotFoundError:
+		return 0o666 & ~current_umask()
+
+def write_text(path, text):
+	directory = os.path.dirname(os.path.abspath(path))
+	fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+	try:
+		os.fchmod(fd, file_mode(path))
+		with os.fdopen(fd, 'w') as fw:
+			fw.write(text)
+		os.replace(tmp_path, path)
+	except BaseException:
+		os.unlink(tmp_path)
+		raise
+
+def write_json(path, data, indent=4):
+	write_text(path, json.dumps(data, indent=indent))
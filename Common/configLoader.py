@@ -0,0 +1,21 @@
+import os
+import threading
+from configurator import Config
+
+"""
+The config is parsed once per process and shared by every object reading it
+(Sample, Family, Emedgene, GeneYX...), instead of calling Config.from_path each time.
+"""
+
+_configs	= {}
+_lock		= threading.Lock()
+
+def load_config(config_file=".myconf.json"):
+	"""
+	Returns: the Config of `config_file`, parsed on the first call for that file
+	"""
+	path = os.path.abspath(os.path.expanduser(config_file))
+	with _lock:
+		if path not in _configs:
+			_configs[path] = Config.from_path(path)
+		return _configs[path]
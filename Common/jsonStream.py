@@ -0,0 +1,71 @@
+import json
+import codecs
+
+"""
+Read the items of a JSON array from a response received in chunks, one item at a time,
+so that a large API response never has to be held in memory as a whole.
+"""
+
+def iter_array_items(chunks, key, envelope=None):
+	"""
+	Yields the items of the array under `key` (ie "Data" in {"Code": ..., "Data": [...]}) as they are received
+	- `chunks`: iterable of bytes or str (ie response.iter_content())
+	- `envelope`: optional dict, filled once the whole response is read with the other fields of the object (ie {"Code": ..., "Data": None})
+	Raises: ValueError if the array is not found or the response is truncated
+	"""
+	decoder = json.JSONDecoder()
+	utf8 = codecs.getincrementaldecoder("utf-8")()
+	chunks = iter(chunks)
+	text = ""
+
+	def more():
+		nonlocal text
+		for chunk in chunks:
+			text += utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+			return True
+		return False
+
+	#Find the start of the array
+	marker = json.dumps(key)
+	while True:
+		start = text.find(marker)
+		if start >= 0:
+			bracket = text.find("[", start + len(marker))
+			if bracket >= 0:
+				if text[start + len(marker):bracket].strip() != ":":
+					raise ValueError(f"{key} is not an array: {text[start:bracket + 1][:200]}")
+				before = text[:start]
+				text = text[bracket + 1:]
+				break
+		if not more():
+			raise ValueError(f"No {key} array in the response: {text[:200]}")
+
+	while True:
+		text = text.lstrip(" \t\r\n")
+		if text.startswith(","):
+			text = text[1:]
+			continue
+		if text.startswith("]"):
+			if envelope is not None:
+				#The rest of the object, usually a few fields, is read as a whole with the array replaced by null
+				text = text[1:]
+				while more():
+					pass
+				try:
+					envelope.update(json.loads(f"{before}{marker}: null{text}"))
+				except (json.JSONDecodeError, TypeError, ValueError) as e:
+					raise ValueError(f"Invalid response around the {key} array: {e}")
+			return
+		if not text:
+			if not more():
+				raise ValueError(f"Truncated response: the {key} array is not closed")
+			continue
+		try:
+			item, end = decoder.raw_decode(text)
+		except json.JSONDecodeError:
+			#Item not complete yet
+			if not more():
+				raise ValueError(f"Truncated response in the {key} array: {text[:200]}")
+			continue
+		yield item
+		text = text[end:]
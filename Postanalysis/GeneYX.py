@@ -1,11 +1,20 @@
-import requests
 import os,sys
+import time
 import logging
 import subprocess
 import json
-from configurator import Config
+from concurrent.futures import ThreadPoolExecutor
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from HttpClient import HttpClient
+from RateLimiter import RateLimiter
+from atomicWrite import write_json
+from jsonStream import iter_array_items
+from configLoader import load_config
 import subprocess
 
+#GeneYX group code: group name
+GROUPS = {"prag": "Pragmatiq", "decode": "Decodeur", "controle": "ControleParent", "validation": "Validation"}
+
 class GeneYX:
 	"""
 	Return object for interacting with GeneYX's API
@@ -15,10 +24,14 @@ class GeneYX:
 		Load settings from config_file, if provided. Define instance vars to
 		provide more readable access to settings in dict "configs".
 		"""
-		configs          = Config.from_path(config_file)
+		configs          = load_config(config_file)
 		self.geneyx_server   = configs.GeneYX.server
 		self.geneyx_id   = configs.GeneYX.apiUserId
 		self.geneyx_key   = configs.GeneYX.apiUserKey
+		self.http   = HttpClient.from_config(configs)
+		#Bulk calls (group assignments) are sent by `workers` threads, starting at most `rate` requests per second
+		self.workers   = configs.GeneYX.get("workers", 8)
+		self.rate_limiter   = RateLimiter(configs.GeneYX.get("rate", 10))
 		print("Sending to geneYX")
 
 	def verify_response(self, response):
@@ -26,86 +39,201 @@ class GeneYX:
 		Look for common API responses,
 		return tuple ([Success, Error],contents)
 		"""
-		
-		if "error" in response.json()["Code"] :
+		try:
+			contents = response.json()
+		except ValueError:
+			logging.warning(f"API call returned a non-JSON response: {response}")
+			return ("Error",response.text)
+		if not isinstance(contents, dict) or "error" in str(contents.get("Code", "error")):
 			logging.warning(f"API call returned error: {response}")
 			return ("Error",response.text)
 		else:
-			print("Success")
-			return ("Success", response.json())
+			return ("Success", contents)
 	
-	def group_assign(self, code, vcf_list):
+	def group_assign(self, code, vcf_list, summary_path=None):
 		"""
-		Assign a given sample list to a group on geneyx
+		Assign a given sample list to a group on geneyx.
+		Assignments are sent concurrently (see workers and rate in __init__) and a sample that fails
+		is reported in the summary without stopping the others.
 		'code': code of the group the samples should be assigned to ['prag','decode','controle' or 'validation']
 		'vcf_list': List of the vcfs that should have the given group assigned 
+		'summary_path': optional JSON file where the summary is written
+		Returns: Dict {"code", "group", "requested", "succeeded", "failed", "seconds", "results": [see assign_sample]}
 		"""
-		match code:
-			case "prag" : group = "Pragmatiq"
-			case "decode" : group = "Decodeur"
-			case "controle" : group = "ControleParent"
-			case "validation" : group = "Validation"
-			case _: 
-				logging.warning(f"Enter a valid GeneYX code: 'prag','decode','controle' or 'validation'")
-				sys.exit(1)
-		
-		errorList=[]
-
-		for name in vcf_list:
-			jsonDict={"SerialNumber":name,\
-			"GroupAssignment":[{"Code": code,"Name":group}],\
-			"ApiUserId":self.geneyx_id,\
-			"ApiUserKey":self.geneyx_key}
-		
-			with open('groupReassign.json', 'w') as fp:
-				jsonFile=json.dump(jsonDict,fp)
-
-			data=loadDataJson("groupReassign.json")
-			api=f"{self.geneyx_server}/api/SampleAssignment"
-			print(f"Sending Group assignment {group} for {name}")
-			r = requests.post(api, json=data)
-			verified = self.verify_response(r)
-			if verified[0] == "Success":
-				data = verified[1]
-				print(data)
-			else:
-				logging.warning(f"{name} could not be assigned to group {group}:")
-				print(verified)
-				sys.exit(1)
-
-		if len(errorList) == len(vcf_list):
+		if code not in GROUPS:
+			logging.warning(f"Enter a valid GeneYX code: 'prag','decode','controle' or 'validation'")
+			sys.exit(1)
+		group = GROUPS[code]
+		names = list(dict.fromkeys(vcf_list))
+
+		start = time.monotonic()
+		print(f"Sending Group assignment {group} for {len(names)} samples")
+		with ThreadPoolExecutor(max_workers=self.workers) as executor:
+			results = list(executor.map(lambda name: self.assign_sample(name, code, group), names))
+		errorList = [result["name"] for result in results if result["status"] != "Success"]
+
+		summary = {
+			"code": code,
+			"group": group,
+			"requested": len(names),
+			"succeeded": len(names) - len(errorList),
+			"failed": len(errorList),
+			"seconds": round(time.monotonic() - start, 3),
+			"results": results}
+		if summary_path is not None:
+			write_json(summary_path, summary)
+
+		if len(names) > 0 and len(errorList) == len(names):
 			print("All samples failed to be sent")
 		elif len(errorList) > 0:
 			print("Some samples could not be sent successfully:")
 			for sample_name in errorList: print(sample_name)
 		else:
 			print("All samples sent successfully")
+		return summary
+
+	def assign_sample(self, name, code, group):
+		"""
+		Send the group assignment of a single vcf. Transient errors are retried by the HTTP client.
+		Returns: Dict {"name", "status": "Success"|"Error", "response": API response or error message, "seconds"}
+		"""
+		jsonDict={"SerialNumber":name,\
+		"GroupAssignment":[{"Code": code,"Name":group}],\
+		"ApiUserId":self.geneyx_id,\
+		"ApiUserKey":self.geneyx_key}
+
+		self.rate_limiter.wait()
+		start = time.monotonic()
+		try:
+			r = self.http.post(f"{self.geneyx_server}/api/SampleAssignment", json=jsonDict)
+			status, contents = self.verify_response(r)
+		except Exception as e:
+			status, contents = "Error", f"{e.__class__.__name__}: {e}"
+		if status == "Success":
+			print(f"{name} assigned to group {group}")
+		else:
+			logging.warning(f"{name} could not be assigned to group {group}: {contents}")
+		return {"name": name, "status": status, "response": contents, "seconds": round(time.monotonic() - start, 3)}
 	
-	def unify_vcfs(sample_name,output_path,structure_variant_vcf,cnv_vcf,tandem_repeat_vcf):
-		print(output_path)
-		if not os.path.isfile(f"{output_path}/{sample_name}-unifiedVCF.vcf.gz"):
-			print(f"Unifying VCF for {sample_name}")
-			result = subprocess.run([
-				"python3",
-				"Postanalysis/geneyx.analysis.api_CHUSJ/scripts/UnifyVcf/PacBioUnifyVcf.py",
-				"-o", f"{output_path}/{sample_name}-unifiedVCF.vcf",
-				"-s", structure_variant_vcf,
-				"-c", cnv_vcf,
-				"-r", tandem_repeat_vcf,
-				"-b", "/home/felixant/scratch/MINIWDL/Ste-JustinePacbioWGS/Postanalysis/geneyx.analysis.api_CHUSJ/scripts/UnifyVcf/pathogenic_repeats.hg38.bed"], 
-				capture_output=True, text=True)
-
-			
-			if result.stderr=='':
-				print(result)
-				print(result.stdout)
-				print(f"Unify completed successfully for {sample_name}")
-			else:
-				print(logging.warning(f"Unify failed for {sample_name} with message: {result.stderr}"))
-				sys.exit(1)
-
-		else: print(f"Pre-existing unified VCF found for {sample_name}")
+	def stream_samples(self):
+		"""
+		Retrieve the list of all samples on GeneYX, with their group assignments.
+		The response is read as it arrives: samples are yielded one at a time.
+		Yields: the sample dicts returned by /api/Samples
+		"""
+		jsonDict={"ApiUserId":self.geneyx_id,"ApiUserKey":self.geneyx_key}
+		print("Requesting sample list from GeneYX")
+		r = self.http.post(f"{self.geneyx_server}/api/Samples", json=jsonDict, stream=True)
+		if r.status_code != 200:
+			logging.warning(f"Could not retrieve the sample list from GeneYX: {r.status_code} {r.text[:500]}")
+			sys.exit(1)
+		envelope = {}
+		try:
+			yield from iter_array_items(r.iter_content(chunk_size=1 << 16), "Data", envelope)
+		except ValueError as e:
+			logging.warning(f"Could not retrieve the sample list from GeneYX: {e}")
+			sys.exit(1)
+		finally:
+			r.close()
+		#Same check as verify_response, once the whole response is read: a sync consuming the samples is rolled back
+		if "error" in str(envelope.get("Code","error")):
+			logging.warning(f"Could not retrieve the sample list from GeneYX: {envelope}")
+			sys.exit(1)
+
+	def list_samples(self):
+		"""
+		Returns: List of the sample dicts returned by /api/Samples
+		"""
+		return list(self.stream_samples())
+
+	def group_sync(self, code, vcf_list, membership=None, summary_path=None):
+		"""
+		Assign the group only to the vcfs that are not in it yet (see plan_group_sync)
+		'membership': current groups of each vcf (see sample_groups), read from GeneYX if not given
+		Returns: Tuple (plan, group_assign summary)
+		"""
+		if membership is None:
+			membership = sample_groups(self.list_samples())
+		plan = plan_group_sync(code, vcf_list, membership)
+		return plan, self.group_assign(code, plan["assign"], summary_path=summary_path)
+
+
+def sample_field(sample, field):
+	"""
+	Returns: `field` of a sample record of the /api/Samples list
+	Raises: ValueError if the record does not have it (the API changed, or the list is not a GeneYX sample list)
+	"""
+	if not isinstance(sample, dict) or field not in sample:
+		keys = ", ".join(sample) if isinstance(sample, dict) else type(sample).__name__
+		raise ValueError(f"GeneYX sample record without {field} ({keys})")
+	return sample[field]
+
+def sample_serial(sample):
+	#Serial number (vcf name) of a sample of the /api/Samples list
+	serial = sample_field(sample, "SerialNumber")
+	if not serial:
+		raise ValueError(f"GeneYX sample record with an empty SerialNumber: {sample}")
+	return serial
+
+def sample_subject(sample):
+	#Subject (patient) of a sample of the /api/Samples list, "" if it has none
+	return sample_field(sample, "SubjectId") or ""
+
+def sample_group_codes(sample):
+	#Codes of the groups of a sample, as sent by assign_sample
+	codes = set()
+	for group in sample_field(sample, "GroupAssignment") or []:
+		codes.add(sample_field(group, "Code"))
+	return codes
+
+def sample_groups(samples):
+	"""
+	Current group membership of each vcf, from the /api/Samples list (or the allGeneYXSampleList.json written by getSampleListFromGeneYX.py).
+	A dict {vcf: [group codes]} is also accepted, as a local stand-in for GeneYX.
+	Returns: Dict {vcf serial number: set of group codes}
+	Raises: ValueError if a record lacks SerialNumber or GroupAssignment
+	"""
+	if isinstance(samples, dict):
+		return {serial: set(codes) for serial, codes in samples.items()}
+	membership = {}
+	for sample in samples:
+		serial = sample_serial(sample)
+		membership.setdefault(serial, set()).update(sample_group_codes(sample))
+	return membership
+
+def plan_group_sync(code, vcf_list, membership):
+	"""
+	Compare the wanted members of group `code` with the current membership.
+	Returns: Dict {
+		"assign": vcfs to send,
+		"unchanged": vcfs already in the group,
+		"unknown": vcfs not on GeneYX (not sent),
+		"extra": vcfs in the group but not in vcf_list (left as they are)}
+	"""
+	plan = {"assign": [], "unchanged": [], "unknown": [], "extra": []}
+	wanted = list(dict.fromkeys(vcf_list))
+	for serial in wanted:
+		if serial not in membership:
+			plan["unknown"].append(serial)
+		elif code in membership[serial]:
+			plan["unchanged"].append(serial)
+		else:
+			plan["assign"].append(serial)
+	wanted = set(wanted)
+	plan["extra"] = sorted(serial for serial, codes in membership.items() if code in codes and serial not in wanted)
+	return plan
 
+def print_sync_plan(code, plan):
+	print(f"------Group {GROUPS.get(code, code)}------")
+	print(f"To assign: {len(plan['assign'])}")
+	for serial in plan["assign"]: print(f"\t{serial}")
+	print(f"Already in the group: {len(plan['unchanged'])}")
+	if plan["unknown"]:
+		print(f"Not found on GeneYX (not sent): {len(plan['unknown'])}")
+		for serial in plan["unknown"]: print(f"\t{serial}")
+	if plan["extra"]:
+		print(f"In the group but not in the list (left unchanged): {len(plan['extra'])}")
+		for serial in plan["extra"]: print(f"\t{serial}")
 
 #Helper functions taken from GeneYX's github: https://github.com/geneyx/geneyx.analysis.api/tree/d8587302d22e0e5e59a328390f8c89dd04ff52e7/scripts
 def loadYamlFile(file):
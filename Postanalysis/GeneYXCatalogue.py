@@ -0,0 +1,161 @@
+import os,sys
+import json
+import time
+import sqlite3
+import hashlib
+from GeneYX import sample_serial, sample_subject, sample_group_codes
+from subjectMatching import normalize_subject
+
+"""
+Local copy of the GeneYX sample catalogue (/api/Samples), kept in SQLite and indexed on the vcf serial number, the subject
+and the normalized subject (see subjectMatching.py) used to match lists of names.
+It replaces the geneYXnamesList.csv exported by hand and the full allGeneYXSampleList.json dump:
+getSampleListFromGeneYX.py streams the catalogue into it, and assignListToGeneYXGroup.py reads from it.
+Each sample is stored with a hash of its record, so a sync only writes the samples that are new or changed,
+and removes the ones no longer on GeneYX.
+"""
+
+BATCH_SIZE = 1000
+#A sync removing more than this fraction of the catalogue (and more than MIN_REMOVED_REFUSED samples) is refused without force:
+#a truncated or malformed list from GeneYX must not wipe the catalogue
+MAX_REMOVED_FRACTION	= 0.1
+MIN_REMOVED_REFUSED		= 10
+
+class SyncRefused(ValueError):
+	pass
+
+class GeneYXCatalogue:
+	"""
+	SQLite GeneYX sample catalogue, one row per vcf serial number
+	"""
+	def __init__(self, path="geneyxCatalogue.db"):
+		self.path	= path
+		self._db	= sqlite3.connect(path, timeout=30)
+		with self._db:
+			self._db.execute("""CREATE TABLE IF NOT EXISTS samples (
+				serial TEXT PRIMARY KEY,
+				subject TEXT NOT NULL DEFAULT '',
+				subject_key TEXT NOT NULL DEFAULT '',
+				groups TEXT NOT NULL DEFAULT '[]',
+				hash TEXT NOT NULL,
+				synced INTEGER NOT NULL,
+				document TEXT NOT NULL)""")
+			#Catalogues created before the normalized subject was stored
+			if "subject_key" not in [column[1] for column in self._db.execute("PRAGMA table_info(samples)")]:
+				self._db.execute("ALTER TABLE samples ADD COLUMN subject_key TEXT NOT NULL DEFAULT ''")
+				self._db.executemany("UPDATE samples SET subject_key = ? WHERE serial = ?",
+					[(normalize_subject(subject), serial) for serial, subject in self._db.execute("SELECT serial, subject FROM samples").fetchall()])
+			self._db.execute("CREATE INDEX IF NOT EXISTS samples_subject ON samples (subject)")
+			self._db.execute("CREATE INDEX IF NOT EXISTS samples_subject_key ON samples (subject_key)")
+			self._db.execute("CREATE TABLE IF NOT EXISTS syncs (id INTEGER PRIMARY KEY, started REAL, finished REAL, counts TEXT)")
+
+	def sync(self, samples, force=False):
+		"""
+		Update the catalogue from a (streamed) iterable of /api/Samples records, in a single transaction:
+		an interrupted sync leaves the previous catalogue untouched.
+		- `force`: remove the samples missing from the list even if that empties most of the catalogue
+		Returns: Dict {"new", "changed", "unchanged", "removed"} sample counts
+		Raises: SyncRefused (and nothing is written) if no sample was received, or if more than MAX_REMOVED_FRACTION
+		of the catalogue would be removed, unless `force`
+		Raises: ValueError (and nothing is written) if a record lacks the fields of the GeneYX sample list
+		"""
+		counts = {"new": 0, "changed": 0, "unchanged": 0, "removed": 0}
+		started = time.time()
+		with self._db:
+			sync_id = self._db.execute("INSERT INTO syncs (started) VALUES (?)", (started,)).lastrowid
+			known = dict(self._db.execute("SELECT serial, hash FROM samples"))
+			upserts, touched = [], []
+			seen = 0
+			for sample in samples:
+				serial = sample_serial(sample)
+				seen += 1
+				document = json.dumps(sample, sort_keys=True)
+				digest = hashlib.sha1(document.encode()).hexdigest()
+				previous = known.get(serial)
+				if previous == digest:
+					counts["unchanged"] += 1
+					touched.append((sync_id, serial))
+				else:
+					counts["new" if previous is None else "changed"] += 1
+					subject = sample_subject(sample)
+					upserts.append((serial, subject, normalize_subject(subject), json.dumps(sorted(sample_group_codes(sample))), digest, sync_id, document))
+				known[serial] = digest
+				if len(upserts) + len(touched) >= BATCH_SIZE:
+					self._write(upserts, touched)
+					upserts, touched = [], []
+			self._write(upserts, touched)
+			existing = len(known) - counts["new"]
+			removed = self._db.execute("SELECT count(*) FROM samples WHERE synced != ?", (sync_id,)).fetchone()[0]
+			if not force and removed and (seen == 0 or removed > max(MIN_REMOVED_REFUSED, MAX_REMOVED_FRACTION * existing)):
+				raise SyncRefused(f"The GeneYX list would remove {removed} of the {existing} samples of the catalogue ({seen} samples received)")
+			counts["removed"] = self._db.execute("DELETE FROM samples WHERE synced != ?", (sync_id,)).rowcount
+			self._db.execute("UPDATE syncs SET finished = ?, counts = ? WHERE id = ?", (time.time(), json.dumps(counts), sync_id))
+		return counts
+
+	def _write(self, upserts, touched):
+		self._db.executemany("""INSERT INTO samples (serial, subject, subject_key, groups, hash, synced, document) VALUES (?, ?, ?, ?, ?, ?, ?)
+			ON CONFLICT (serial) DO UPDATE SET subject = excluded.subject, subject_key = excluded.subject_key, groups = excluded.groups,
+			hash = excluded.hash, synced = excluded.synced, document = excluded.document""", upserts)
+		self._db.executemany("UPDATE samples SET synced = ? WHERE serial = ?", touched)
+
+	def last_sync(self):
+		"""
+		Returns: time of the last complete sync (seconds since the epoch), or None if never synced
+		"""
+		row = self._db.execute("SELECT max(finished) FROM syncs").fetchone()
+		return row[0]
+
+	def subject_pairs(self):
+		"""
+		Returns: List of tuples (vcf serial number, subject), the same columns as the geneYXnamesList.csv export
+		"""
+		return self._db.execute("SELECT serial, subject FROM samples ORDER BY serial").fetchall()
+
+	def subject_table(self):
+		"""
+		Returns: DataFrame [ID, Subject, Key] of every vcf with its subject and normalized subject, for match_subjects
+		"""
+		import pandas as pd
+		return pd.DataFrame(self._db.execute("SELECT serial, subject, subject_key FROM samples ORDER BY serial").fetchall(),
+			columns=["ID", "Subject", "Key"], dtype=str)
+
+	def find_subject(self, subject):
+		"""
+		Returns: List of the vcf serial numbers of a subject
+		"""
+		return [row[0] for row in self._db.execute("SELECT serial FROM samples WHERE subject = ? ORDER BY serial", (subject,))]
+
+	def membership(self):
+		"""
+		Returns: Dict {vcf serial number: set of group codes}, as sample_groups in GeneYX.py
+		"""
+		return {serial: set(json.loads(groups)) for serial, groups in self._db.execute("SELECT serial, groups FROM samples")}
+
+	def record_assignments(self, serials, code):
+		"""
+		Add group `code` to the groups of vcfs just assigned on GeneYX, until the next sync brings the new records
+		"""
+		membership = self.membership()
+		with self._db:
+			self._db.executemany("UPDATE samples SET groups = ? WHERE serial = ?",
+				[(json.dumps(sorted(membership[serial] | {code})), serial) for serial in serials if serial in membership])
+
+	def export_json(self, json_path):
+		"""
+		Write the catalogue as a JSON list of the /api/Samples records (the former allGeneYXSampleList.json), one sample at a time
+		Returns: int, number of samples written
+		"""
+		written = 0
+		with open(json_path, 'w') as fw:
+			fw.write("[")
+			for (document,) in self._db.execute("SELECT document FROM samples ORDER BY serial"):
+				fw.write(("," if written else "") + document)
+				written += 1
+			fw.write("]")
+		return written
+
+	def __len__(self):
+		return self._db.execute("SELECT count(*) FROM samples").fetchone()[0]
+
+	def close(self):
+		self._db.close()
@@ -0,0 +1,122 @@
+import os,sys
+import json
+import threading
+
+"""
+Per-sample index of the outputs of a WGS pipeline run ({output_path}/_LAST/outputs.json).
+outputs.json is read once per process and every output is attached to its sample:
+- family runs: arrays aligned with the sample_ids output are attached by position,
+  other arrays by the sample name at the start of each file name (GM123.GRCh38... never matches GM1234)
+- singleton runs: every single output belongs to the sample
+File paths are resolved to their realpath once, when the index is built.
+"""
+
+#Output types used by the post-analysis: name of the output in the WDL (without the workflow prefix)
+OUTPUT_TYPES = {
+	"small_variant_vcf":	"phased_small_variant_vcf",
+	"sv_vcf":				"phased_sv_vcf",
+	"trgt_vcf":				"phased_trgt_vcf",
+	"cnv_vcf":				"cnv_vcf",
+	"bam":					"merged_haplotagged_bam",
+}
+
+def output_name(key):
+	#humanwgs_family.phased_sv_vcf -> phased_sv_vcf
+	return key.rsplit(".", 1)[-1]
+
+def file_sample(path, samples):
+	"""
+	Returns: the sample whose name is the first field of the file name (GM123.GRCh38.cnv.vcf.gz -> GM123), or None
+	"""
+	if not isinstance(path, str):
+		return None
+	name = os.path.basename(path).split(".", 1)[0]
+	return name if name in samples else None
+
+def resolve(value):
+	#Paths are resolved once, other values (QC stats...) are kept as they are
+	if isinstance(value, str) and os.path.isabs(value):
+		return os.path.realpath(value)
+	if isinstance(value, list):
+		return [resolve(item) for item in value]
+	return value
+
+class OutputsIndex:
+	"""
+	Outputs of one pipeline run, by sample and output name
+	"""
+	_loaded	= {}
+	_lock	= threading.Lock()
+
+	def __init__(self, outputs, sample_names=()):
+		"""
+		- `outputs`: Dict of the outputs.json
+		- `sample_names`: samples of the run, used if outputs.json has no sample_ids (ex.: singletons)
+		"""
+		self.sample_ids	= []
+		for key, value in outputs.items():
+			if output_name(key) in ("sample_ids", "sample_id"):
+				self.sample_ids = value if isinstance(value, list) else [value]
+		if not self.sample_ids:
+			self.sample_ids = list(sample_names)
+		self.samples	= {sample: {} for sample in self.sample_ids}
+		#Outputs not specific to a sample (joint calls, family reports...)
+		self.shared		= {}
+		singleton = len(self.sample_ids) == 1
+
+		for key, value in outputs.items():
+			name = output_name(key)
+			value = resolve(value)
+			if singleton:
+				self.samples[self.sample_ids[0]][name] = value
+			elif isinstance(value, list) and len(value) == len(self.sample_ids) and \
+				all(file_sample(item, self.samples) in (None, sample) for sample, item in zip(self.sample_ids, value)):
+				for sample, item in zip(self.sample_ids, value):
+					self.samples[sample][name] = item
+			elif isinstance(value, list):
+				for item in value:
+					sample = file_sample(item, self.samples)
+					if sample is None:
+						self.shared.setdefault(name, []).append(item)
+					else:
+						self.samples[sample].setdefault(name, item)
+			else:
+				sample = file_sample(value, self.samples)
+				if sample is None:
+					self.shared[name] = value
+				else:
+					self.samples[sample][name] = value
+
+	@classmethod
+	def load(cls, output_path, sample_names=()):
+		"""
+		Returns: the index of {output_path}/_LAST/outputs.json, built on the first call for that run
+		Raises: FileNotFoundError if the run has no outputs.json
+		"""
+		path = os.path.realpath(f"{output_path}/_LAST/outputs.json")
+		with cls._lock:
+			if path not in cls._loaded:
+				with open(path) as fr:
+					cls._loaded[path] = cls(json.load(fr), sample_names)
+			return cls._loaded[path]
+
+	def outputs(self, sample):
+		"""
+		Returns: Dict {output name: path or value} of a sample
+		Raises: LookupError if the sample is not part of the run
+		"""
+		if sample not in self.samples:
+			raise LookupError(f"{sample} is not part of this run (samples: {', '.join(self.sample_ids)})")
+		return self.samples[sample]
+
+	def get(self, sample, output_type):
+		"""
+		- `output_type`: key of OUTPUT_TYPES (ie sv_vcf) or name of any output of the WDL
+		Returns: the output of the sample (realpath for files)
+		Raises: LookupError if the sample has no such output
+		"""
+		name = OUTPUT_TYPES.get(output_type, output_type)
+		sample_outputs = self.outputs(sample)
+		if name not in sample_outputs:
+			raise LookupError(f"No {name} output for {sample}")
+		return sample_outputs[name]
@@ -0,0 +1,303 @@
+import os,sys
+import zlib
+import gzip
+import heapq
+import struct
+import bisect
+import argparse
+
+"""
+Native unifier of the SV, CNV and tandem repeat (TRGT) VCFs of a sample into the single VCF sent to GeneYX.
+The inputs are read record by record and merged by contig and position with a heap, in a single pass:
+the TRGT records outside of the pathogenic repeats bed are dropped on the way, and the merged records are
+written directly as BGZF with their tabix index. Memory does not depend on the size of the VCFs.
+Takes the same arguments as PacBioUnifyVcf.py, so it can be used by unifyVcfs.py ("unify_script" in the config, or --native):
+python3 Postanalysis/StreamingUnifyVcf.py -o {sample}-unifiedVCF.vcf -s sv.vcf.gz -c cnv.vcf.gz -r trgt.vcf.gz -b pathogenic_repeats.hg38.bed
+writes {sample}-unifiedVCF.vcf.gz and {sample}-unifiedVCF.vcf.gz.tbi
+"""
+
+#Uncompressed size of a BGZF block, as written by htslib
+BGZF_BLOCK_SIZE	= 0xff00
+BGZF_EOF		= bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+#Tabix: 16kb linear index windows, and the bin holding the statistics of each contig
+LINEAR_SHIFT	= 14
+META_BIN		= 37450
+
+class BgzfWriter:
+	"""
+	Writes a BGZF file (blocked gzip, readable by gzip and htslib) and gives the virtual offset of each write
+	"""
+	def __init__(self, path, level=6):
+		self._file		= open(path, 'wb')
+		self._buffer	= bytearray()
+		self._address	= 0
+		self.level		= level
+
+	def tell(self):
+		"""
+		Returns: the virtual offset (block address << 16 | offset in the block) of the next byte written
+		"""
+		return (self._address << 16) | len(self._buffer)
+
+	def write(self, data):
+		self._buffer += data
+		while len(self._buffer) >= BGZF_BLOCK_SIZE:
+			self._write_block(bytes(self._buffer[:BGZF_BLOCK_SIZE]))
+			del self._buffer[:BGZF_BLOCK_SIZE]
+
+	def _write_block(self, data):
+		compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+		compressed = compressor.compress(data) + compressor.flush()
+		block_size = 18 + len(compressed) + 8
+		self._file.write(struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2, block_size - 1))
+		self._file.write(compressed)
+		self._file.write(struct.pack("<II", zlib.crc32(data), len(data)))
+		self._address += block_size
+
+	def close(self):
+		if self._buffer:
+			self._write_block(bytes(self._buffer))
+			self._buffer.clear()
+		self._file.write(BGZF_EOF)
+		self._file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+def reg2bin(beg, end):
+	"""
+	Returns: the smallest tabix/BAI bin containing the 0-based interval [beg, end)
+	"""
+	end -= 1
+	if beg >> 14 == end >> 14: return ((1 << 15) - 1) // 7 + (beg >> 14)
+	if beg >> 17 == end >> 17: return ((1 << 12) - 1) // 7 + (beg >> 17)
+	if beg >> 20 == end >> 20: return ((1 << 9) - 1) // 7 + (beg >> 20)
+	if beg >> 23 == end >> 23: return ((1 << 6) - 1) // 7 + (beg >> 23)
+	if beg >> 26 == end >> 26: return ((1 << 3) - 1) // 7 + (beg >> 26)
+	return 0
+
+class TabixIndexer:
+	"""
+	Builds the tabix index (.tbi) of a sorted VCF as its records are written
+	"""
+	def __init__(self):
+		self.names		= []
+		self.references	= []
+
+	def add(self, contig, beg, end, start_offset, end_offset):
+		"""
+		Index a record covering the 0-based interval [beg, end), written between two virtual offsets
+		"""
+		if not self.names or self.names[-1] != contig:
+			if contig in self.names:
+				raise ValueError(f"Records of {contig} are not contiguous, the VCF can't be indexed")
+			self.names.append(contig)
+			self.references.append({"bins": {}, "linear": [], "first": start_offset, "last": end_offset, "records": 0})
+		reference = self.references[-1]
+		end = max(end, beg + 1)
+
+		chunks = reference["bins"].setdefault(reg2bin(beg, end), [])
+		if chunks and chunks[-1][1] == start_offset:
+			chunks[-1][1] = end_offset
+		else:
+			chunks.append([start_offset, end_offset])
+
+		linear = reference["linear"]
+		last_window = (end - 1) >> LINEAR_SHIFT
+		if len(linear) <= last_window:
+			linear.extend([None] * (last_window + 1 - len(linear)))
+		for window in range(beg >> LINEAR_SHIFT, last_window + 1):
+			if linear[window] is None:
+				linear[window] = start_offset
+		reference["last"] = end_offset
+		reference["records"] += 1
+
+	def write(self, path):
+		names = b"".join(name.encode() + b"\0" for name in self.names)
+		#VCF preset: sequence in column 1, position in column 2, end computed from REF/END, '#' comments
+		data = bytearray(b"TBI\1")
+		data += struct.pack("<8i", len(self.names), 2, 1, 2, 0, ord("#"), 0, len(names))
+		data += names
+		for reference in self.references:
+			data += struct.pack("<i", len(reference["bins"]) + 1)
+			for bin_number, chunks in sorted(reference["bins"].items()):
+				data += struct.pack("<Ii", bin_number, len(chunks))
+				for chunk in chunks:
+					data += struct.pack("<QQ", *chunk)
+			data += struct.pack("<IiQQQQ", META_BIN, 2, reference["first"], reference["last"], reference["records"], 0)
+			#Windows without records point to the previous window (or the first record of the contig)
+			linear = []
+			previous = reference["first"]
+			for offset in reference["linear"]:
+				previous = offset if offset is not None else previous
+				linear.append(previous)
+			data += struct.pack(f"<i{len(linear)}Q", len(linear), *linear)
+		with BgzfWriter(path) as fw:
+			fw.write(bytes(data))
+
+def open_vcf(path):
+	if path.endswith(".gz") or path.endswith(".bgz"):
+		return gzip.open(path, 'rt')
+	return open(path)
+
+def read_bed(path):
+	"""
+	Returns: Dict {contig: (starts, ends)} of the merged, sorted 0-based intervals of a bed file
+	"""
+	intervals = {}
+	with open_vcf(path) as fr:
+		for line in fr:
+			if not line.strip() or line.startswith(("#", "track", "browser")):
+				continue
+			fields = line.split("\t")
+			intervals.setdefault(fields[0], []).append((int(fields[1]), int(fields[2])))
+	regions = {}
+	for contig, contig_intervals in intervals.items():
+		starts, ends = [], []
+		for start, end in sorted(contig_intervals):
+			if ends and start <= ends[-1]:
+				ends[-1] = max(ends[-1], end)
+			else:
+				starts.append(start)
+				ends.append(end)
+		regions[contig] = (starts, ends)
+	return regions
+
+def overlaps(regions, contig, beg, end):
+	if contig not in regions:
+		return False
+	starts, ends = regions[contig]
+	index = bisect.bisect_right(ends, beg)
+	return index < len(starts) and starts[index] < end
+
+def record_span(fields):
+	"""
+	Returns: the 0-based interval [beg, end) covered by a VCF record (POS and REF, or the INFO END if further)
+	"""
+	beg = int(fields[1]) - 1
+	end = beg + len(fields[3])
+	info = fields[7]
+	if "END=" in info:
+		for entry in info.split(";"):
+			if entry.startswith("END="):
+				try:
+					end = max(end, int(entry[4:]))
+				except ValueError:
+					pass
+				break
+	return beg, end
+
+def read_header(handle):
+	"""
+	Returns: tuple (list of the ## lines, #CHROM line)
+	"""
+	meta = []
+	for line in handle:
+		if line.startswith("##"):
+			meta.append(line.rstrip("\n"))
+		elif line.startswith("#"):
+			return meta, line.rstrip("\n")
+		else:
+			break
+	raise ValueError(f"{handle.name} has no #CHROM header line")
+
+def header_key(line):
+	#Structured lines (INFO, FORMAT, FILTER, ALT, contig) are identified by their ID, the others by their text
+	if line.startswith("##") and "=<" in line and "ID=" in line:
+		kind = line[2:line.index("=<")]
+		record_id = line.split("ID=", 1)[1].split(",", 1)[0].split(">", 1)[0]
+		return (kind, record_id)
+	return line
+
+def merge_headers(headers):
+	"""
+	Merge the headers of the inputs: fileformat and #CHROM line of the first input, then every other line once
+	Returns: tuple (header lines, contig names in header order)
+	"""
+	lines = {}
+	for meta, _ in headers:
+		for line in meta:
+			if not line.startswith("##fileformat="):
+				lines.setdefault(header_key(line), line)
+	fileformat = next((line for meta, _ in headers for line in meta if line.startswith("##fileformat=")), "##fileformat=VCFv4.2")
+	contigs = [key[1] for key in lines if isinstance(key, tuple) and key[0] == "contig"]
+	return [fileformat] + list(lines.values()) + [headers[0][1]], contigs
+
+def records(handle, path, source, input_index, contig_rank, regions, counts):
+	"""
+	Yields the records of an input as sortable tuples (contig rank, position, input index, order, contig, beg, end, line),
+	dropping those outside of `regions` if given. Records at the same position keep the order of the inputs.
+	"""
+	previous = None
+	for order, line in enumerate(handle):
+		if not line.strip():
+			continue
+		fields = line.split("\t", 8)
+		contig = fields[0]
+		rank = contig_rank.setdefault(contig, len(contig_rank))
+		position = int(fields[1])
+		if previous is not None and (rank, position) < previous:
+			raise ValueError(f"{path} is not sorted: {contig}:{position} comes after a later record")
+		previous = (rank, position)
+		beg, end = record_span(fields)
+		counts[source]["read"] += 1
+		if regions is not None and not overlaps(regions, contig, beg, end):
+			counts[source]["filtered"] += 1
+			continue
+		if not line.endswith("\n"):
+			line += "\n"
+		yield (rank, position, input_index, order, contig, beg, end, line)
+
+def unify(output, inputs, bed_path=None, filtered_sources=("trgt",)):
+	"""
+	Merge sorted VCFs into the BGZF VCF `output` and write its tabix index (output + ".tbi")
+	- `inputs`: List of tuples (source name, VCF path), the first one gives the #CHROM line
+	- `bed_path`: regions kept for the records of the sources in `filtered_sources`
+	Returns: Dict {source: {"read": N, "filtered": N}}
+	"""
+	regions = read_bed(bed_path) if bed_path else None
+	handles = [open_vcf(path) for _, path in inputs]
+	try:
+		headers = [read_header(handle) for handle in handles]
+		header, contigs = merge_headers(headers)
+		contig_rank = {contig: rank for rank, contig in enumerate(contigs)}
+		counts = {source: {"read": 0, "filtered": 0} for source, _ in inputs}
+		streams = [records(handle, path, source, index, contig_rank, regions if source in filtered_sources else None, counts)
+			for index, (handle, (source, path)) in enumerate(zip(handles, inputs))]
+
+		indexer = TabixIndexer()
+		with BgzfWriter(output) as fw:
+			fw.write(("\n".join(header) + "\n").encode())
+			for _, _, _, _, contig, beg, end, line in heapq.merge(*streams):
+				start_offset = fw.tell()
+				fw.write(line.encode())
+				indexer.add(contig, beg, end, start_offset, fw.tell())
+		indexer.write(output + ".tbi")
+		return counts
+	finally:
+		for handle in handles:
+			handle.close()
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		prog = 'StreamingUnifyVcf.py',
+		usage = "python3 %(prog)s -o output.vcf -s sv_vcf -c cnv_vcf -r trgt_vcf [-b repeats_bed]",
+		description='Merge the SV, CNV and tandem repeat VCFs of a sample into a single bgzipped and indexed VCF (output.vcf.gz)')
+	parser.add_argument('-o', '--output', required=True, help='Output VCF, written as {output}.gz with its .tbi index')
+	parser.add_argument('-s', '--sv', required=True, help='Structural variant VCF')
+	parser.add_argument('-c', '--cnv', required=True, help='Copy number variant VCF')
+	parser.add_argument('-r', '--repeats', required=True, help='Tandem repeat (TRGT) VCF')
+	parser.add_argument('-b', '--bed', help='Only keep the tandem repeats overlapping these regions')
+	args = parser.parse_args(argv)
+
+	output = args.output if args.output.endswith(".gz") else args.output + ".gz"
+	counts = unify(output, [("sv", args.sv), ("cnv", args.cnv), ("trgt", args.repeats)], args.bed)
+	for source, count in counts.items():
+		print(f"{source}: {count['read']} records read, {count['filtered']} filtered out")
+	print(f"Wrote {output} and {output}.tbi")
+
+if __name__ == "__main__":
+	main()
@@ -1,29 +1,81 @@
-import os
+import os,sys
+import json
 import argparse
-from GeneYX import GeneYX
-import pandas as pd
+from GeneYX import GeneYX, GROUPS, sample_groups, plan_group_sync, print_sync_plan
+from GeneYXCatalogue import GeneYXCatalogue
+from subjectMatching import match_subjects, match_report, print_match_report
 #We have separate groups to which each sample must be assigned
 #This script will assign a given list of samples to a group, if they are part of the full GeneYX list
+#(the local catalogue synced by getSampleListFromGeneYX.py, or a csv export given with -f)
+#Names are matched on the normalized subject (case, _redo/_new suffixes), see subjectMatching.py
+#With --sync, only the samples not already in the group are sent
 
-if __name__ == "__main__":
+def main(argv=None):
 	parser = argparse.ArgumentParser(
 		prog = 'assignListToGeneYXGroup.py',
-		usage = "python3 %(prog)s [-l list_of_names_to_assign] [-f csv_export_of_geneYX_vcf_full_list] [-g group to assign (validation, prag, decode, controle)] [--config config_file (optional)]",	
+		usage = "python3 %(prog)s [-l list_of_names_to_assign] [-f csv_export_of_geneYX_vcf_full_list | -d catalogue_db] [-g group to assign (validation, prag, decode, controle)] [-s summary_json (optional)] [-m match_report_csv (optional)] [--include-ambiguous] [--sync [--dry-run] [--membership sample_list_json]] [--config config_file (optional)]",	
 		description='Assigns a group to a list of sample on GeneYX.')
 	parser.add_argument('-l', '--list',help='list of samples to be assigned, separated by newlines',required=True) 
-	parser.add_argument('-f', '--full', nargs='?',help='Up to date csv export of all VCFs on GeneYX',const='Postanalysis/geneYXnamesList.csv', default='Postanalysis/geneYXnamesList.csv')
-	parser.add_argument('-g', '--group',help='The group to which the samples should be assigned to',required=True)
+	parser.add_argument('-f', '--full', nargs='?',help='Up to date csv export of all VCFs on GeneYX, instead of the local catalogue',const='Postanalysis/geneYXnamesList.csv')
+	parser.add_argument('-d', '--catalogue', nargs='?',help='Local GeneYX catalogue synced by getSampleListFromGeneYX.py',const='geneyxCatalogue.db', default='geneyxCatalogue.db')
+	parser.add_argument('-g', '--group',help='The group to which the samples should be assigned to',required=True,choices=list(GROUPS))
+	parser.add_argument('-s', '--summary', nargs='?',help='JSON file receiving the result of each assignment',const='groupAssignSummary.json', default='groupAssignSummary.json')
+	parser.add_argument('-m', '--match-report', nargs='?',help='CSV file receiving the matched, ambiguous and unmatched names',const='subjectMatchReport.csv', default='subjectMatchReport.csv')
+	parser.add_argument('--include-ambiguous', action='store_true', help='Also assign the ambiguous vcfs (other subjects sharing the normalized name)')
+	parser.add_argument('--sync', action='store_true', help='Read the current groups first and only send the samples not already in the group')
+	parser.add_argument('--dry-run', action='store_true', help='With --sync, only print the changes')
+	parser.add_argument('--membership', help='With --sync, read the current groups from this JSON (allGeneYXSampleList.json or {vcf: [codes]}) instead of the catalogue or GeneYX')
 	parser.add_argument('--config', nargs='?', const='.myconf.json', default='.myconf.json')
 	#parser.print_help()
-	args = parser.parse_args()
+	args = parser.parse_args(argv)
+	if (args.dry_run or args.membership) and not args.sync:
+		parser.error("--dry-run and --membership require --sync")
+	import pandas as pd
 	
-	latest_geneyx_list = pd.read_csv(args.full,names=["ID","Subject"])
-	given_group_list = pd.read_csv(args.list,names=["Subject"])
+	catalogue = None
+	if args.full is not None:
+		latest_geneyx_list = pd.read_csv(args.full,names=["ID","Subject"],dtype=str).fillna("")
+	elif os.path.isfile(args.catalogue):
+		catalogue = GeneYXCatalogue(args.catalogue)
+		latest_geneyx_list = catalogue.subject_table()
+	else:
+		print(f"GeneYX catalogue {args.catalogue} not found: sync it with getSampleListFromGeneYX.py, or give a csv export with -f")
+		sys.exit(1)
+	given_group_list = pd.read_csv(args.list,names=["Subject"],dtype=str,skip_blank_lines=True)
 
-	#Obtain the vcf names from the geneYX list using the subject name as Key
-	merged_df = latest_geneyx_list.merge(given_group_list,how='inner',on=["Subject"],indicator=True)[["ID","Subject"]]
-	merged_df.drop_duplicates(inplace=True)
-	merged_list = merged_df.loc[:,'ID'].values
+	#Obtain the vcf names from the geneYX list using the normalized subject name as Key
+	match = match_subjects(given_group_list["Subject"].dropna(), latest_geneyx_list)
+	print_match_report(match)
+	match_report(match).to_csv(args.match_report, index=False)
+	merged_df = match["matched"]
+	if args.include_ambiguous:
+		merged_df = pd.concat([merged_df, match["ambiguous"]])
+	merged_list = merged_df["ID"].drop_duplicates().tolist()
+	if len(merged_list) == 0:
+		print(f"No vcf to assign, see {args.match_report}")
+		sys.exit(1)
 
+	if args.sync:
+		membership = None
+		if args.membership is not None:
+			with open(args.membership) as fr:
+				membership = sample_groups(json.load(fr))
+		elif catalogue is not None:
+			membership = catalogue.membership()
+		if args.dry_run:
+			if membership is None:
+				membership = sample_groups(GeneYX(args.config).list_samples())
+			print_sync_plan(args.group, plan_group_sync(args.group, merged_list, membership))
+			return
+		plan, summary = GeneYX(args.config).group_sync(args.group, merged_list, membership=membership, summary_path=args.summary)
+		print_sync_plan(args.group, plan)
+	else:
+		summary = GeneYX(args.config).group_assign(args.group,merged_list,summary_path=args.summary)
+	if catalogue is not None:
+		catalogue.record_assignments([result["name"] for result in summary["results"] if result["status"] == "Success"], args.group)
+	print(f"{summary['succeeded']}/{summary['requested']} samples assigned in {summary['seconds']}s, see {args.summary}")
+	if summary["failed"] > 0:
+		sys.exit(1)
 
-	GeneYX(args.config).group_assign(args.group,merged_list)
\ No newline at end of file
+if __name__ == "__main__":
+	main()
@@ -1,52 +1,39 @@
 import os, sys
-import yaml,json
-import requests
+import logging
+import argparse
+from GeneYX import GeneYX
+from GeneYXCatalogue import GeneYXCatalogue, SyncRefused
 
 #API call to retrieve the list of all samples from GeneYX
-def loadYamlFile(file):
-    with open(file, 'r') as stream:
-        try:
-            obj = yaml.safe_load(stream)
-            return obj
-        except yaml.YAMLError as exc:
-            print(exc)
-
-
-def loadDataJson(file):
-    with open(file, 'r') as stream:
-        try:
-            data = json.load(stream)            
-            return data
-        except KeyError as exc:
-            print(exc)
-
+#The list is streamed into the local catalogue (geneyxCatalogue.db by default), which assignListToGeneYXGroup.py reads from.
+#Only the samples that are new or changed since the last sync are written.
+#A list that would remove most of the catalogue (or an empty list) is refused unless --force is given.
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		prog = 'getSampleListFromGeneYX.py',
+		usage = "python3 %(prog)s [-d catalogue_db] [--json allGeneYXSampleList.json (optional)] [--force] [--config config_file (optional)]",
+		description='Sync the local catalogue of the samples on GeneYX')
+	parser.add_argument('-d', '--catalogue', nargs='?', const='geneyxCatalogue.db', default='geneyxCatalogue.db', help='Local GeneYX catalogue (SQLite)')
+	parser.add_argument('--json', help='Also export the whole catalogue to this JSON file (former allGeneYXSampleList.json)')
+	parser.add_argument('--force', action='store_true', help='Remove the samples missing from the GeneYX list even if most of the catalogue goes')
+	parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
+	args = parser.parse_args(argv)
+
+	catalogue = GeneYXCatalogue(args.catalogue)
+	try:
+		counts = catalogue.sync(GeneYX(args.config).stream_samples(), force=args.force)
+	except SyncRefused as e:
+		logging.warning(f"{e}: catalogue left unchanged, use --force if these samples were really removed from GeneYX")
+		sys.exit(1)
+	except ValueError as e:
+		logging.warning(f"Unexpected GeneYX sample list, catalogue left unchanged: {e}")
+		sys.exit(1)
+	print("Success")
+	print(f"{len(catalogue)} samples in {args.catalogue}: {counts['new']} new, {counts['changed']} changed, {counts['unchanged']} unchanged, {counts['removed']} removed")
+	if args.json is not None:
+		written = catalogue.export_json(args.json)
+		print(f"Exported {written} samples to {args.json}")
 
 if __name__ == "__main__":
-
-	config=loadYamlFile("/home/felixant/scratch/MINIWDL/GeneYX/geneyx.analysis.api/scripts/ga.config.yml")
-
-	jsonDict={"ApiUserId":config['apiUserId'],"ApiUserKey":config['apiUserKey']}
-
-	with open('config.json', 'w') as fp:
-		jsonFile=json.dump(jsonDict,fp)
-
-	data=loadDataJson("config.json")
-	api='https://analysis.geneyx.com/api/Samples'
-	print("Requesting sample list from GeneYX")
-	r = requests.post(api, json=data)
-
-
-	code = r.text
-	print(code)
-
-	if "error" in code :
-		print("Error")
-	else:
-		print("Success")
-		samples = r.json()["Data"]
-		print(len(samples))
-		with open('allGeneYXSampleList.json', 'w') as fr:
-			sampleFile=json.dump(samples,fr)
-
-
-	
+	main()
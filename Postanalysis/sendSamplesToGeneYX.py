@@ -1,44 +1,29 @@
 import os, sys, json
 import argparse
-from configurator import Config
-from GeneYX import GeneYX
 import logging
-
-#from geneyx_analysis_api_CHUSJ.scripts.UnifyVcf.UnifyVcf import run
-sys.path.append(sys.path[0]+'/geneyx.analysis.api_CHUSJ/scripts/UnifyVcf')
-import PacBioUnifyVcf
-
-#Small function to help search our output JSON
-def find_keys_containing(my_dict, substring, name):
-	keylist = [key for key in my_dict if substring in key]
-	if len(keylist) == 0:
-		logging.warning(f"Outputs not found in outputs.json for {name}")
-		sys.exit()
-	if "family" in keylist[0]:
-		for file in my_dict[keylist[0]]:
-			if name in file:
-				return file
-	elif "singleton" in keylist[0]:
-		return my_dict[keylist[0]]
-	else:
-		logging.warning(f"Error in outputs.json for {name}: {keylist}")
-		sys.exit()
-	#return [file for file in my_dict[keylist[0]] if name in file]
+from OutputsIndex import OutputsIndex
+from unifyVcfs import unifier_paths, unify_samples, print_summary
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from configLoader import load_config
 
 #Send a group of samples to GeneYX, including sending analysis cases, qc data and assigning the appropriate group
-if __name__ == "__main__":
+def main(argv=None):
 	parser = argparse.ArgumentParser(
 		prog = 'sendSamplesToGeneYX.py',
-		usage = "python3 %(prog)s [-r list of the samplesheet containing the sample runs] [-g Optionally, group to assign (validation, prag, decode, controle)] [--config config_file (optional)]",	
+		usage = "python3 %(prog)s [-r list of the samplesheet containing the sample runs] [-g Optionally, group to assign (validation, prag, decode, controle)] [-j jobs] [--native] [--hash] [--force] [--config config_file (optional)]",	
 		description='Send a group of samples to GeneYX including case analysis and QC data.')
 	parser.add_argument('-r', '--run',help='Run id containing the list of sample name and path to the samplesheet, or direct link to the samplesheet',required=True) 
 	parser.add_argument('-s', '--singleton',action='store_true',help='Use this option to specify the sample is a singleton. Use either this or -f')
 	parser.add_argument('-f', '--family',action='store_true',help='Use this option to specify the sample is a family. Use either this or -s')
 	parser.add_argument('-g', '--group',help='The group to which the samples should be assigned to', default='')
+	parser.add_argument('--native', action='store_true', help='Unify with the streaming unifier of this repository (StreamingUnifyVcf.py) instead of PacBioUnifyVcf.py')
+	parser.add_argument('--hash', action='store_true', help='Also compare the checksums of the input VCFs to decide if a unified VCF is up to date (slower)')
+	parser.add_argument('--force', action='store_true', help='Unify every sample again, even if its unified VCF is up to date')
+	parser.add_argument('-j', '--jobs', type=int, help='Number of samples unified in parallel (default: all available cores)')
 	parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
-	args = parser.parse_args()
+	args = parser.parse_args(argv)
 
-	configs  	= Config.from_path(args.config)
+	configs  	= load_config(args.config)
 	sample_sheet_path	= configs.Paths.sample_sheet_path
 	sample_list_name	= args.run
 	sample_list = []
@@ -124,31 +109,40 @@ if __name__ == "__main__":
 			print(f"Output file not found for in path: {output_path}")
 			sys.exit()
 
+		unify_script, unify_bed = unifier_paths(configs, native=args.native)
+		jobs = []
+		missing = []
 		for sample in sample_list:
 			output_path = sample["output"]
 			sample_name = sample["sample_name"]
-			#This file should contain the path to all outputs
-			if os.path.exists(f"{output_path}/_LAST/outputs.json"):
-				print("opening outputs file")
-				with open(f"{output_path}/_LAST/outputs.json") as outputs_file:
-					outputs_json = json.load(outputs_file)
-				#The full key name depends on if the sample is part of a family or singleton
-					small_variant_vcf = os.path.realpath(find_keys_containing(outputs_json,"phased_small_variant_vcf",sample_name))
-					structure_variant_vcf = os.path.realpath(find_keys_containing(outputs_json,"phased_sv_vcf",sample_name))
-					tandem_repeat_vcf = os.path.realpath(find_keys_containing(outputs_json,"phased_trgt_vcf",sample_name))
-					cnv_vcf = os.path.realpath(find_keys_containing(outputs_json,"cnv_vcf",sample_name))
-			
-			
-			GeneYX.unify_vcfs(sample_name,output_path,structure_variant_vcf,cnv_vcf,tandem_repeat_vcf)
-
-
-
-
-	
-
-
-			
-
-
-
+			#This file should contain the path to all outputs, indexed once per run
+			try:
+				run_samples = [run_sample["sample_name"] for run_sample in sample_list if run_sample["output"] == output_path]
+				outputs = OutputsIndex.load(output_path, sample_names=run_samples)
+				small_variant_vcf = outputs.get(sample_name, "small_variant_vcf")
+				structure_variant_vcf = outputs.get(sample_name, "sv_vcf")
+				tandem_repeat_vcf = outputs.get(sample_name, "trgt_vcf")
+				cnv_vcf = outputs.get(sample_name, "cnv_vcf")
+			except (OSError, ValueError, LookupError) as e:
+				logging.warning(f"Outputs not found in {output_path}/_LAST/outputs.json for {sample_name}: {e}")
+				missing.append(sample_name)
+				continue
+			jobs.append({
+				"sample_name": sample_name,
+				"output_path": output_path,
+				"sv_vcf": structure_variant_vcf,
+				"cnv_vcf": cnv_vcf,
+				"trgt_vcf": tandem_repeat_vcf,
+				"script": unify_script,
+				"bed": unify_bed,
+				"hash": args.hash,
+				"force": args.force})
+
+	print(f"Unifying VCFs for {len(jobs)} samples")
+	results = unify_samples(jobs, args.jobs)
+	print_summary(results)
+	if missing or any(result["status"] == "Error" for result in results):
+		sys.exit(1)
 
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,79 @@
+import re
+
+"""
+Match a list of subject names with the subjects of the GeneYX catalogue.
+Names are compared on a normalized key: upper case, without surrounding spaces and without the
+_redo/_new suffixes added when a sample is sequenced again (GM123_redo, gm123 and GM123 share the key GM123).
+A subject can have several vcfs on GeneYX: all of them are matched.
+When the key of a name corresponds to several different subjects on GeneYX (GM123 and GM123_new), the vcfs of the subject
+that is exactly the given name are matched and the others are ambiguous; without such a subject, all of them are ambiguous.
+Every vcf sharing the key of a name is returned, either matched or ambiguous.
+"""
+
+#Suffixes removed from the subject names, ex.: _redo, _new, -redo2
+SUBJECT_SUFFIX = r"(?:[_-](?:REDO|NEW)\d*)+$"
+
+def normalize_subject(name):
+	"""
+	Returns: the matching key of a subject name (GM123_redo -> GM123)
+	"""
+	return re.sub(SUBJECT_SUFFIX, "", str(name).strip().upper())
+
+def normalize_subjects(names):
+	"""
+	Vectorized normalize_subject for a pandas Series
+	"""
+	return names.astype(str).str.strip().str.upper().str.replace(SUBJECT_SUFFIX, "", regex=True)
+
+def match_subjects(names, catalogue):
+	"""
+	- `names`: list of subject names to find
+	- `catalogue`: DataFrame with the columns ID (vcf) and Subject, and optionally Key (normalized Subject)
+	Returns: Dict {
+		"matched": DataFrame [Name, Subject, ID], one row per vcf,
+		"unmatched": list of names without any subject,
+		"ambiguous": DataFrame [Name, Subject, ID] of the vcfs of the other subjects sharing the key of a name (not in "matched")}
+	"""
+	import pandas as pd
+	given = pd.DataFrame({"Name": pd.Series(names, dtype=str).str.strip()})
+	given = given[given["Name"] != ""].drop_duplicates()
+	given["Key"] = normalize_subjects(given["Name"])
+	catalogue = catalogue[["ID", "Subject"] + (["Key"] if "Key" in catalogue else [])].drop_duplicates(subset=["ID", "Subject"])
+	if "Key" not in catalogue:
+		catalogue = catalogue.assign(Key=normalize_subjects(catalogue["Subject"]))
+
+	merged = given.merge(catalogue, how="left", on="Key")
+	unmatched = merged.loc[merged["ID"].isna(), "Name"].tolist()
+	merged = merged[merged["ID"].notna()]
+
+	#An exact (case insensitive) subject match wins over the other subjects sharing its key, which become ambiguous
+	exact = merged["Subject"].str.strip().str.upper() == merged["Name"].str.upper()
+	has_exact = exact.groupby(merged["Name"]).transform("any")
+	subjects_per_name = merged.groupby("Name")["Subject"].transform("nunique")
+	is_matched = (subjects_per_name == 1) | (exact & has_exact)
+	columns = ["Name", "Subject", "ID"]
+	return {
+		"matched": merged.loc[is_matched, columns].reset_index(drop=True),
+		"unmatched": unmatched,
+		"ambiguous": merged.loc[~is_matched, columns].reset_index(drop=True)}
+
+def match_report(match):
+	"""
+	Returns: DataFrame [Name, Status, Subject, ID] with one row per matched vcf, ambiguous vcf and unmatched name
+	"""
+	import pandas as pd
+	return pd.concat([
+		match["matched"].assign(Status="matched"),
+		match["ambiguous"].assign(Status="ambiguous"),
+		pd.DataFrame({"Name": match["unmatched"], "Status": "unmatched", "Subject": "", "ID": ""})],
+		ignore_index=True)[["Name", "Status", "Subject", "ID"]]
+
+def print_match_report(match):
+	print(f"Matched: {match['matched']['Name'].nunique()} names, {len(match['matched'])} vcfs")
+	if len(match["ambiguous"]) > 0:
+		print(f"Ambiguous (several subjects on GeneYX): {match['ambiguous']['Name'].nunique()} names")
+		for name, rows in match["ambiguous"].groupby("Name"):
+			print(f"\t{name}: {', '.join(sorted(rows['Subject'].unique()))}")
+	if match["unmatched"]:
+		print(f"Not found on GeneYX: {len(match['unmatched'])} names")
+		for name in match["unmatched"]: print(f"\t{name}")
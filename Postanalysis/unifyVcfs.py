@@ -0,0 +1,251 @@
+import os,sys
+import ast
+import json
+import time
+import runpy
+import hashlib
+import importlib.util
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from atomicWrite import write_json
+
+"""
+Unification of the SV, CNV and tandem repeat VCFs of each sample into the single VCF sent to GeneYX.
+Samples are unified in parallel across a process pool, and each worker runs GeneYX's PacBioUnifyVcf.py in-process.
+A unifier defining main() is loaded once per worker and its main() called for each sample,
+other scripts are run again for each sample (their imports are still only loaded once per worker).
+The script and the pathogenic repeats bed can be set in the Paths section of the config
+("unify_script" and "unify_bed"), by default the ones of the geneyx.analysis.api_CHUSJ submodule.
+Each unified VCF has a manifest ({sample}-unifiedVCF.vcf.gz.manifest.json) fingerprinting the input VCFs, the bed
+and the unifier script (realpath, size, mtime and optionally sha256). The VCF is only rebuilt when they change,
+and is written under a temporary name first, so a crashed run never leaves a trusted partial output.
+"""
+
+MANIFEST_SUFFIX = ".manifest.json"
+
+UNIFY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geneyx.analysis.api_CHUSJ", "scripts", "UnifyVcf")
+#Streaming unifier of this repository, taking the same arguments as PacBioUnifyVcf.py (see StreamingUnifyVcf.py)
+NATIVE_UNIFIER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "StreamingUnifyVcf.py")
+
+def unifier_paths(configs, native=False):
+	"""
+	- `native`: use StreamingUnifyVcf.py instead of the configured unifier script
+	Returns: tuple (path to the unifier script, PacBioUnifyVcf.py by default, path to the pathogenic repeats bed)
+	"""
+	paths = configs.get("Paths", {})
+	script = NATIVE_UNIFIER if native else paths.get("unify_script", os.path.join(UNIFY_DIR, "PacBioUnifyVcf.py"))
+	bed = paths.get("unify_bed", os.path.join(UNIFY_DIR, "pathogenic_repeats.hg38.bed"))
+	return os.path.expanduser(script), os.path.expanduser(bed)
+
+def unified_vcf_path(output_path, sample_name):
+	return f"{output_path}/{sample_name}-unifiedVCF.vcf.gz"
+
+#Unifier scripts loaded in this process: {script path: module, or None if the script has no main()}
+_unifiers = {}
+
+def load_unifier(script):
+	"""
+	Returns: the unifier script loaded as a module (once per process), or None if it does not define main()
+	"""
+	script = os.path.abspath(script)
+	if script not in _unifiers:
+		with open(script) as fr:
+			tree = ast.parse(fr.read(), script)
+		module = None
+		#Only scripts whose work is in main() can be imported without running them
+		if any(isinstance(node, ast.FunctionDef) and node.name == "main" for node in tree.body):
+			spec = importlib.util.spec_from_file_location(f"unifier_{hashlib.sha1(script.encode()).hexdigest()[:12]}", script)
+			module = importlib.util.module_from_spec(spec)
+			spec.loader.exec_module(module)
+		_unifiers[script] = module
+	return _unifiers[script]
+
+def run_unifier(script, argv):
+	"""
+	Run the unifier script in this process as if it was called with `argv`
+	Raises: RuntimeError if the script exits with a non-zero code
+	"""
+	script_dir = os.path.dirname(os.path.abspath(script))
+	if script_dir not in sys.path:
+		sys.path.insert(0, script_dir)
+	saved_argv = sys.argv
+	sys.argv = [script] + argv
+	try:
+		module = load_unifier(script)
+		if module is not None:
+			module.main()
+		else:
+			runpy.run_path(script, run_name="__main__")
+	except SystemExit as e:
+		if e.code not in (None, 0):
+			raise RuntimeError(f"{os.path.basename(script)} exited with {e.code}")
+	finally:
+		sys.argv = saved_argv
+
+def file_fingerprint(path, with_hash=False):
+	"""
+	Returns: Dict {"path": realpath, "size", "mtime_ns"} (and "sha256" if `with_hash`), or None if the file is missing
+	"""
+	realpath = os.path.realpath(path)
+	try:
+		stat = os.stat(realpath)
+	except OSError:
+		return None
+	fingerprint = {"path": realpath, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+	if with_hash:
+		digest = hashlib.sha256()
+		with open(realpath, 'rb') as fr:
+			for chunk in iter(lambda: fr.read(1 << 20), b""):
+				digest.update(chunk)
+		fingerprint["sha256"] = digest.hexdigest()
+	return fingerprint
+
+def job_fingerprint(job):
+	"""
+	Fingerprint of everything the unified VCF of `job` depends on.
+	The unifier script is always hashed (it is small), the inputs only if job["hash"] is set.
+	"""
+	with_hash = job.get("hash", False)
+	return {
+		"inputs": {key: file_fingerprint(job[key], with_hash) for key in ["sv_vcf", "cnv_vcf", "trgt_vcf", "bed"]},
+		"unifier": file_fingerprint(job["script"], with_hash=True)}
+
+def read_manifest(output):
+	try:
+		with open(output + MANIFEST_SUFFIX) as fr:
+			return json.load(fr)
+	except (OSError, ValueError):
+		return None
+
+def same_file(previous, current):
+	"""
+	Compare two fingerprints: by checksum when both have one (a moved or touched copy is the same file),
+	otherwise by realpath, size and mtime
+	"""
+	if previous is None or current is None:
+		return False
+	if "sha256" in previous and "sha256" in current:
+		return previous["sha256"] == current["sha256"] and previous["size"] == current["size"]
+	return all(previous.get(key) == current[key] for key in ["path", "size", "mtime_ns"])
+
+def stale_reason(output, fingerprint):
+	"""
+	Returns: Why the unified VCF `output` must be (re)built, or None if it is up to date
+	"""
+	if not os.path.isfile(output):
+		return "No unified VCF"
+	manifest = read_manifest(output)
+	if manifest is None:
+		return "No manifest for the existing unified VCF"
+	if manifest.get("output_size") != os.path.getsize(output):
+		return "Unified VCF differs from its manifest"
+	previous = manifest.get("fingerprint", {})
+	if not same_file(previous.get("unifier"), fingerprint["unifier"]):
+		return "Unifier changed"
+	changed = [key for key, value in fingerprint["inputs"].items() if not same_file(previous.get("inputs", {}).get(key), value)]
+	if changed:
+		return f"Inputs changed: {', '.join(changed)}"
+	return None
+
+def unify_sample(job):
+	"""
+	Unify the VCFs of one sample, unless its unified VCF is up to date with its inputs (see stale_reason)
+	- `job`: Dict {"sample_name", "output_path", "sv_vcf", "cnv_vcf", "trgt_vcf", "script", "bed", "hash" (optional), "force" (optional)}
+	Returns: Dict {"sample_name", "status": "Success"|"Skipped"|"Error", "output", "size", "seconds", "message"}
+	"""
+	start = time.monotonic()
+	output = unified_vcf_path(job["output_path"], job["sample_name"])
+	result = {"sample_name": job["sample_name"], "status": "Success", "output": output, "size": 0, "seconds": 0.0, "message": ""}
+	try:
+		fingerprint = job_fingerprint(job)
+		missing = [key for key, value in fingerprint["inputs"].items() if value is None]
+		if missing or fingerprint["unifier"] is None:
+			raise FileNotFoundError(f"Missing {', '.join(missing) or 'unifier script'}")
+		reason = "Forced" if job.get("force", False) else stale_reason(output, fingerprint)
+		if reason is None:
+			result["status"] = "Skipped"
+			result["message"] = "Unified VCF up to date"
+		else:
+			result["message"] = reason
+			build_unified_vcf(job, output)
+			write_json(output + MANIFEST_SUFFIX, {
+				"sample_name": job["sample_name"],
+				"output_size": os.path.getsize(output),
+				"fingerprint": fingerprint})
+	except Exception as e:
+		result["status"] = "Error"
+		result["message"] = f"{e.__class__.__name__}: {e}"
+	if os.path.isfile(output):
+		result["size"] = os.path.getsize(output)
+	result["seconds"] = round(time.monotonic() - start, 3)
+	return result
+
+def build_unified_vcf(job, output):
+	"""
+	Run the unifier on a temporary output in the same folder, then move the VCF (and its index, if any) into place
+	"""
+	tmp_vcf = os.path.join(os.path.dirname(output), f".{job['sample_name']}-unifiedVCF.{os.getpid()}.tmp.vcf")
+	tmp_outputs = [tmp_vcf, tmp_vcf + ".gz", tmp_vcf + ".gz.tbi"]
+	try:
+		run_unifier(job["script"], [
+			"-o", tmp_vcf,
+			"-s", job["sv_vcf"],
+			"-c", job["cnv_vcf"],
+			"-r", job["trgt_vcf"],
+			"-b", job["bed"]])
+		if not os.path.isfile(tmp_vcf + ".gz"):
+			raise RuntimeError(f"{os.path.basename(job['script'])} did not write {tmp_vcf}.gz")
+		#The manifest of the previous VCF must not vouch for the new one if we crash in between
+		if os.path.exists(output + MANIFEST_SUFFIX):
+			os.unlink(output + MANIFEST_SUFFIX)
+		if os.path.isfile(tmp_vcf + ".gz.tbi"):
+			os.replace(tmp_vcf + ".gz.tbi", output + ".tbi")
+		os.replace(tmp_vcf + ".gz", output)
+	finally:
+		for path in tmp_outputs:
+			if os.path.exists(path):
+				os.unlink(path)
+
+def default_jobs():
+	#Cores available to this process (respects the allocation of a SLURM job)
+	try:
+		return len(os.sched_getaffinity(0))
+	except AttributeError:
+		return os.cpu_count() or 1
+
+def unify_samples(jobs, workers=None):
+	"""
+	Unify every job of `jobs` (see unify_sample) across `workers` processes, all available cores by default.
+	A sample that fails does not stop the others.
+	Returns: List of the results, in the order of `jobs`
+	"""
+	workers = min(workers or default_jobs(), max(len(jobs), 1))
+	results = {}
+	with ProcessPoolExecutor(max_workers=workers) as executor:
+		futures = {executor.submit(unify_sample, job): index for index, job in enumerate(jobs)}
+		for future in as_completed(futures):
+			index = futures[future]
+			try:
+				result = future.result()
+			except Exception as e:
+				#The worker process itself died
+				result = {"sample_name": jobs[index]["sample_name"], "status": "Error", "output": "", "size": 0, "seconds": 0.0, "message": f"{e.__class__.__name__}: {e}"}
+			print_result(result)
+			results[index] = result
+	return [results[index] for index in range(len(jobs))]
+
+def print_result(result):
+	if result["status"] == "Error":
+		logging.warning(f"Unify failed for {result['sample_name']} with message: {result['message']}")
+	elif result["status"] == "Skipped":
+		print(f"Up to date unified VCF found for {result['sample_name']}")
+	else:
+		print(f"Unify completed successfully for {result['sample_name']} in {result['seconds']:.1f}s ({result['size'] / 1e6:.1f} MB, {result['message']})")
+
+def print_summary(results):
+	print("------Unification------")
+	for result in results:
+		print(f"{result['sample_name']}\t{result['status']}\t{result['seconds']:.1f}s\t{result['size']} bytes\t{result['message']}")
+	failed = [result for result in results if result["status"] == "Error"]
+	print(f"{len(results) - len(failed)}/{len(results)} samples unified")
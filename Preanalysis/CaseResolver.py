@@ -0,0 +1,166 @@
+import sys,os
+import logging
+import json
+import threading
+from concurrent.futures import Future
+
+"""
+Family-aware resolution of the Emedgene/Phenotips status of samples.
+All members of an Emedgene case (proband, mother, father) share the same case JSON,
+so it is fetched and parsed once for all of them. The case of each sample is still given by get_emg_id
+(cached by the RecordCache): a parent in the cases of several children gets the latest one, whatever the order of the samples.
+The status of a sample is only extracted from the case when that sample is resolved.
+"""
+
+#Used when a sample is not found on Emedgene: likely a validation case, always singleton
+VALIDATION_STATUS = {"Status": "Singleton", "Role":"proband", "Gender":"null", "Affected": True}
+
+class CaseResolver:
+	"""
+	Resolves (case_status, phenotypes) for sample names, sharing Emedgene case fetches between family members.
+	Thread-safe: concurrent requests for the same EMG case wait on a single fetch.
+	"""
+	def __init__(self, emedgene):
+		self.emedgene	= emedgene
+		self._lock		= threading.Lock()
+		self._cases		= {} #EMG id -> Future of the resolved case
+
+	def resolve(self, name):
+		"""
+		Returns: tuple (case_status dict, phenotypes str), see find_status for the case_status format
+		"""
+		emg_case_id = self.emedgene.get_emg_id(name)
+
+		if emg_case_id == "":
+			return dict(VALIDATION_STATUS), ""
+		if not isinstance(emg_case_id, str):
+			logging.warning(f"Could not obtain the Emedgene case of {name}: got {emg_case_id}")
+			sys.exit(1)
+
+		case = self.resolve_case(emg_case_id)
+		with case["lock"]:
+			#If not listed as a fastq_sample of the case, this logs the problem and writes the error file
+			if name not in case["statuses"]:
+				case["statuses"][name] = find_status(case["json"], name)
+			case_status = dict(case["statuses"][name])
+
+		if case_status["Affected"]:
+			phenotypes = self.case_phenotypes(case)
+		else:
+			phenotypes = ""
+		return case_status, phenotypes
+
+	def resolve_case(self, emg_case_id):
+		"""
+		Fetch and parse the case JSON once, even if several threads ask for it at the same time
+		Returns: Dict {"json": case json, "statuses": {sample name: case_status} of the samples resolved so far, ...}
+		"""
+		with self._lock:
+			future = self._cases.get(emg_case_id)
+			owner = future is None
+			if owner:
+				future = Future()
+				self._cases[emg_case_id] = future
+		if owner:
+			try:
+				case = self.fetch_case(emg_case_id)
+			except BaseException as e:
+				future.set_exception(e)
+				raise
+			future.set_result(case)
+		return future.result()
+
+	def fetch_case(self, emg_case_id):
+		case_json = self.emedgene.get_case_json(emg_case_id)
+		if not isinstance(case_json, dict):
+			logging.warning(f"Could not obtain the Emedgene case {emg_case_id}: got {case_json}")
+			sys.exit(1)
+		return {"id": emg_case_id, "json": case_json, "statuses": {}, "lock": threading.Lock(), "phenotypes": None}
+
+	def case_phenotypes(self, case):
+		"""
+		The Phenotips HPO terms of the case, fetched the first time an affected member needs them
+		"""
+		with case["lock"]:
+			if case["phenotypes"] is None:
+				#TODO: Make class for Phenotips
+				pheno_case_id = self.emedgene.get_pheno_id(json_file=case["json"])
+				case["phenotypes"] = self.emedgene.phenotips_import_HPO_request(pheno_case_id)
+			return case["phenotypes"]
+
+
+def find_status(json_file, name):
+	"""
+	Obtain the status [Singleton, Duo, Trio] of sample `name` in an Emedgene case.
+	Also returns the role of the sample [Proband, father, mother], gender and affected status
+	Returns: Dict ({Status: [Singleton, Duo, Trio, Unknown],Role: [Proband, father, mother,"Unknown"], Gender: [Male,Female, null], Affected: [True, False,None]})
+	"""
+	if "patients" in json_file.keys():
+		family_members = json_file["patients"]
+		number_in_case = len(family_members)
+		match number_in_case:
+			case 1: status = "Singleton"
+			case 2: status = "Duo"
+			case 3: status = "Trio"
+			case 4: 
+				if "other" in family_members.keys() and len(family_members["other"]) == 0:
+					status = "Trio"
+				else:
+					status = "Unknown"
+
+			case _: status = "Unknown"
+		
+		role = "Unknown"
+		gender = "null"
+		affected = None
+
+		for member in family_members.keys():
+			if member == "other":
+				continue
+			if (type(family_members[member]) is dict) and ("fastq_sample" in family_members[member]):
+				if member == "proband":
+					proband_name = family_members[member]["fastq_sample"]
+				if family_members[member]["fastq_sample"] == name:
+					if role == "Unknown":
+						role = member
+						gender = family_members[member]["gender"]
+
+						if len(family_members[member]["phenotypes"]) > 0:
+							pheno_list = family_members[member]["phenotypes"][0]
+						else:
+							pheno_list = {"name": "Healthy"}
+
+						#We take a look at the phenotypes to know if parent is affected
+						#The actual phenotype list will be obtained from Phenotips (more up to date)
+						if "name" in pheno_list.keys() and pheno_list["name"] == "Healthy":
+							affected = False
+						else:
+							affected = True
+					else:
+						logging.warning(f"{name} was assigned roles more than once, check proper trio")
+			else:
+				logging.warning(f"The format of sample {name} does not correspond to expected format. See {name}_error.json")
+				with open(f"{name}_error.json",'w') as fw:
+					json.dump(json_file, fw, indent=4)
+				sys.exit(1)
+
+		if (role == "father" and gender == "Female") or (role == "mother" and gender == "Male"):
+			logging.warning(f"Error, got role {role} and gender {gender} for patient {name}")
+		if role == "Unknown" or gender =="null" or status == "Unknown":
+			logging.warning(f"Patient status, role or gender could not be extracted from JSON file for patient {name}")
+			print(f"Please see file {name}_error.json for more info")
+			with open(f"{name}_error.json",'w') as fp:
+				json.dump(json_file,fp,indent=4)
+
+		if role == "father" or role == "mother":
+			role += f" of {proband_name}"
+			if affected:
+				logging.warning(f"Be aware: Parent is affected")
+
+		return {"Status": status, "Role": role, "Gender": gender, "Affected": affected}
+	else:
+		logging.warning(f"Patient {name} Emedgene JSON does not seem to contain patient info.")
+		print(f"Please see file {name}_error.json for more info")
+		with open(f"{name}_error.json",'w') as fp:
+			json.dump(json_file,fp,indent=4)
+		return {"Status": "Unknown", "Role":"Unknown", "Gender":"null","Affected": None}
@@ -1,19 +1,24 @@
-import requests
 import os,sys
 import logging
 import json
-from configurator import Config
+from TokenCache import TokenCache
+from RecordCache import RecordCache
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from HttpClient import HttpClient
+from configLoader import load_config
 
 class Emedgene:
     """
     Return object for interacting with Emedgene's API
     """
-    def __init__(self, config_file=os.path.expanduser(".myconf.json")):
+    def __init__(self, config_file=os.path.expanduser(".myconf.json"), refresh=False, offline=False):
         """
         Load settings from config_file, if provided. Define instance vars to
         provide more readable access to settings in dict "configs".
+        - `refresh`: ignore the local record cache and fetch everything again
+        - `offline`: only serve case and patient records from the local cache
         """
-        configs          = Config.from_path(config_file)
+        configs          = load_config(config_file)
         self.username    = configs.Emedgene.username
         self.password    = configs.Emedgene.password
         self.prag_server = configs.Emedgene.endpoint
@@ -21,20 +26,33 @@ class Emedgene:
         self.pheno_auth  = configs.Phenotips.auth
         self.pheno_secret= configs.Phenotips.secret
         self.pheno_url   = configs.Phenotips.endpoint
+        self.http        = HttpClient.from_config(configs)
 
+        #The token is shared between calls (and processes, if a token_cache file is configured)
+        self.token_cache = TokenCache(f"{self.prag_server}|{self.username}",
+                                      path=configs.Emedgene.get("token_cache", ""))
+        #Case JSON and Phenotips records are kept on disk so reruns don't fetch them again
+        self.cache       = RecordCache.from_config(configs, refresh=refresh, offline=offline)
 
-    def authenticate(self):
+
+    def authenticate(self, force=False):
         """
-        Returns an authorization token.
+        Returns an authorization token, reusing the cached one when it is still valid.
         N.B. The Authorization header expires after 8H, after that, requests
-        will return an error code 403. To resolve, re-do the Login procedure to
-        get a new token.
+        will return an error code 403. The cache refreshes the token before that.
+        - `force`: ignore the cached token and re-do the Login procedure
+        """
+        return self.token_cache.get_or_fetch(self.login, force=force)
+
+    def login(self):
+        """
+        Does the Login procedure and returns a new authorization token.
         """
         # TODO: Add different domain servers
         url      = f"{self.prag_server}/api/auth/api_login/"
         payload  = f'{{"username": "{self.username}", "password": "{self.password}"}}'
         headers  = {'Content-Type': 'application/json'}
-        response = requests.request("POST", url, headers=headers, data=payload).json()
+        response = self.http.post(url, headers=headers, data=payload).json()
         if "Authorization" in response.keys():
             return response["Authorization"]
         else:
@@ -42,15 +60,34 @@ class Emedgene:
             print(response)
             sys.exit(1)
 
+    def authorized_get(self, url):
+        """
+        GET request with the Emedgene authorization header.
+        If the token is refused (401/403), it is re-acquired and the request is retried once.
+        """
+        resp = self.http.get(url, headers={'Authorization': self.authenticate()})
+        if resp.status_code == 401 or resp.status_code == 403:
+            logging.warning(f"Emedgene token refused ({resp.status_code}), authenticating again")
+            self.token_cache.invalidate()
+            resp = self.http.get(url, headers={'Authorization': self.authenticate(force=True)})
+        return resp
+
     def get_emg_id(self, sample):
         """
         Returns EMG identifier for Sample
         - `sample`: Sample Names (ex.: GMXXXXX, 24-XXXX-T1, MO-24-XXXXX...)
         - Returns : [str] ex.: EMGXXXXXXX, None (not found) or HTTPErrorCode
         """
+        return self.cache.fetch("emg_id", sample, lambda: self.fetch_emg_id(sample),
+                                cacheable=lambda emg_id: isinstance(emg_id, str) and len(emg_id) > 0)
+
+    def fetch_emg_id(self, sample):
+        """
+        Same as get_emg_id, without the local cache
+        """
         # TODO: Add different domain servers
         url = f"{self.prag_server}/api/sample/?query={sample}&sampleType=fastq"
-        resp = requests.get(url, headers={'Authorization': self.authenticate()})
+        resp = self.authorized_get(url)
         if resp.status_code == 200:
             if resp.json()['total'] == 1:
                 return resp.json()['hits'][0]['note']
@@ -75,8 +112,15 @@ class Emedgene:
         - `sample`: Case name on Emedgene, ex.: EMGXXXXXX
         - Returns : requests json object, None (not found) or HTTPErrorCode
         """
+        return self.cache.fetch("emg_case", sample, lambda: self.fetch_case_json(sample),
+                                cacheable=lambda case_json: isinstance(case_json, dict))
+
+    def fetch_case_json(self, sample):
+        """
+        Same as get_case_json, without the local cache
+        """
         url = f"{self.prag_server}/api/test/{sample}/"
-        resp = requests.get(url, headers={'Authorization': self.authenticate()})
+        resp = self.authorized_get(url)
         if resp.status_code == 200:
             return resp.json()
         elif resp.status_code == 401 or resp.status_code == 403:
@@ -130,14 +174,8 @@ class Emedgene:
         - `pheno_id`: String of the Phenotips identifier ex.: P0000XXX... usually obtained from Emedgene
         - Returns : str HP:00XXXXX,HP:0000XXX,...
         """
-        url=f"{self.pheno_url}/rest/patients/{pheno_id}"
-        headers = {
-            "accept": "application/json",
-            "authorization": self.pheno_auth,
-            "X-Gene42-Secret": self.pheno_secret
-        }
-        response = requests.get(url, headers=headers)
-        data=response.json()
+        data = self.cache.fetch("pheno_patient", pheno_id, lambda: self.fetch_pheno_patient(pheno_id),
+                                cacheable=lambda patient: "features" in patient)
 
         #Parse the list for observed phenotypes (reject non observed ones)
         hpo_list=[]
@@ -150,3 +188,15 @@ class Emedgene:
 
         return((",").join(hpo_list).replace('\'',""))
 
+    def fetch_pheno_patient(self, pheno_id):
+        """
+        Returns the Phenotips patient record (json) of `pheno_id`, without the local cache
+        """
+        url=f"{self.pheno_url}/rest/patients/{pheno_id}"
+        headers = {
+            "accept": "application/json",
+            "authorization": self.pheno_auth,
+            "X-Gene42-Secret": self.pheno_secret
+        }
+        response = self.http.get(url, headers=headers)
+        return response.json()
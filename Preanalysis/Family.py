@@ -5,21 +5,26 @@ import logging
 import glob
 import json
 from Sample import Sample
-from configurator import Config
+from PriorOutputs import PriorOutputs, reuse_report, print_reuse_report
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from atomicWrite import write_json, write_text
+from configLoader import load_config
 
 class Family:
 	"""
 	Family object composed of more than one Sample. 
 	Each family needs a proband and at least one parent. 
 	Should be able to accomodate quatuors (parents + sibling)
-	TODO: Siblings support for samplesheets
+	Siblings are given as a list under "siblings" in sample_group
 	"""
 	def __init__(self, family_ID, sample_group, config_file=os.path.expanduser(".myconf.json")):
 		self.family_ID 	= family_ID
 
 		self.proband	= sample_group["proband"]
-		configs         = 	Config.from_path(config_file)
+		configs         = 	load_config(config_file)
 		self.tertiary_path = configs.Paths.tertiary_maps 
+		self.output_path	= configs.Paths.output_path
+		self.miniwdl_cfg	= configs.Paths.get("miniwdl_cfg", None)
 		self.parents	= {}
 		if "mother" not in sample_group.keys() and "father" not in sample_group.keys():
 			logging.warning(f"At least one parent should be given for Family {family_ID}")
@@ -31,6 +36,7 @@ class Family:
 		elif "mother" in sample_group.keys() and "father" in sample_group.keys():
 			self.parents.update({"mother":sample_group["mother"]})
 			self.parents.update({"father":sample_group["father"]})
+		self.siblings	= list(sample_group.get("siblings", []))
 
 
 	def write_joint_samplesheet(self):
@@ -45,10 +51,15 @@ class Family:
 		for parent in self.parents:
 			print(parent)
 			item = self.parents[parent]
-			role = item.case_status["Role"].split(" ")[0]
 			print(proband_sample_dict)
-			proband_sample_dict.update({f"{role}_id": item.name})
+			proband_sample_dict.update({f"{parent}_id": item.name})
 			family_samples.append(define_samplesheet_sample(item))
+		#Siblings share the parents of the proband
+		for sibling in self.siblings:
+			sibling_sample_dict = define_samplesheet_sample(sibling)
+			for parent in self.parents:
+				sibling_sample_dict.update({f"{parent}_id": self.parents[parent].name})
+			family_samples.append(sibling_sample_dict)
 
 
 		sample_dict={"humanwgs_family.family":{
@@ -64,11 +75,41 @@ class Family:
 		sample_file= f"{self.proband.samplesheet_directory}/{self.family_ID}.json"
 		print(f"Writing samplesheet to {sample_file}")
 		print(sample_dict)
-		with open(sample_file, 'w') as fw:
-			json.dump(sample_dict, fw, indent=4)
+		write_json(sample_file, sample_dict)
+
+	def write_family_list(self):
+		"""
+		Writes the {family_ID}.txt batch file next to the samplesheet:
+		{family_ID},{family_ID}.json then one {role}:{sample_name},{bam_path} line per member
+		"""
+		lines = [f"{self.family_ID},{self.family_ID}.json"]
+		lines.append(f"proband:{self.proband.name},{self.proband.bam_path}")
+		for parent in self.parents:
+			lines.append(f"{parent}:{self.parents[parent].name},{self.parents[parent].bam_path}")
+		for sibling in self.siblings:
+			lines.append(f"sibling:{sibling.name},{sibling.bam_path}")
+		write_text(f"{self.proband.samplesheet_directory}/{self.family_ID}.txt", "".join(f"{line}\n" for line in lines))
+
+	def members(self):
+		"""
+		Returns: List of the Sample objects of the family, proband first
+		"""
+		return [self.proband] + list(self.parents.values()) + self.siblings
+
+	def write_reuse_report(self):
+		"""
+		Look for completed singleton runs of the BAMs of the members (see PriorOutputs.py),
+		and write what the family run can reuse in {family_ID}.reuse.json next to the samplesheet
+		Returns: the report Dict
+		"""
+		report = reuse_report(self.family_ID, [(sample.name, sample.bam_path) for sample in self.members()],
+			PriorOutputs.load(self.output_path), self.miniwdl_cfg, self.proband.refmaps_path)
+		print_reuse_report(report)
+		write_json(f"{self.proband.samplesheet_directory}/{self.family_ID}.reuse.json", report)
+		return report
 
 	def __str__(self):
-		return (f"Proband:{self.proband.name}\nParents:{self.parents}")
+		return (f"Proband:{self.proband.name}\nParents:{self.parents}\nSiblings:{[sibling.name for sibling in self.siblings]}")
 
 
 def define_samplesheet_sample(sample):
@@ -85,6 +126,7 @@ def define_samplesheet_sample(sample):
 		"sex"		: sample.case_status["Gender"].upper(),
 		"hifi_reads": [sample.bam_path],
 		"fail_reads": [sample.fail_bam],
-		"affected": str(sample.case_status["Affected"])
+		#Booleans for the WDL, from True/False or the "True"/"False" text of the sample list
+		"affected": str(sample.case_status["Affected"]).strip().lower() == "true"
 	}
 	return output_sample
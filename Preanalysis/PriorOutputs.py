@@ -0,0 +1,199 @@
+import os
+import json
+import glob
+import logging
+import threading
+import configparser
+
+"""
+Completed singleton runs of the output_path ({output_path}/*/_LAST), indexed on the realpath of their HiFi BAM,
+to find the per-sample results of a sample already analysed as a singleton when it is joint-called in a family.
+The family workflow only takes the unaligned HiFi BAMs as inputs (hifi_reads), so these results cannot be given to it:
+they are reused through the miniwdl call cache, which must be enabled ([call_cache] get and put in the miniwdl config).
+The per-sample tasks of the family run then have the same inputs as in the singleton run (BAM, reference map)
+and are taken from the cache, as long as the files of the cached outputs still exist.
+A member is only reported reusable when the cache directory holds entries written by its singleton run,
+and the family samplesheet gives its BAM with the same path string as the singleton run (miniwdl keys the cache on it).
+"""
+
+#Per-sample outputs of a singleton run worth reporting: description
+REUSABLE_OUTPUTS = {
+	"merged_haplotagged_bam":	"aligned BAM",
+	"phased_small_variant_vcf":	"small variants",
+	"phased_sv_vcf":			"structural variants",
+	"phased_trgt_vcf":			"tandem repeats",
+	"cnv_vcf":					"copy number variants",
+}
+#Defaults of miniwdl, overridden by the config, then by MINIWDL__CALL_CACHE__{KEY} environment variables
+CALL_CACHE_DEFAULTS	= {"get": "false", "put": "false", "dir": "~/.cache/miniwdl"}
+
+def call_cache_settings(miniwdl_cfg):
+	"""
+	Returns: Dict {"get": bool, "put": bool, "dir": path} of the [call_cache] section of a miniwdl config
+	"""
+	parser = configparser.ConfigParser()
+	if miniwdl_cfg is not None:
+		parser.read(os.path.expanduser(miniwdl_cfg))
+	settings = {}
+	for key, default in CALL_CACHE_DEFAULTS.items():
+		value = os.environ.get(f"MINIWDL__CALL_CACHE__{key.upper()}", parser.get("call_cache", key, fallback=default))
+		settings[key] = os.path.expanduser(value) if key == "dir" else value.strip().lower() in ("true", "1", "yes", "on")
+	return settings
+
+class PriorOutputs:
+	"""
+	Completed singleton runs by BAM realpath: {bam: [run, ...]}, most recent first,
+	run: {"run_dir", "sample_id", "hifi_reads", "ref_map_file", "finished", "outputs": {output name: path}}
+	"""
+	_loaded	= {}
+	_lock	= threading.Lock()
+
+	def __init__(self, output_path):
+		self.output_path	= output_path
+		self.runs			= {}
+		self._cache_entries	= {}
+		for inputs_path in glob.glob(os.path.join(output_path, "*", "_LAST", "inputs.json")):
+			run_dir = os.path.realpath(os.path.dirname(inputs_path))
+			outputs_path = os.path.join(run_dir, "outputs.json")
+			if not os.path.isfile(outputs_path):
+				continue
+			try:
+				with open(inputs_path) as fr:
+					inputs = json.load(fr)
+				if "humanwgs_singleton.hifi_reads" not in inputs:
+					continue
+				with open(outputs_path) as fr:
+					outputs = json.load(fr)
+			except (OSError, ValueError) as e:
+				logging.warning(f"Skipping {run_dir}: {e}")
+				continue
+			run = {
+				"run_dir": run_dir,
+				"sample_id": inputs.get("humanwgs_singleton.sample_id"),
+				"hifi_reads": inputs["humanwgs_singleton.hifi_reads"],
+				"ref_map_file": inputs.get("humanwgs_singleton.ref_map_file"),
+				"finished": os.path.getmtime(outputs_path),
+				"outputs": {key.rsplit(".", 1)[-1]: value for key, value in outputs.items() if key.rsplit(".", 1)[-1] in REUSABLE_OUTPUTS}}
+			for bam in inputs["humanwgs_singleton.hifi_reads"]:
+				self.runs.setdefault(os.path.realpath(bam), []).append(run)
+		for runs in self.runs.values():
+			runs.sort(key=lambda run: -run["finished"])
+
+	@classmethod
+	def load(cls, output_path):
+		"""
+		Returns: the index of output_path, built on the first call for that path
+		"""
+		path = os.path.realpath(output_path)
+		with cls._lock:
+			if path not in cls._loaded:
+				cls._loaded[path] = cls(path)
+			return cls._loaded[path]
+
+	def find(self, bam_path):
+		"""
+		Returns: List of the completed singleton runs of a BAM, most recent first
+		"""
+		return self.runs.get(os.path.realpath(bam_path), [])
+
+	def cache_entries(self, cache_dir):
+		"""
+		Count the miniwdl call cache entries ({cache_dir}/{task}/{digest}/{inputs digest}.json) whose outputs
+		are files of a run of output_path, read once per cache directory
+		Returns: Dict {run_dir: number of entries}
+		"""
+		with self._lock:
+			if cache_dir not in self._cache_entries:
+				self._cache_entries[cache_dir] = count_cache_entries(cache_dir, self.output_path)
+			return self._cache_entries[cache_dir]
+
+def count_cache_entries(cache_dir, output_path):
+	output_path = os.path.realpath(output_path)
+	counts = {}
+	for root, dirs, files in os.walk(cache_dir):
+		for file_name in files:
+			if not file_name.endswith(".json"):
+				continue
+			try:
+				with open(os.path.join(root, file_name)) as fr:
+					entry = json.load(fr)
+			except (OSError, ValueError):
+				continue
+			run_dirs = set()
+			for value in json_strings(entry):
+				if not value.startswith(os.sep):
+					continue
+				parts = os.path.relpath(os.path.realpath(value), output_path).split(os.sep)
+				#{output_path}/{run_id}/{timestamp}_{workflow}/...
+				if len(parts) > 2 and parts[0] != os.pardir:
+					run_dirs.add(os.path.join(output_path, parts[0], parts[1]))
+			for run_dir in run_dirs:
+				counts[run_dir] = counts.get(run_dir, 0) + 1
+	return counts
+
+def json_strings(value):
+	"""
+	Yields: every string of a JSON document
+	"""
+	if isinstance(value, str):
+		yield value
+	elif isinstance(value, dict):
+		for item in value.values():
+			yield from json_strings(item)
+	elif isinstance(value, list):
+		for item in value:
+			yield from json_strings(item)
+
+def same_path(first, second):
+	if not isinstance(first, str) or not isinstance(second, str):
+		return first == second
+	return os.path.realpath(os.path.expanduser(first)) == os.path.realpath(os.path.expanduser(second))
+
+def reuse_report(family_id, samples, prior, miniwdl_cfg, ref_map_file):
+	"""
+	- `samples`: List of tuples (sample name, BAM path) of the family
+	- `prior`: PriorOutputs of the output_path
+	- `ref_map_file`: reference map of the family samplesheet, which must be the one of the singleton run for the cache to match
+	Returns: Dict {"family_id", "call_cache", "samples": [...], "reused": [sample names]}
+	"""
+	call_cache = call_cache_settings(miniwdl_cfg)
+	report = {"family_id": family_id, "call_cache": call_cache, "samples": [], "reused": []}
+	cache_entries = prior.cache_entries(call_cache["dir"]) if call_cache["get"] and call_cache["put"] else {}
+	for name, bam in samples:
+		runs = prior.find(bam)
+		sample = {"sample_id": name, "bam": bam, "singleton_runs": []}
+		for run in runs:
+			sample["singleton_runs"].append({
+				"run_dir": run["run_dir"],
+				"same_bam_path": bam in run["hifi_reads"],
+				"same_ref_map": same_path(run["ref_map_file"], ref_map_file),
+				"cache_entries": cache_entries.get(run["run_dir"], 0),
+				"outputs": {output: {"path": path, "exists": isinstance(path, str) and os.path.exists(path)} for output, path in run["outputs"].items()}})
+		#The most recent run is the one the cache entries point to
+		latest = sample["singleton_runs"][0] if runs else None
+		sample["reusable"] = latest is not None and call_cache["get"] and call_cache["put"] and latest["cache_entries"] > 0 and \
+			latest["same_bam_path"] and latest["same_ref_map"] and latest["outputs"].get("merged_haplotagged_bam", {}).get("exists", False)
+		if sample["reusable"]:
+			report["reused"].append(name)
+		report["samples"].append(sample)
+	return report
+
+def print_reuse_report(report):
+	found = [sample for sample in report["samples"] if sample["singleton_runs"]]
+	print(f"------Prior singleton runs of {report['family_id']}------")
+	print(f"{len(found)}/{len(report['samples'])} members already analysed as singletons, {len(report['reused'])} reusable through the call cache")
+	for sample in found:
+		latest = sample["singleton_runs"][0]
+		if sample["reusable"]:
+			status = "reusable"
+		elif not (report["call_cache"]["get"] and report["call_cache"]["put"]):
+			status = "not reused: call cache disabled in the miniwdl config ([call_cache] get = true and put = true)"
+		elif latest["cache_entries"] == 0:
+			status = f"not reused: no call cache entry of this run in {report['call_cache']['dir']}"
+		elif not latest["same_bam_path"]:
+			status = "not reused: BAM given with another path than in the singleton run"
+		elif not latest["same_ref_map"]:
+			status = "not reused: different reference map"
+		else:
+			status = "not reused: aligned BAM no longer exists"
+		print(f"\t{sample['sample_id']}\t{latest['run_dir']}\t{status}")
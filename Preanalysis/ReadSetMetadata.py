@@ -0,0 +1,89 @@
+import sys,os
+import glob
+import logging
+import xml.etree.ElementTree as ET
+
+"""
+Reads the sample metadata of a well from its pb_formats/*.consensusreadset.xml file.
+The file is stream-parsed and parsing stops once the BioSample element has been read.
+"""
+
+CONSENSUSREADSET_GLOB = "pb_formats/*_s*.hifi_reads.bc*.consensusreadset.xml"
+
+def find_consensusreadset(well_path):
+	"""
+	Obtain the path of the consensusreadset.xml of a well folder (ex .../r84196_XXX/1_A01)
+	Returns: Str (File path), None if there is none. Exits if there are more than one.
+	"""
+	return pick_consensusreadset(glob.glob(os.path.join(well_path, CONSENSUSREADSET_GLOB)), well_path)
+
+def pick_consensusreadset(xml_paths, well_path):
+	"""
+	Check that a well has exactly one consensusreadset.xml (ex.: from the RunIndex)
+	Returns: Str (File path), None if there is none. Exits if there are more than one.
+	"""
+	if len(xml_paths) == 0:
+		logging.warning(f"No consensusreadset.xml found in {well_path}/pb_formats")
+		return None
+	elif len(xml_paths) > 1:
+		logging.warning(f"More than one consensusreadset.xml found in {well_path}/pb_formats: {xml_paths}")
+		sys.exit(1)
+	return xml_paths[0]
+
+def read_consensusreadset(xml_path):
+	"""
+	Extract the metadata of a consensusreadset.xml in a single pass
+	Returns: Dict {biosample_name, barcode, well, movie, run_name, instrument, num_records, total_length, created_at, hifi_bam}
+	Fields absent from the file are None
+	"""
+	metadata = dict.fromkeys(["biosample_name", "barcode", "well", "movie", "run_name", "instrument",
+		"num_records", "total_length", "created_at", "hifi_bam"])
+	#Path of element names from the root, to tell apart elements sharing a name (ex.: RunDetails/Name)
+	parents = []
+	for event, element in ET.iterparse(xml_path, events=("start", "end")):
+		tag = element.tag.rsplit("}", 1)[-1]
+		if event == "start":
+			parent = parents[-1] if parents else None
+			parents.append(tag)
+			if tag == "ConsensusReadSet":
+				metadata["created_at"] = element.get("CreatedAt")
+			elif tag == "ExternalResource" and metadata["hifi_bam"] is None and parent == "ExternalResources" and len(parents) == 3:
+				metadata["hifi_bam"] = element.get("ResourceId")
+			elif tag == "CollectionMetadata":
+				metadata["movie"] = element.get("Context")
+				metadata["instrument"] = element.get("InstrumentName")
+			elif tag == "BioSample" and metadata["biosample_name"] is None:
+				metadata["biosample_name"] = element.get("Name")
+			elif tag == "DNABarcode" and metadata["barcode"] is None:
+				metadata["barcode"] = element.get("Name")
+			continue
+
+		parents.pop()
+		parent = parents[-1] if parents else None
+		if tag == "NumRecords" and parent == "DataSetMetadata":
+			metadata["num_records"] = int(element.text)
+		elif tag == "TotalLength" and parent == "DataSetMetadata":
+			metadata["total_length"] = int(element.text)
+		elif tag == "WellName" and metadata["well"] is None:
+			metadata["well"] = element.text
+		elif tag == "Name" and parent == "RunDetails":
+			metadata["run_name"] = element.text
+		elif tag == "BioSample":
+			#Everything we need comes before the end of the first BioSample
+			break
+		element.clear()
+	return metadata
+
+def read_well_metadata(well_path, xml_paths=None):
+	"""
+	Find and read the consensusreadset.xml of a well folder
+	- `xml_paths`: the consensusreadset.xml files of the well if already known, otherwise they are globbed
+	Returns: Dict (see read_consensusreadset) or None if the well has no consensusreadset.xml
+	"""
+	if xml_paths is None:
+		xml_path = find_consensusreadset(well_path)
+	else:
+		xml_path = pick_consensusreadset(xml_paths, well_path)
+	if xml_path is None:
+		return None
+	return read_consensusreadset(xml_path)
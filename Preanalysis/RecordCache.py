@@ -0,0 +1,87 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+
+DEFAULT_CACHE_PATH	= "~/.cache/pacbiowgs/records.sqlite"
+DEFAULT_TTL_DAYS	= 30
+
+class OfflineMiss(LookupError):
+	"""
+	Raised in offline mode when a record is not in the cache
+	"""
+
+class RecordCache:
+	"""
+	On-disk (SQLite) cache of the documents obtained from Emedgene and Phenotips.
+	Records are keyed by kind (ex.: "emg_case", "pheno_patient") and identifier (ex.: EMGXXXXXXX, P0000XXX)
+	- `ttl_days`: records older than this are fetched again (0 to never expire)
+	- `refresh`: ignore cached records, fetch everything again and update the cache
+	- `offline`: never contact the remote services, only serve what is in the cache (regardless of age)
+	The optional "Cache" section of the config can set {"path": ..., "ttl_days": ...}
+	"""
+	def __init__(self, path=DEFAULT_CACHE_PATH, ttl_days=DEFAULT_TTL_DAYS, refresh=False, offline=False):
+		self.path		= os.path.expanduser(path)
+		self.ttl		= ttl_days * 86400
+		self.refresh	= refresh
+		self.offline	= offline
+		self._lock		= threading.Lock()
+		os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+		self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+		with self._db:
+			self._db.execute("PRAGMA journal_mode=WAL")
+			self._db.execute("""CREATE TABLE IF NOT EXISTS records (
+				kind TEXT NOT NULL,
+				key TEXT NOT NULL,
+				fetched REAL NOT NULL,
+				document TEXT NOT NULL,
+				PRIMARY KEY (kind, key))""")
+
+	@classmethod
+	def from_config(cls, configs, refresh=False, offline=False):
+		cache_configs = configs.get("Cache", None)
+		if cache_configs is None:
+			return cls(refresh=refresh, offline=offline)
+		return cls(
+			path		= cache_configs.get("path", DEFAULT_CACHE_PATH),
+			ttl_days	= cache_configs.get("ttl_days", DEFAULT_TTL_DAYS),
+			refresh		= refresh,
+			offline		= offline)
+
+	def get(self, kind, key):
+		"""
+		Returns the cached document, or None if absent or expired (expiry is ignored when offline)
+		"""
+		with self._lock:
+			row = self._db.execute("SELECT fetched, document FROM records WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+		if row is None:
+			return None
+		fetched, document = row
+		if not self.offline and self.ttl > 0 and time.time() - fetched > self.ttl:
+			return None
+		return json.loads(document)
+
+	def put(self, kind, key, document):
+		with self._lock, self._db:
+			self._db.execute("INSERT OR REPLACE INTO records (kind, key, fetched, document) VALUES (?, ?, ?, ?)",
+				(kind, key, time.time(), json.dumps(document)))
+
+	def fetch(self, kind, key, fetcher, cacheable=lambda document: True):
+		"""
+		Returns the cached document for (kind, key), or calls `fetcher()` and caches its result
+		- `cacheable`: function deciding if a fetched document should be kept (ex.: not an HTTP error code)
+		Raises OfflineMiss if offline and the record is not cached
+		"""
+		if not self.refresh:
+			document = self.get(kind, key)
+			if document is not None:
+				return document
+		if self.offline:
+			logging.warning(f"Offline: {kind} {key} is not in the cache {self.path}")
+			raise OfflineMiss(f"{kind} {key} not cached")
+		document = fetcher()
+		if document is not None and cacheable(document):
+			self.put(kind, key, document)
+		return document
@@ -0,0 +1,157 @@
+import sys,os
+import json
+import fnmatch
+import logging
+import threading
+
+"""
+Index of the files of a Revio run directory (run_path/<run_id>), used instead of globbing each well.
+The run directory is walked once with os.scandir and the result is saved in a manifest,
+which is reused until the mtime of the run directory, of a well folder or of a well subfolder changes
+(files still being transferred to hifi_reads only change the mtime of hifi_reads).
+"""
+
+DEFAULT_INDEX_DIR	= "~/.cache/pacbiowgs/run_index"
+MANIFEST_VERSION	= 2
+
+#Same patterns as the previous glob lookups, relative to the well folder
+HIFI_BAM_PATTERN	= "*bc*.bam"
+FAIL_BAM_PATTERN	= "*bc*.bam"
+XML_PATTERN			= "*_s*.hifi_reads.bc*.consensusreadset.xml"
+
+class RunIndex:
+	"""
+	Files of every well of a run:
+	{well: {"path", "hifi_bam", "hifi_bam_size", "fail_bam", "fail_bam_size", "xml"}}
+	Missing files are "" (sizes 0), "xml" is the list of every consensusreadset.xml found
+	"""
+	_loaded	= {}
+	_lock	= threading.Lock()
+
+	def __init__(self, run_dir, wells, mtimes):
+		self.run_dir	= run_dir
+		self.wells		= wells
+		self.mtimes		= mtimes
+
+	@classmethod
+	def load(cls, runs_path, run_id, index_dir=DEFAULT_INDEX_DIR, refresh=False):
+		"""
+		Returns the index of run_path/run_id: from this process if already loaded,
+		else from its manifest if the run directory did not change (see directory_mtimes), else by walking the directory
+		- `refresh`: ignore the manifest and walk the directory again
+		"""
+		run_dir = os.path.join(runs_path, run_id)
+		with cls._lock:
+			mtimes = directory_mtimes(run_dir)
+			index = None if refresh else cls._loaded.get(run_dir)
+			if index is None or index.mtimes != mtimes:
+				manifest_path = os.path.join(os.path.expanduser(index_dir), f"{run_id}.json")
+				index = None if refresh else cls.read_manifest(manifest_path, run_dir, mtimes)
+				if index is None:
+					index = cls.build(run_dir, mtimes)
+					index.write_manifest(manifest_path)
+				cls._loaded[run_dir] = index
+			return index
+
+	@classmethod
+	def build(cls, run_dir, mtimes):
+		"""
+		Walk the run directory: one scandir for the run, the well folders and their subfolders
+		"""
+		wells = {}
+		with os.scandir(run_dir) as run_entries:
+			for well_entry in run_entries:
+				if not well_entry.is_dir():
+					continue
+				well = {"path": well_entry.path, "hifi_bam": "", "hifi_bam_size": 0, "fail_bam": "", "fail_bam_size": 0, "xml": []}
+				with os.scandir(well_entry.path) as well_entries:
+					subfolders = {entry.name: entry.path for entry in well_entries if entry.is_dir()}
+				if "hifi_reads" in subfolders:
+					well["hifi_bam"], well["hifi_bam_size"] = first_match(matching_files(subfolders["hifi_reads"], HIFI_BAM_PATTERN))
+				if "fail_reads" in subfolders:
+					well["fail_bam"], well["fail_bam_size"] = first_match(matching_files(subfolders["fail_reads"], FAIL_BAM_PATTERN))
+				if "pb_formats" in subfolders:
+					well["xml"] = [path for path, size in matching_files(subfolders["pb_formats"], XML_PATTERN)]
+				wells[well_entry.name] = well
+		return cls(run_dir, wells, mtimes)
+
+	@classmethod
+	def read_manifest(cls, manifest_path, run_dir, mtimes):
+		if not os.path.isfile(manifest_path):
+			return None
+		try:
+			with open(manifest_path) as fr:
+				manifest = json.load(fr)
+		except (OSError, ValueError) as e:
+			logging.warning(f"Could not read run index {manifest_path}: {e}")
+			return None
+		if manifest.get("version") != MANIFEST_VERSION or manifest.get("run_dir") != run_dir or manifest.get("mtimes") != mtimes:
+			return None
+		return cls(run_dir, manifest["wells"], mtimes)
+
+	def write_manifest(self, manifest_path):
+		try:
+			os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+			tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+			with open(tmp_path, 'w') as fw:
+				json.dump({"version": MANIFEST_VERSION, "run_dir": self.run_dir, "mtimes": self.mtimes, "wells": self.wells}, fw, indent=1)
+			os.replace(tmp_path, manifest_path)
+		except OSError as e:
+			logging.warning(f"Could not save run index {manifest_path}: {e}")
+
+	def well_names(self):
+		"""
+		Returns: List of the well names, sorted (1_A01, 1_B01...)
+		"""
+		return sorted(self.wells, key=str.lower)
+
+	def well(self, well):
+		"""
+		Returns: Dict of the files of `well`, exits if the well is not in the run
+		"""
+		if well not in self.wells:
+			logging.warning(f"Well {well} not found in run directory {self.run_dir}")
+			sys.exit(1)
+		return self.wells[well]
+
+
+def index_dir(configs):
+	"""
+	Directory of the run index manifests, set by the optional "run_index" key of the "Cache" config section
+	"""
+	cache_configs = configs.get("Cache", None)
+	if cache_configs is None:
+		return DEFAULT_INDEX_DIR
+	return cache_configs.get("run_index", DEFAULT_INDEX_DIR)
+
+def directory_mtimes(run_dir):
+	"""
+	Returns: Dict {path relative to run_dir: st_mtime_ns} of the run directory, its well folders and their subfolders
+	"""
+	mtimes = {"": os.stat(run_dir).st_mtime_ns}
+	with os.scandir(run_dir) as run_entries:
+		for well_entry in run_entries:
+			if not well_entry.is_dir():
+				continue
+			mtimes[well_entry.name] = well_entry.stat().st_mtime_ns
+			with os.scandir(well_entry.path) as well_entries:
+				for entry in well_entries:
+					if entry.is_dir():
+						mtimes[f"{well_entry.name}/{entry.name}"] = entry.stat().st_mtime_ns
+	return mtimes
+
+def matching_files(directory, pattern):
+	"""
+	Returns: List of tuple (path, size) of the files of `directory` matching `pattern`, sorted by name
+	"""
+	with os.scandir(directory) as entries:
+		matches = [(entry.path, entry.stat().st_size) for entry in entries if fnmatch.fnmatch(entry.name, pattern) and entry.is_file()]
+	return sorted(matches)
+
+def first_match(matches):
+	"""
+	Returns: The first tuple (path, size) of `matches`, ("", 0) if there are none
+	"""
+	if len(matches) == 0:
+		return "", 0
+	return matches[0]
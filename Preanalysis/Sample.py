@@ -4,84 +4,157 @@ import subprocess
 import logging
 import glob
 import json
-from Emedgene import Emedgene
-from configurator import Config
+from CaseResolver import CaseResolver, find_status
+from ReadSetMetadata import read_well_metadata
+from RunIndex import RunIndex, index_dir
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from atomicWrite import write_json
+from configLoader import load_config
 
 class Sample:
 	"""
 	Sample object for patients. Eventually will be separated into Case Class and Sample Class
+	Building a Sample does not touch the filesystem or the network: the BAM paths, the name,
+	the Emedgene status and the phenotypes are only looked up the first time they are used
+	(or all at once with resolve()), unless they were given.
 	"""
-	def __init__(self, run_id, well, name="", bam_path="", fail_bam="", status={},HPOs="", config_file=os.path.expanduser(".myconf.json")):
+	__slots__ = ("run_id", "well", "config_file", "_configs", "_name", "_bam_path", "_fail_bam", "_barcode",
+		"_case_status", "_phenotypes", "_HPOs", "_emedgene", "_resolver")
+
+	def __init__(self, run_id, well, name="", bam_path="", fail_bam="", status={},HPOs="", config_file=os.path.expanduser(".myconf.json"), emedgene=None, resolver=None, barcode=""):
 		self.run_id		=	run_id #ie r84196_20250224_170647
-		configs         = 	Config.from_path(config_file)
-		
-		self.refmaps_path	=	configs.Paths.ref_maps #This is required when writing the samplesheet
-		self.tertiary_path = configs.Paths.tertiary_maps
-		self.samplesheet_directory = configs.Paths.sample_sheet_path 
-		self.runs_path	=	configs.Paths.run_path
 		self.well		=	well
-		self.sample_path=	self.runs_path + f"{run_id}/{well}"
-		
-
-		if len(bam_path) != 0:
-			self.bam_path	=	bam_path
-		else:
-			self.bam_path	=	self.find_bam_path()
+		self.config_file	=	config_file
+		self._configs	=	None
 
+		self._bam_path	=	bam_path or None
 		#Optionally, we can provide a failed reads bam for TR calling
-		if len(fail_bam) != 0:
-			self.fail_bam	=	fail_bam
-		else:
-			self.fail_bam	=	self.find_fail_bam()
-
-
-		self.barcode	=	self.bam_path.split("/")[-1].split("bc")[-1].removesuffix(".bam")
+		self._fail_bam	=	fail_bam or None
+		self._barcode	=	barcode or None
 		#Sometimes, the name from sequencing is not compatible with the Emedgene name, so it must be given manually.
 		#For example, we receive GMXXXX_redo or GMXXXX_new, while the Emedgene name should be GMXXXX 
-		if len(name) != 0:
-			self.name	=	name
-		else:
-			self.name	=	self.find_name()
+		self._name		=	name or None
 
 		#If status is pre-defined, we don't need to investigate emedgene
 		if len(status) != 0:
-			self.case_status = status
-			emg_case_id = "skip"
-			self.phenotypes = ""
-
+			self._case_status	= status
+			self._phenotypes	= ""
 		else:
-			emg_case_id	=	Emedgene(config_file=config_file).get_emg_id(self.name)
-			
-		#Does the patient belong to a trio, duo, or a singleton? Alse gender, family role and Affected status
-		#if isinstance(self.emg_case_json,int):
-		if emg_case_id == "":
-			#If we get an int (error code) on Emedgene, we suppose it is likely a validation case, always singleton
-			self.case_status = {"Status": "Singleton", "Role":"proband", "Gender":"null", "Affected": True}
-			self.phenotypes = ""
-		elif emg_case_id != "skip":
-			emg_case_json	=	Emedgene(config_file=config_file).get_case_json(emg_case_id)
-			self.case_status =	self.find_status(emg_case_json)
-
-			#TODO: Make class for Phenotips
-			pheno_case_id	=	Emedgene(config_file=config_file).get_pheno_id(json_file=(emg_case_json))
-			if self.case_status["Affected"]:
-				self.phenotypes		=	Emedgene(config_file=config_file).phenotips_import_HPO_request(pheno_case_id)
-			else:
-				self.phenotypes		=	""
-		
+			self._case_status	= None
+			self._phenotypes	= None
 		#phenotype overrides if present
-		if len(HPOs) != 0:
-			self.phenotypes = HPOs
+		self._HPOs		=	HPOs
+		#A shared resolver fetches each Emedgene case once for all the members of a family
+		self._emedgene	=	emedgene
+		self._resolver	=	resolver
+
+	@property
+	def configs(self):
+		if self._configs is None:
+			self._configs = load_config(self.config_file)
+		return self._configs
+
+	@property
+	def refmaps_path(self):
+		return self.configs.Paths.ref_maps #This is required when writing the samplesheet
+
+	@property
+	def tertiary_path(self):
+		return self.configs.Paths.tertiary_maps
+
+	@property
+	def samplesheet_directory(self):
+		return self.configs.Paths.sample_sheet_path
+
+	@property
+	def runs_path(self):
+		return self.configs.Paths.run_path
+
+	@property
+	def run_index_dir(self):
+		return index_dir(self.configs)
+
+	@property
+	def sample_path(self):
+		return self.runs_path + f"{self.run_id}/{self.well}"
+
+	@property
+	def bam_path(self):
+		if self._bam_path is None:
+			self._bam_path = self.find_bam_path()
+		return self._bam_path
+
+	@property
+	def fail_bam(self):
+		if self._fail_bam is None:
+			self._fail_bam = self.find_fail_bam()
+		return self._fail_bam
+
+	@property
+	def barcode(self):
+		if self._barcode is None:
+			self._barcode = self.bam_path.split("/")[-1].split("bc")[-1].removesuffix(".bam")
+		return self._barcode
+
+	@property
+	def name(self):
+		if self._name is None:
+			self._name = self.find_name()
+		return self._name
+
+	@property
+	def case_status(self):
+		"""
+		Does the patient belong to a trio, duo, or a singleton? Alse gender, family role and Affected status
+		"""
+		if self._case_status is None:
+			self.resolve_status()
+		return self._case_status
+
+	@property
+	def phenotypes(self):
+		if len(self._HPOs) != 0:
+			return self._HPOs
+		if self._phenotypes is None:
+			self.resolve_status()
+		return self._phenotypes
+
+	def resolve_status(self):
+		"""
+		Obtain the case status and phenotypes from Emedgene and Phenotips
+		"""
+		if self._resolver is None:
+			if self._emedgene is None:
+				#Imported here so that writing samplesheets from the sample list does not load the HTTP stack
+				from Emedgene import Emedgene
+				self._emedgene = Emedgene(config_file=self.config_file)
+			self._resolver = CaseResolver(self._emedgene)
+		self._case_status, self._phenotypes = self._resolver.resolve(self.name)
+
+	def resolve(self):
+		"""
+		Look up every field that was not given (files, name, Emedgene status, phenotypes)
+		Returns: self
+		"""
+		self.bam_path, self.fail_bam, self.barcode, self.name, self.case_status, self.phenotypes
+		return self
+
+	def run_files(self):
+		"""
+		Files of the sample's well (hifi BAM, fail BAM, xml and sizes), from the index of its run directory
+		Returns: Dict (see RunIndex)
+		"""
+		return RunIndex.load(self.runs_path, self.run_id, index_dir=self.run_index_dir).well(self.well)
 
 	def find_bam_path(self):
 		"""
 		Obtain the path for the BAM file of the sample. The name varies based on the time of sequencing
 		Returns: Str (File path)
 		"""
-		bam_path = glob.glob(self.sample_path + "/hifi_reads/*bc*.bam")
+		bam_path = self.run_files()["hifi_bam"]
 
-		if len(bam_path) != 0 and os.path.isfile(bam_path[0]):
-			return bam_path[0]
+		if len(bam_path) != 0 and os.path.isfile(bam_path):
+			return bam_path
 		else: 
 			logging.warning(f"Could not find BAM path for sample {self.run_id}/{self.well}")
 			sys.exit(1)
@@ -91,10 +164,10 @@ class Sample:
 		Obtain the failed reads . The name varies based on the time of sequencing
 		Returns: Str (File path)
 		"""
-		fail_path = glob.glob(self.sample_path + "/fail_reads/*bc*.bam")
+		fail_path = self.run_files()["fail_bam"]
 
-		if len(fail_path) != 0 and os.path.isfile(fail_path[0]):
-			return fail_path[0]
+		if len(fail_path) != 0 and os.path.isfile(fail_path):
+			return fail_path
 		else: 
 			logging.warning(f"Could not find failed BAM path for sample {self.run_id}/{self.well}")
 			return ""
@@ -105,9 +178,11 @@ class Sample:
 		Obtain the sample name from its directory. The name can be extracted from a file in the pb_format folder.
 		Returns: Str (name) or error
 		"""
-		grep_command = f"grep -o \"BioSample Name=\".*\"\" {self.sample_path}/pb_formats/*_s*.hifi_reads.bc*.consensusreadset.xml | cut -f2 -d'\"' | tr -d '\n'"
-		grep_result = subprocess.run(grep_command, shell=True, capture_output=True, text=True)
-		return grep_result.stdout
+		metadata = read_well_metadata(self.sample_path, xml_paths=self.run_files()["xml"])
+		if metadata is None or metadata["biosample_name"] is None:
+			logging.warning(f"Could not find the BioSample name for sample {self.run_id}/{self.well}")
+			return ""
+		return metadata["biosample_name"]
 
 	def find_status(self,json_file):
 		"""
@@ -116,75 +191,7 @@ class Sample:
 		Requires the Emedgene json case
 		Returns: Dict ({Status: [Singleton, Duo, Trio, Unknown],Role: [Proband, father, mother,"Unknown"], Gender: [Male,Female, null], Affected: [True, False,None]})
 		"""
-		if "patients" in json_file.keys():
-			family_members = json_file["patients"]
-			number_in_case = len(family_members)
-			match number_in_case:
-				case 1: status = "Singleton"
-				case 2: status = "Duo"
-				case 3: status = "Trio"
-				case 4: 
-					if "other" in family_members.keys() and len(family_members["other"]) == 0:
-						status = "Trio"
-					else:
-						status = "Unknown"
-
-				case _: status = "Unknown"
-			
-			role = "Unknown"
-			gender = "null"
-			affected = None
-
-			for member in family_members.keys():
-				if member == "other":
-					continue
-				if (type(family_members[member]) is dict) and ("fastq_sample" in family_members[member]):
-					if member == "proband":
-						proband_name = family_members[member]["fastq_sample"]
-					if family_members[member]["fastq_sample"] == self.name:
-						if role == "Unknown":
-							role = member
-							gender = family_members[member]["gender"]
-
-							if len(family_members[member]["phenotypes"]) > 0:
-								pheno_list = family_members[member]["phenotypes"][0]
-							else:
-								pheno_list = {"name": "Healthy"}
-
-							#We take a look at the phenotypes to know if parent is affected
-							#The actual phenotype list will be obtained from Phenotips (more up to date)
-							if "name" in pheno_list.keys() and pheno_list["name"] == "Healthy":
-								affected = False
-							else:
-								affected = True
-						else:
-							logging.warning(f"{self.name} was assigned roles more than once, check proper trio")
-				else:
-					logging.warning(f"The format of sample {self.name} does not correspond to expected format. See {self.name}_error.json")
-					with open(f"{self.name}_error.json",'w') as fw:
-						json.dump(json_file, fw, indent=4)
-					sys.exit(1)
-
-			if (role == "father" and gender == "Female") or (role == "mother" and gender == "Male"):
-				logging.warning(f"Error, got role {role} and gender {gender} for patient {self.name}")
-			if role == "Unknown" or gender =="null" or status == "Unknown":
-				logging.warning(f"Patient status, role or gender could not be extracted from JSON file for patient {self.name}")
-				print(f"Please see file {self.name}_error.json for more info")
-				with open(f"{self.name}_error.json",'w') as fp:
-					json.dump(json_file,fp,indent=4)
-
-			if role == "father" or role == "mother":
-				role += f" of {proband_name}"
-				if affected:
-					logging.warning(f"Be aware: Parent is affected")
-
-			return {"Status": status, "Role": role, "Gender": gender, "Affected": affected}
-		else:
-			logging.warning(f"Patient {self.name} Emedgene JSON does not seem to contain patient info.")
-			print(f"Please see file {self.name}_error.json for more info")
-			with open(f"{self.name}_error.json",'w') as fp:
-				json.dump(json_file,fp,indent=4)
-			return {"Status": "Unknown", "Role":"Unknown", "Gender":"null","Affected": None}
+		return find_status(json_file, self.name)
 		
 	def write_singleton_samplesheet(self):
 		"""
@@ -203,8 +210,7 @@ class Sample:
 		
 		sample_file= f"{self.samplesheet_directory}/{self.run_id}_{self.well}_{self.name}.json"
 		print(f"Writing samplesheet to {sample_file}")
-		with open(sample_file, 'w') as fw:
-			json.dump(sample_dict, fw, indent=4)
+		write_json(sample_file, sample_dict)
 
 
 
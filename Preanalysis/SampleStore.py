@@ -0,0 +1,156 @@
+import sys,os
+import sqlite3
+import logging
+import argparse
+
+"""
+Indexed store of the samples retrieved by getSamples.py, replacing the semicolon-delimited mySampleList.txt.
+Samples are kept in SQLite, indexed on Name and run_id, with one row per (Name, run_id, Well).
+The text format can still be imported and exported:
+python3 Preanalysis/SampleStore.py import mySampleList.txt -l mySampleList.db
+python3 Preanalysis/SampleStore.py export mySampleList.txt -l mySampleList.db
+"""
+
+COLUMNS = ["Name","Well","Barcode","run_id","Gender","Status","Role","HPO","BAM","Affected"]
+
+class SampleStore:
+	"""
+	SQLite sample list. Rows are returned as dicts with the keys of COLUMNS, all values are str
+	"""
+	def __init__(self, path="mySampleList.db"):
+		if path.endswith(".txt"):
+			logging.warning(f"{path} looks like a text sample list. Import it first with: python3 Preanalysis/SampleStore.py import {path} -l {path.removesuffix('.txt')}.db")
+			sys.exit(1)
+		self.path	= path
+		self._db	= sqlite3.connect(path, timeout=30)
+		self._db.row_factory = sqlite3.Row
+		with self._db:
+			self._db.execute(f"""CREATE TABLE IF NOT EXISTS samples (
+				{", ".join(f"{column} TEXT NOT NULL DEFAULT ''" for column in COLUMNS)},
+				UNIQUE (Name, run_id, Well))""")
+			self._db.execute("CREATE INDEX IF NOT EXISTS samples_name ON samples (Name)")
+			self._db.execute("CREATE INDEX IF NOT EXISTS samples_run ON samples (run_id)")
+			self._db.execute("CREATE INDEX IF NOT EXISTS samples_role ON samples (Role)")
+
+	def add_rows(self, rows):
+		"""
+		Insert rows (dicts or sequences in the order of COLUMNS) in a single transaction.
+		Rows already in the store (same Name, run_id and Well) are skipped.
+		Returns: int, number of rows inserted
+		"""
+		values = []
+		for row in rows:
+			if isinstance(row, dict):
+				row = [row.get(column, "") for column in COLUMNS]
+			values.append(["" if value is None else str(value) for value in row])
+		with self._db:
+			before = self._db.total_changes
+			self._db.executemany(f"INSERT OR IGNORE INTO samples ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", values)
+			return self._db.total_changes - before
+
+	def add_samples(self, samples):
+		"""
+		Insert Sample objects in a single transaction, see add_rows
+		"""
+		return self.add_rows(sample_row(sample) for sample in samples)
+
+	def find(self, name):
+		"""
+		Returns: List of the rows for sample `name` (usually one)
+		"""
+		return self._select("WHERE Name = ?", (name,))
+
+	def run_samples(self, run_id):
+		"""
+		Returns: List of the rows of run `run_id`, sorted by well
+		"""
+		return self._select("WHERE run_id = ? ORDER BY lower(Well)", (run_id,))
+
+	def find_parents(self, proband):
+		"""
+		Returns: List of the rows recorded as "mother of {proband}" or "father of {proband}", in any run
+		"""
+		return self._select("WHERE Role IN (?, ?)", (f"mother of {proband}", f"father of {proband}"))
+
+	def run_wells(self, run_id):
+		"""
+		Returns: Set of the wells of run `run_id` already in the store
+		"""
+		return {row["Well"] for row in self.run_samples(run_id)}
+
+	def all_samples(self):
+		return self._select("ORDER BY rowid", ())
+
+	def _select(self, clause, parameters):
+		cursor = self._db.execute(f"SELECT {', '.join(COLUMNS)} FROM samples {clause}", parameters)
+		return [dict(row) for row in cursor]
+
+	def import_text(self, text_path):
+		"""
+		Import a semicolon-delimited sample list (mySampleList.txt format, no header)
+		Returns: tuple (rows read, rows inserted)
+		"""
+		rows = []
+		with open(text_path) as fr:
+			for line_number, line in enumerate(fr, 1):
+				line = line.rstrip("\n")
+				if not line.strip():
+					continue
+				fields = line.split(";")
+				if len(fields) != len(COLUMNS):
+					logging.warning(f"{text_path}:{line_number} has {len(fields)} fields instead of {len(COLUMNS)}, skipping: {line}")
+					continue
+				rows.append(fields)
+		return len(rows), self.add_rows(rows)
+
+	def export_text(self, text_path):
+		"""
+		Write the whole store in the semicolon-delimited mySampleList.txt format
+		Returns: int, number of rows written
+		"""
+		rows = self.all_samples()
+		with open(text_path, 'w') as fw:
+			for row in rows:
+				fw.write(";".join(row[column] for column in COLUMNS) + "\n")
+		return len(rows)
+
+	def close(self):
+		self._db.close()
+
+
+def sample_row(sample):
+	"""
+	Returns: Dict of the sample list columns for a Sample object
+	"""
+	return {
+		"Name": sample.name,
+		"Well": sample.well,
+		"Barcode": sample.barcode,
+		"run_id": sample.run_id,
+		"Gender": sample.case_status["Gender"],
+		"Status": sample.case_status["Status"],
+		"Role": sample.case_status["Role"],
+		"HPO": sample.phenotypes,
+		"BAM": sample.bam_path,
+		"Affected": sample.case_status["Affected"]}
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		prog = 'SampleStore.py',
+		usage = "python3 %(prog)s [import|export] text_sample_list [-l sample_store]",
+		description='Import a text sample list (mySampleList.txt format) into the sample store, or export the store to that format')
+	parser.add_argument('action', choices=['import', 'export'])
+	parser.add_argument('text_list', help='Semicolon-delimited sample list, without header')
+	parser.add_argument('-l', '--list', nargs='?', const='mySampleList.db', default='mySampleList.db', help='Sample store (SQLite)')
+	args = parser.parse_args(argv)
+
+	store = SampleStore(args.list)
+	if args.action == "import":
+		read, inserted = store.import_text(args.text_list)
+		print(f"Imported {inserted} samples from {args.text_list} into {args.list} ({read - inserted} already present)")
+	else:
+		written = store.export_text(args.text_list)
+		print(f"Exported {written} samples from {args.list} to {args.text_list}")
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,117 @@
+import os
+import pickle
+import hashlib
+import tempfile
+
+"""
+Pragmatiq study table (csv downloaded from the Sharepoint), indexed on the specimen identifier.
+Only the columns used by getStudy.py are parsed, and a columnar copy is cached (by default in ~/.cache/pacbiowgs):
+the csv is only parsed again when its size and modification time changed and its content (sha256) is different.
+"""
+
+DEFAULT_CACHE_DIR	= "~/.cache/pacbiowgs"
+SPECIMEN			= "Identifiant : Specimen"
+COHORT				= "Cohorte"
+#Columns read from the csv, with their type. Changing them invalidates the cached copies
+STUDY_COLUMNS = {
+	SPECIMEN:					"string",
+	"Identifiant : probant":	"string",
+	"Identifiant père":			"string",
+	"Identifiant mère":			"string",
+	"Commentaires":				"string",
+	COHORT:						"category",
+}
+
+def file_sha256(path):
+	digest = hashlib.sha256()
+	with open(path, 'rb') as fr:
+		for block in iter(lambda: fr.read(1 << 20), b""):
+			digest.update(block)
+	return digest.hexdigest()
+
+class StudyTable:
+	"""
+	Study information of the specimens of a Pragmatiq csv
+	- `csv_path`: Pragmatiq csv
+	- `cache_dir`: directory of the cached copy, None to always parse the csv
+	"""
+	def __init__(self, csv_path, cache_dir=DEFAULT_CACHE_DIR):
+		self.csv_path	= os.path.realpath(csv_path)
+		self.cache_path	= None
+		if cache_dir is not None:
+			key = hashlib.sha1(self.csv_path.encode()).hexdigest()[:16]
+			self.cache_path = os.path.join(os.path.expanduser(cache_dir), f"study-{key}.pkl")
+		self.from_cache	= False
+		self.table		= self._load()
+
+	def _load(self):
+		"""
+		Returns: DataFrame of STUDY_COLUMNS indexed (and sorted) on the specimen
+		Raises: FileNotFoundError if the csv does not exist, ValueError if a column is missing
+		"""
+		stat = os.stat(self.csv_path)
+		cached = self._read_cache()
+		if cached is not None and cached["columns"] == STUDY_COLUMNS:
+			if (cached["size"], cached["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+				self.from_cache = True
+				return cached["table"]
+			#Same content downloaded again: only the modification time changed
+			if cached["size"] == stat.st_size and cached["sha256"] == file_sha256(self.csv_path):
+				self.from_cache = True
+				self._write_cache(cached["table"], stat, cached["sha256"])
+				return cached["table"]
+
+		import pandas as pd
+		table = pd.read_csv(self.csv_path, usecols=list(STUDY_COLUMNS), dtype=STUDY_COLUMNS)
+		table = table[table[SPECIMEN].notna()].set_index(SPECIMEN).sort_index(kind="stable")
+		self._write_cache(table, stat, file_sha256(self.csv_path))
+		return table
+
+	def _read_cache(self):
+		if self.cache_path is None or not os.path.isfile(self.cache_path):
+			return None
+		try:
+			with open(self.cache_path, 'rb') as fr:
+				return pickle.load(fr)
+		except Exception:
+			#Unreadable copy (interrupted write, other pandas version...): parse the csv again
+			return None
+
+	def _write_cache(self, table, stat, sha256):
+		if self.cache_path is None:
+			return
+		directory = os.path.dirname(self.cache_path)
+		os.makedirs(directory, exist_ok=True)
+		fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.cache_path)}.", suffix=".tmp")
+		try:
+			with os.fdopen(fd, 'wb') as fw:
+				pickle.dump({"columns": STUDY_COLUMNS, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+					"sha256": sha256, "table": table}, fw, protocol=pickle.HIGHEST_PROTOCOL)
+			os.replace(tmp_path, self.cache_path)
+		except BaseException:
+			os.unlink(tmp_path)
+			raise
+
+	def lookup(self, specimens):
+		"""
+		- `specimens`: list of specimen identifiers, in the order in which they should be returned
+		Returns: DataFrame of STUDY_COLUMNS, one row per specimen of the list (empty if not found, several if the csv has duplicates)
+		"""
+		import pandas as pd
+		wanted = pd.DataFrame(index=pd.Index(specimens, dtype="string", name=SPECIMEN))
+		return wanted.join(self.table, how="left").reset_index()[list(STUDY_COLUMNS)]
+
+	def cohort_summary(self, result):
+		"""
+		- `result`: DataFrame returned by lookup
+		Returns: Series {cohort: number of specimens}, with the specimens not in the csv counted as "Not found"
+		"""
+		found = result[SPECIMEN].isin(self.table.index)
+		cohorts = result[COHORT].astype("string").fillna("No cohort").where(found, "Not found")
+		return cohorts.value_counts().rename("Specimens")
+
+	def __contains__(self, specimen):
+		return specimen in self.table.index
+
+	def __len__(self):
+		return len(self.table)
@@ -0,0 +1,102 @@
+import os
+import json
+import time
+import stat
+import logging
+import threading
+
+#Emedgene tokens expire after 8H, we refresh a bit before that to avoid a 403 mid-run
+TOKEN_LIFETIME	= 8 * 3600
+REFRESH_MARGIN	= 30 * 60
+
+class TokenCache:
+	"""
+	Keeps authorization tokens in memory, and optionally in a file only readable by the user,
+	so they can be reused across calls and across processes until they are close to expiring.
+	Tokens are stored per key (ex.: "{server}|{username}")
+	"""
+	_memory	= {}
+	_lock	= threading.RLock()
+
+	def __init__(self, key, path="", lifetime=TOKEN_LIFETIME, margin=REFRESH_MARGIN):
+		self.key		= key
+		self.path		= os.path.expanduser(path) if path else ""
+		self.lifetime	= lifetime
+		self.margin		= margin
+
+	def get(self):
+		"""
+		Returns the cached token if it is still fresh, otherwise None
+		Looks in memory first, then in the token file if one is configured
+		"""
+		with TokenCache._lock:
+			entry = TokenCache._memory.get(self.key)
+			if entry is None and self.path:
+				entry = self._read_file().get(self.key)
+				if entry is not None:
+					TokenCache._memory[self.key] = entry
+			if entry is not None and self._is_fresh(entry):
+				return entry["token"]
+			return None
+
+	def store(self, token):
+		"""
+		Saves a newly acquired token in memory and in the token file
+		"""
+		entry = {"token": token, "acquired": time.time()}
+		with TokenCache._lock:
+			TokenCache._memory[self.key] = entry
+			if self.path:
+				entries = self._read_file()
+				entries[self.key] = entry
+				self._write_file(entries)
+
+	def invalidate(self):
+		"""
+		Forget the token, ex.: after the server refused it with 401/403
+		"""
+		with TokenCache._lock:
+			TokenCache._memory.pop(self.key, None)
+			if self.path:
+				entries = self._read_file()
+				if entries.pop(self.key, None) is not None:
+					self._write_file(entries)
+
+	def get_or_fetch(self, fetch, force=False):
+		"""
+		Returns a fresh token, calling `fetch` (no arguments, returns a token) only if needed
+		- `force`: ignore the cached token and fetch a new one
+		"""
+		with TokenCache._lock:
+			token = None if force else self.get()
+			if token is None:
+				token = fetch()
+				self.store(token)
+			return token
+
+	def _is_fresh(self, entry):
+		age = time.time() - entry.get("acquired", 0)
+		return 0 <= age < self.lifetime - self.margin
+
+	def _read_file(self):
+		if not os.path.isfile(self.path):
+			return {}
+		#Refuse to use a token file that other users could read
+		if stat.S_IMODE(os.stat(self.path).st_mode) & 0o077:
+			logging.warning(f"Token cache {self.path} is readable by other users, ignoring it. Use chmod 600")
+			return {}
+		try:
+			with open(self.path) as fr:
+				return json.load(fr)
+		except (OSError, ValueError) as e:
+			logging.warning(f"Could not read token cache {self.path}: {e}")
+			return {}
+
+	def _write_file(self, entries):
+		directory = os.path.dirname(os.path.abspath(self.path))
+		os.makedirs(directory, exist_ok=True)
+		tmp_path = f"{self.path}.{os.getpid()}.tmp"
+		fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+		with os.fdopen(fd, 'w') as fw:
+			json.dump(entries, fw)
+		os.replace(tmp_path, self.path)
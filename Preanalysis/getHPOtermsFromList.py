@@ -4,7 +4,9 @@ import subprocess
 import logging
 import glob
 import json
+import argparse
 from Emedgene import Emedgene
+from RecordCache import OfflineMiss
 
 """
 Simple script relying on the Emedgene class to retrieve the HPO terms from Phenotips
@@ -15,29 +17,44 @@ GMYYYY
 The HPO terms will be written in file 'returnHPO.txt'
 """
 
-if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python script.py <sample_name_list>")
-        sys.exit(1)
-    with open(sys.argv[1]) as f:
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog = 'getHPOtermsFromList.py',
+        usage = "python3 %(prog)s <sample_name_list> [--refresh | --offline] [--config config_file (optional)]",
+        description='Retrieve the Phenotips HPO terms of each sample in the list, written to returnHPO.txt')
+    parser.add_argument('sample_name_list', help='File containing one sample name per line')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the local Emedgene/Phenotips cache and fetch everything again')
+    parser.add_argument('--offline', action='store_true', help='Only use the local Emedgene/Phenotips cache, never contact the services')
+    parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
+    args = parser.parse_args(argv)
+
+    with open(args.sample_name_list) as f:
         nameList = f.read().splitlines()
     print(nameList)
+    emedgene = Emedgene(config_file=args.config, refresh=args.refresh, offline=args.offline)
     hpoList=[]
     print("Retrieving HPO terms for each provided sample:")
     for name in nameList:
         print("-----------")
         print(f"Name :{name}")
-        emg_id=Emedgene().get_emg_id(name)
-        if not ("EMG" in emg_id):
-            logging.warning(f"{name} not found on Emedgene")
+        try:
+            emg_id=emedgene.get_emg_id(name)
+            if not (isinstance(emg_id, str) and "EMG" in emg_id):
+                logging.warning(f"{name} not found on Emedgene")
+                hpoList.append("None")
+                continue
+            print("emg output:",emg_id)
+            pheno_id=emedgene.get_pheno_id(sample=emg_id)
+            print("pheno ID:",pheno_id)
+            hpo=emedgene.phenotips_import_HPO_request(pheno_id)
+        except OfflineMiss:
             hpoList.append("None")
             continue
-        print("emg output:",emg_id)
-        pheno_id=Emedgene().get_pheno_id(sample=emg_id)
-        print("pheno ID:",pheno_id)
-        hpo=Emedgene().phenotips_import_HPO_request(pheno_id)
         hpo=hpo.replace(",",";")
         hpoList.append(hpo)
     print("Find the line-by-line list of HPO terms in 'returnHPO.txt'")
     with open("returnHPO.txt",'w') as fo:
-        for term in hpoList: fo.write(f"{term}\n")
\ No newline at end of file
+        for term in hpoList: fo.write(f"{term}\n")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,17 @@
 import sys,os
 import json
-import subprocess
 import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from Sample import Sample
-from pathlib import Path
-from configurator import Config
-import pandas as pd
+from Emedgene import Emedgene
+from CaseResolver import CaseResolver
+from ReadSetMetadata import read_well_metadata
+from RunIndex import RunIndex, index_dir
+from SampleStore import SampleStore
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from HttpClient import HttpClient
+from configLoader import load_config
 
 """
 Retrieves samples info from Emedgene and Phenotips.
@@ -13,77 +19,132 @@ Give the run name (ie r84196_20250210_150130) as argument and a config file, opt
 the run folder must be present in the run_path specified in the config file (see ../.myconf.json for an example)
 Will write the retrieved samples to a sample list that will be used to write the samplesheets
 """
-if __name__ == "__main__":
+
+def resolve_well(run_id, well, run_index, config_file, resolver=None):
+	"""
+	Build the Sample contained in a well folder (ex 1_A01), including the Emedgene and Phenotips lookups
+	- `run_index`: RunIndex of the run, giving the files of the well
+	- `resolver`: CaseResolver shared by all wells, so each Emedgene case is fetched once per family
+	Returns: Sample
+	"""
+	#The sample name is contained in the consensusreadset.xml metadata file, in the pb_format folder
+	well_files = run_index.well(well)
+	metadata = read_well_metadata(well_files["path"], xml_paths=well_files["xml"])
+	if metadata is None or not metadata["biosample_name"]:
+		logging.warning(f"Could not find the BioSample name of well {well_files['path']}")
+		sys.exit(1)
+	given_name = metadata["biosample_name"]
+
+	#Special case for Decodeur Samples
+	if given_name[0:3] == "HSJ":
+		family_name = given_name[:-3]
+		if given_name[-2:] == "03" or given_name[-2:] == "04":
+			role = "proband"
+			gender = "null"
+		elif given_name[-2:] == "02":
+			role = f"mother of {family_name}-03"
+			gender = "Female"
+		elif given_name[-2:] == "01":
+			role = f"father of {family_name}-03"
+			gender = "Male"
+		else:
+			print(f"Decodeur name didn't end with 01,02,03 or 04? Received:{given_name[-2:]}")
+			sys.exit()
+
+		status = {"Status": "Decodeur", "Role":role, "Gender":gender, "Affected": False}
+		print(f"Status for {given_name}: {status}")
+	else:
+		status = {}
+
+	#Resolve everything here so the lookups happen in the worker threads
+	return Sample(run_id,well,given_name,status=status,config_file=config_file,resolver=resolver).resolve()
+
+def resolve_wells(run_id, run_index, config_file, jobs=1, resolver=None):
+	"""
+	Resolve every well of the run index, using up to `jobs` threads (the work is mostly waiting on the APIs)
+	A well that fails is reported and does not stop the others.
+	Returns: tuple (list of Sample, dict {well: error message})
+	"""
+	def resolve(well):
+		try:
+			return resolve_well(run_id, well, run_index, config_file, resolver), None
+		except (Exception, SystemExit) as e:
+			return None, f"{e.__class__.__name__}: {e}"
+
+	well_names = run_index.well_names()
+	with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+		results = list(executor.map(resolve, well_names))
+
+	sample_list = []
+	failed_wells = {}
+	for well, (sample, error) in zip(well_names, results):
+		if sample is None:
+			failed_wells[well] = error
+		else:
+			sample_list.append(sample)
+	return sample_list, failed_wells
+
+def main(argv=None):
 
 	parser = argparse.ArgumentParser(
 		prog = 'getSample.py',
-		usage = "python3 %(prog)s [-r run_id] [--config config_file (optional)]",	
+		usage = "python3 %(prog)s [-r run_id] [--jobs N (optional)] [--config config_file (optional)]",
 		description='given a run_id, retrieve the samples included within. Prints them to run_ID_sample for future use')
-	parser.add_argument('-r', '--run',help='Run id from Revio, should link to a directory with the same name contained in config args.Path.run_path',required=True) 
-	parser.add_argument('-l', '--list', nargs='?', const='mySampleList.txt', default='mySampleList.txt')
+	parser.add_argument('-r', '--run',help='Run id from Revio, should link to a directory with the same name contained in config args.Path.run_path',required=True)
+	parser.add_argument('-l', '--list', nargs='?', const='mySampleList.db', default='mySampleList.db', help='Sample store (see SampleStore.py)')
 	parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
-	
-	args		= parser.parse_args()
-	configs  	= Config.from_path(args.config)
+	parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of wells resolved in parallel (default: 1)')
+	parser.add_argument('--refresh', action='store_true', help='Ignore the local Emedgene/Phenotips cache and run index, fetch everything again')
+	parser.add_argument('--offline', action='store_true', help='Only use the local Emedgene/Phenotips cache, never contact the services')
+
+	args		= parser.parse_args(argv)
+	configs  	= load_config(args.config)
 
 	run_path	= configs.Paths.run_path
-	run_folder	= Path(run_path + args.run)
+	run_folder	= run_path + args.run
 	sample_sheet_path	= configs.Paths.sample_sheet_path
 
+	if not os.path.isdir(run_folder):
+		print("Error: No samples found for the given run ID. Check directory path? In conf:")
+		print(f"run_path: {run_path}")
+		sys.exit(1)
+
 	#For our run, each sample is contained in a "well" folder (ex 1_A01, 1_B01...)
-	directory_list		= [f for f in run_folder.resolve().glob('*') if not f.is_file()]
-	sample_list	= []
+	#The run directory is indexed once, Sample lookups then use the same index
+	run_index	= RunIndex.load(run_path, args.run, index_dir=index_dir(configs), refresh=args.refresh)
 
 	#For each well folder, we need to retrieve the sample name from the metadata file
-	for well_folder in directory_list:
-		#The sample name is contained in this metadata file, in the pb_format folder
-		grep_command = f"grep -o \"BioSample Name=\".*\"\" {well_folder}/pb_formats/*_s*.hifi_reads.bc*.consensusreadset.xml | cut -f2 -d'\"' | tr -d '\n'"
-		grep_result = subprocess.run(grep_command, shell=True, capture_output=True, text=True)
-		given_name = grep_result.stdout
-
-		#Special case for Decodeur Samples
-		if given_name[0:3] == "HSJ":
-			family_name = given_name[:-3]
-			if given_name[-2:] == "03" or given_name[-2:] == "04":
-				role = "proband"
-				gender = "null"
-			elif given_name[-2:] == "02":
-				role = f"mother of {family_name}-03"
-				gender = "Female"
-			elif given_name[-2:] == "01":
-				role = f"father of {family_name}-03"
-				gender = "Male"
-			else:
-				print(f"Decodeur name didn't end with 01,02,03 or 04? Received:{given_name[-2:]}")
-				sys.exit()
-
-			status = {"Status": "Decodeur", "Role":role, "Gender":gender, "Affected": False}
-			print(f"Status for {given_name}: {status}")
-		else:
-			status = {}
-
+	emedgene = Emedgene(config_file=args.config, refresh=args.refresh, offline=args.offline)
+	resolver = CaseResolver(emedgene)
+	sample_list, failed_wells = resolve_wells(args.run, run_index, args.config, jobs=args.jobs, resolver=resolver)
 
-		well = str(well_folder).split("/")[-1]
-		sample = Sample(args.run,well,given_name,status=status,config_file=args.config)
-		sample_list.append(sample)
-
-	if not sample_list:
+	if not sample_list and not failed_wells:
 		print("Error: No samples found for the given run ID. Check directory path? In conf:")
 		print(f"run_path: {run_path}")
 		sys.exit(1)
 
 	#Print the samples sorted by well (1_A01, 1_B01...)
 	sorted_list = sorted(sample_list,key=lambda x: x.well.lower())
-	for sample in sorted_list: 
+	for sample in sorted_list:
 		print(sample)
+	HttpClient.print_latency_summary()
 
-	#Check to see if the run_ID is already in the list
+	#Check to see if the samples are already in the list
 	#Having duplicates would cause problems later
-	existing_list = pd.read_csv(args.list,sep=";",names=["Name","Well","Barcode","run_id","Gender","Status","Role","HPO","BAM","Affected"])
+	store = SampleStore(args.list)
+	existing_wells = store.run_wells(args.run)
 
-	if args.run in existing_list["run_id"].values:
-		print(f"Warning: Samples from run id {args.run} are already in the list. Skipping append")
-	else:
-		for sample in sorted_list:
-			with open(args.list, "a") as fw:
-				fw.write(f"{sample.__str__()};{sample.bam_path};{sample.case_status['Affected']}\n")
+	if existing_wells:
+		print(f"Warning: Samples from run id {args.run} are already in the list. Skipping wells: {sorted(existing_wells, key=str.lower)}")
+	inserted = store.add_samples(sample for sample in sorted_list if sample.well not in existing_wells)
+	print(f"Added {inserted} samples to {args.list}")
+
+	if failed_wells:
+		logging.warning(f"{len(failed_wells)} well(s) could not be resolved and were not added to the list:")
+		for well in sorted(failed_wells, key=str.lower):
+			print(f"{well}: {failed_wells[well]}")
+		print("Fix these wells and run again, wells already in the list will be skipped")
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -1,76 +1,84 @@
-import pandas as pd
 import argparse
 import sys
+from StudyTable import StudyTable, DEFAULT_CACHE_DIR, SPECIMEN, COHORT
 
-def get_study_info(main_csv_path, specimen_list_path):
+def get_study_info(main_csv_path, specimen_list_paths, cache_dir=DEFAULT_CACHE_DIR):
 	"""
-	Reads a main CSV and a list of specimens, then prints selected columns
-	for the union of specimens found in both sources.
+	Reads a main CSV and lists of specimens, then prints selected columns
+	for the specimens of each list, followed by a summary of their cohorts.
+	The CSV is read once (or from its cached copy) for all the lists.
 
 	Args:
 		main_csv_path (str): Path to the main CSV file.
-		specimen_list_path (str): Path to a line-separated file of specimen names.
+		specimen_list_paths (list): Paths to line-separated files of specimen names.
+		cache_dir (str): Directory of the cached copy of the main CSV, None to always read the CSV.
 	"""
+	import pandas as pd
+	if isinstance(specimen_list_paths, str):
+		specimen_list_paths = [specimen_list_paths]
 	try:
-		# Read the main CSV file
-		df = pd.read_csv(main_csv_path)
+		study = StudyTable(main_csv_path, cache_dir=cache_dir)
+		summaries = {}
+		for specimen_list_path in specimen_list_paths:
+			specimens_to_find = pd.read_csv(specimen_list_path, names=[SPECIMEN], header=None, dtype=str)[SPECIMEN].str.strip()
 
-		# Get the set of all specimen identifiers from the main CSV
-		all_specimens_in_csv = set(df["Identifiant : Specimen"].dropna())
+			# Rows in the order of the list, empty when the specimen is not in the main CSV
+			result_df = study.lookup(specimens_to_find)
+			if len(specimen_list_paths) > 1:
+				print(f"------{specimen_list_path}------")
+			result_df.to_csv(sys.stdout, index=False)
+			print("------Only cohorts------:")
+			only_cohort = result_df[COHORT]
+			print(f"Total specimens in list file: {specimens_to_find.shape[0]}")
 
-		# Create a DataFrame from the list of specimens to be used as the left side of the join
-		#specimens_to_find_df = pd.DataFrame(specimens_from_file, columns=["Identifiant : Specimen"])
-		specimens_to_find_df = pd.read_csv(specimen_list_path, names=["Identifiant : Specimen"], header=None)
+			print(f"Lines in filtered list: {only_cohort.shape[0]}")
+			only_cohort.to_csv(sys.stdout, index=False)
+			summaries[specimen_list_path] = study.cohort_summary(result_df)
+			print("------Cohort summary------:")
+			summaries[specimen_list_path].to_csv(sys.stdout, header=False)
 
-		# Perform a left join. The order of the keys from the left frame is preserved.
-		filtered_df = pd.merge(specimens_to_find_df, df, on="Identifiant : Specimen", how="left", sort=False)
-
-		# Define the columns to be printed
-		columns_to_print = [
-			"Identifiant : Specimen",
-			"Identifiant : probant",
-			"Identifiant père",
-			"Identifiant mère",
-			"Commentaires",
-			"Cohorte"
-		]
-
-		# Select and print the required columns to stdout
-		result_df = filtered_df[columns_to_print]
-		result_df.to_csv(sys.stdout, index=False)
-		print("------Only cohorts------:")
-		only_cohort = filtered_df["Cohorte"]
-		print(f"Total specimens in list file: {specimens_to_find_df.shape[0]}")
-
-		print(f"Lines in filtered list: {only_cohort.shape[0]}")
-		only_cohort.to_csv(sys.stdout, index=False)
+		if len(specimen_list_paths) > 1:
+			print("------Cohort summary of all lists------:")
+			pd.DataFrame(summaries).fillna(0).astype(int).to_csv(sys.stdout)
 
 	except FileNotFoundError as e:
 		print(f"Error: File not found - {e}", file=sys.stderr)
 		sys.exit(1)
-	except KeyError as e:
+	except (KeyError, ValueError) as e:
 		print(f"Error: Column not found in CSV - {e}. Please check the CSV header.", file=sys.stderr)
 		sys.exit(1)
 	except Exception as e:
 		print(f"An unexpected error occurred: {e}", file=sys.stderr)
 		sys.exit(1)
 
-if __name__ == "__main__":
+def main(argv=None):
 	parser = argparse.ArgumentParser(
 		prog = 'getStudy.py',
-		usage = "python3 %(prog)s [-s lineSeparated_id_list] [-p pragmatiq_csv ]",	
+		usage = "python3 %(prog)s [-s lineSeparated_id_list [lineSeparated_id_list ...]] [-p pragmatiq_csv ] [--cache-dir dir | --no-cache]",	
 		description="Extracts study information for a given list of specimens."
 	)
 	parser.add_argument(
-		"-s",help="Path to a file containing a line-separated list of identifier for which you need the study",
-		required=True
+		"-s",help="Path to one or more files containing a line-separated list of identifier for which you need the study",
+		required=True, nargs="+"
 	)
 	parser.add_argument(
 		"-p",help="Path to a pragmatiq csv downloaded from the Sharepoint",
 		required=True
 	)
 
-	args = parser.parse_args()
+	parser.add_argument(
+		"--cache-dir",help=f"Directory of the cached copy of the pragmatiq csv (default: {DEFAULT_CACHE_DIR})",
+		default=DEFAULT_CACHE_DIR
+	)
+	parser.add_argument(
+		"--no-cache",help="Always read the pragmatiq csv, without using or writing the cached copy",
+		action="store_true"
+	)
+
+	args = parser.parse_args(argv)
 	main_csv_file = args.p
-	specimen_list = args.s
-	get_study_info(main_csv_file, specimen_list)
\ No newline at end of file
+	specimen_lists = args.s
+	get_study_info(main_csv_file, specimen_lists, cache_dir=None if args.no_cache else args.cache_dir)
+
+if __name__ == "__main__":
+	main()
@@ -2,59 +2,178 @@ import sys,os
 import json
 import subprocess
 import argparse
+import csv
 from Sample import Sample
 from pathlib import Path
-from configurator import Config
-import pandas as pd
-import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from configLoader import load_config
 from Family import Family
+from SampleStore import SampleStore
 
 """
 Generate the WDL samplesheet for given family (duo, trio...).
 Give the sample info (obtained from the sampleList generated by getSamples.py) as argument and a config file, optionally
 """
 
-def retrieve_samples(full_list,sample_ID):
-	#Given the list of samples and the ID of a sample, retrieve all sample info from sample list
+def retrieve_samples(store,sample_ID,config_file=".myconf.json"):
+	#Given the sample store and the ID of a sample, retrieve all sample info from sample list
 	#Return a Sample Object
-	sample_row = full_list[full_list["Name"]==sample_ID]
-	if sample_row.shape[0] == 0:
-		print(f"Sample {sample_ID} was not found in sample list: {full_list}")
-		sys.exit()
-	elif sample_row.shape[0] > 1:
-		print(f"More than one match detected in list for sample {sample_ID}")
+	try:
+		return find_sample(store, sample_ID, config_file)
+	except LookupError as e:
+		print(e)
 		sys.exit()
+
+def find_sample(store,sample_ID,config_file=".myconf.json"):
+	#Same as retrieve_samples, but raises LookupError instead of exiting so batches can report every error
+	sample_rows = store.find(sample_ID)
+	if len(sample_rows) == 0:
+		raise LookupError(f"Sample {sample_ID} was not found in sample list: {store.path}")
+	elif len(sample_rows) > 1:
+		raise LookupError(f"More than one match detected in list for sample {sample_ID}")
+	return sample_from_row(sample_rows[0], config_file)
+
+def sample_from_row(sample_row,config_file=".myconf.json"):
+	#Build a Sample Object from a row of the sample store, without touching the network or the filesystem
 	sample_format = Sample(
-	sample_row["run_id"].values[0],
-	sample_row["Well"].values[0],
-	name=sample_row["Name"].values[0],
-	bam_path=sample_row["BAM"].values[0],
+	sample_row["run_id"],
+	sample_row["Well"],
+	name=sample_row["Name"],
+	barcode=sample_row["Barcode"],
+	bam_path=sample_row["BAM"],
 	status={
-		"Status":sample_row["Status"].values[0], 
-		"Role":sample_row["Role"].values[0], 
-		"Gender":sample_row["Gender"].values[0], 
-		"Affected": sample_row["Affected"].values[0]
+		"Status":sample_row["Status"], 
+		"Role":sample_row["Role"], 
+		"Gender":sample_row["Gender"], 
+		"Affected": sample_row["Affected"]
 		},
-	HPOs=sample_row["HPO"].values[0])
+	HPOs=sample_row["HPO"],
+	config_file=config_file)
 	return sample_format
 
-if __name__ == "__main__":
+#Empty pedigree cells, or the PED convention for a missing parent
+MISSING_MEMBER = {"", "0", ".", "NA", "-"}
+
+def read_pedigree(pedigree_path):
+	"""
+	Read a pedigree table, tab or comma separated, with one family per line:
+	family_id, proband, mother, father, siblings (optional, separated by ';')
+	A header line starting with "family" is skipped.
+	Returns: List of dicts {"family_id", "proband", "mother", "father", "siblings", "line"}
+	"""
+	with open(pedigree_path, newline='') as fr:
+		text = fr.read()
+	delimiter = "\t" if "\t" in text.split("\n", 1)[0] else ","
+	families = []
+	for line_number, fields in enumerate(csv.reader(text.splitlines(), delimiter=delimiter), 1):
+		fields = [field.strip() for field in fields]
+		if len(fields) == 0 or fields[0] == "" or fields[0].startswith("#"):
+			continue
+		if line_number == 1 and fields[0].lower().startswith("family"):
+			continue
+		fields += [""] * (5 - len(fields))
+		member = lambda field: None if field in MISSING_MEMBER else field
+		families.append({
+			"family_id": fields[0],
+			"proband": member(fields[1]),
+			"mother": member(fields[2]),
+			"father": member(fields[3]),
+			"siblings": [name.strip() for name in fields[4].split(";") if name.strip() not in MISSING_MEMBER],
+			"line": line_number})
+	return families
+
+def build_family(pedigree, store, config_file=".myconf.json"):
+	"""
+	Build the Family of one pedigree line, from the samples in the store
+	Returns: tuple (Family or None, list of error messages)
+	"""
+	errors = []
+	if pedigree["proband"] is None:
+		errors.append("no proband given")
+	if pedigree["mother"] is None and pedigree["father"] is None:
+		errors.append("at least one parent required for joint call")
+
+	sample_group = {"siblings": []}
+	for role in ["proband", "mother", "father"]:
+		if pedigree[role] is None:
+			continue
+		try:
+			sample = find_sample(store, pedigree[role], config_file)
+		except LookupError as e:
+			errors.append(str(e))
+			continue
+		#A parent recorded with the other parent's role is likely swapped in the pedigree
+		recorded_role = str(sample.case_status["Role"]).split(" ")[0]
+		if role != "proband" and recorded_role in ("mother", "father") and recorded_role != role:
+			errors.append(f"{sample.name} is given as {role} but is recorded as {sample.case_status['Role']}")
+		sample_group[role] = sample
+	for sibling_name in pedigree["siblings"]:
+		try:
+			sample_group["siblings"].append(find_sample(store, sibling_name, config_file))
+		except LookupError as e:
+			errors.append(str(e))
+
+	if errors:
+		return None, errors
+	return Family(pedigree["family_id"], sample_group, config_file=config_file), []
+
+def write_pedigree_families(pedigree_path, store, config_file=".myconf.json"):
+	"""
+	Write the samplesheet and batch file of every valid family of the pedigree.
+	Families with errors are skipped, all errors are returned at the end.
+	Returns: tuple (list of written family ids, dict {family_id: list of error messages})
+	"""
+	written = []
+	errors = {}
+	seen = set()
+	for pedigree in read_pedigree(pedigree_path):
+		family_id = pedigree["family_id"]
+		if family_id in seen:
+			errors.setdefault(family_id, []).append(f"listed more than once (line {pedigree['line']})")
+			continue
+		seen.add(family_id)
+		family, family_errors = build_family(pedigree, store, config_file)
+		if family_errors:
+			errors[family_id] = family_errors
+			continue
+		print(family)
+		family.write_joint_samplesheet()
+		family.write_family_list()
+		family.write_reuse_report()
+		written.append(family_id)
+	return written, errors
+
+def main(argv=None):
 	parser = argparse.ArgumentParser(
 		prog = 'jointCallSampleSheet.py',
-		usage = "python3 %(prog)s [-n family_id -p proband_id -m mother_id -f father_id -l list] [--config config_file (optional)]",	
+		usage = "python3 %(prog)s [-n family_id -p proband_id -m mother_id -f father_id | --pedigree pedigree_file] [-l list] [--config config_file (optional)]",
 		description='given a family_id, retrieve the samples included within. Prints them to family_id_sample for future use')
-	parser.add_argument('-p', '--proband',help='proband sample name',required=True)
-	parser.add_argument('-n', '--name',help='Name given to trio (usually pXXX)',required=True) 
+	parser.add_argument('-p', '--proband',help='proband sample name')
+	parser.add_argument('-n', '--name',help='Name given to trio (usually pXXX)')
+	parser.add_argument('--pedigree',help='Table of families (family_id, proband, mother, father, siblings separated by ;), tab or comma separated. Writes the samplesheets of every family')
 
 	parser.add_argument('-m', '--mother', nargs='?',help='mother sample name') 
 	parser.add_argument('-f', '--father', nargs='?',help='father sample name') 
 
-	parser.add_argument('-l', '--list', nargs='?', const='mySampleList.txt', default='mySampleList.txt')
+	parser.add_argument('-l', '--list', nargs='?', const='mySampleList.db', default='mySampleList.db', help='Sample store (see SampleStore.py)')
 	parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
 	
-	args		= parser.parse_args()
-	configs  	= Config.from_path(args.config)
+	args		= parser.parse_args(argv)
+	configs  	= load_config(args.config)
 	sample_sheet_path = configs.Paths.sample_sheet_path
+
+	if args.pedigree is not None:
+		written, errors = write_pedigree_families(args.pedigree, SampleStore(args.list), args.config)
+		print(f"Wrote samplesheets for {len(written)} families")
+		if errors:
+			print(f"{len(errors)} families could not be written:")
+			for family_id, family_errors in errors.items():
+				for error in family_errors: print(f"{family_id}: {error}")
+			sys.exit(1)
+		sys.exit()
+	if args.proband is None or args.name is None:
+		parser.error("-p and -n are required unless --pedigree is given")
+
 	family_ids = [args.proband]
 	#Check member args
 	print(f"Parents: mother:{args.mother}, father:{args.father}")
@@ -67,22 +186,19 @@ if __name__ == "__main__":
 		family_ids.append(args.father)
 	
 	#Find the samples from the list
-	sample_list = pd.read_csv(args.list,sep=";",names=["Name","Well","Barcode","run_id","Gender","Status","Role","HPO","BAM","Affected"])
-	sample_list = sample_list.replace({np.nan: ""})
+	sample_list = SampleStore(args.list)
 	family={}
 	for sample_id in family_ids:
-		sampled_format = retrieve_samples(sample_list,sample_id)
+		sampled_format = retrieve_samples(sample_list,sample_id,args.config)
 		role=sampled_format.case_status["Role"].split(" ")[0]
 		family.update({role:sampled_format})
 
 	print(family)
-	full_family = Family(args.name,family)
+	full_family = Family(args.name,family,config_file=args.config)
 	print(full_family)
 	full_family.write_joint_samplesheet()
+	full_family.write_family_list()
+	full_family.write_reuse_report()
 
-	with open(f"{sample_sheet_path}/{args.name}.txt",'w') as fw:
-		fw.write(f"{args.name},{args.name}.json\n")
-		for role in family:
-			item = family[role]
-			fw.write(f"{role}:{item.name},{item.bam_path}\n")
-
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,161 @@
+import sys,os
+import argparse
+import logging
+from Family import Family
+from SampleStore import SampleStore
+from jointCallSampleSheet import sample_from_row
+from singletonSampleSheet import write_singleton_batch
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from configLoader import load_config
+
+"""
+Group the samples of one or more runs into families using the roles recorded by getSamples.py
+(proband, mother of {proband}, father of {proband}, including the HSJ Decodeur 01/02/03/04 convention),
+complete them with members sequenced in other runs (from the sample store),
+then write every joint and singleton samplesheet in one go.
+Families still missing a member are reported instead of being written.
+"""
+
+#Number of parents expected for the status of the proband
+EXPECTED_PARENTS = {"Duo": 1, "Trio": 2, "Decodeur": 2}
+
+def plan_runs(store, run_ids):
+	"""
+	Returns: Dict {
+		"families": {proband: {"proband": row, "mother": row, "father": row, "siblings": [rows]}} (members are None if not found),
+		"singletons": [rows],
+		"problems": [messages]}
+	"""
+	families = {}
+	singletons = []
+	problems = []
+
+	def family(proband):
+		return families.setdefault(proband, {"proband": None, "mother": None, "father": None, "siblings": []})
+
+	def assign(members, role, row):
+		if members[role] is not None and members[role]["Name"] != row["Name"]:
+			problems.append(f"{row['Name']} and {members[role]['Name']} are both recorded as {row['Role']}")
+		elif members[role] is None:
+			members[role] = row
+
+	for run_id in run_ids:
+		run_rows = store.run_samples(run_id)
+		if len(run_rows) == 0:
+			problems.append(f"No samples of run {run_id} in the sample list, run getSamples.py first")
+		for row in run_rows:
+			role = row["Role"]
+			if role == "proband":
+				if row["Status"] == "Singleton":
+					singletons.append(row)
+				else:
+					assign(family(row["Name"]), "proband", row)
+			elif role.startswith("mother of ") or role.startswith("father of "):
+				parent, proband = role.split(" of ", 1)
+				assign(family(proband), parent, row)
+			else:
+				problems.append(f"{row['Name']} ({row['run_id']}): role '{role}' is not usable, not planned")
+
+	#Look for the members sequenced in other runs
+	for proband, members in families.items():
+		if members["proband"] is None:
+			proband_rows = store.find(proband)
+			if len(proband_rows) == 1:
+				members["proband"] = proband_rows[0]
+			elif len(proband_rows) > 1:
+				problems.append(f"Proband {proband} is in the sample list more than once: {[row['run_id'] for row in proband_rows]}")
+		for row in store.find_parents(proband):
+			assign(members, row["Role"].split(" ")[0], row)
+
+	#Decodeur: the 04 proband is a sibling of the 03 proband, whose parents are recorded as "of HSJ-XXX-03"
+	for proband in [name for name in families if name.startswith("HSJ") and name.endswith("04")]:
+		main_proband = proband[:-2] + "03"
+		if main_proband in families and families[proband]["proband"] is not None:
+			families[main_proband]["siblings"].append(families.pop(proband)["proband"])
+
+	return {"families": families, "singletons": singletons, "problems": problems}
+
+def missing_members(members):
+	"""
+	Returns: List of the missing roles of a planned family (empty if it can be joint called)
+	"""
+	missing = []
+	if members["proband"] is None:
+		missing.append("proband")
+		status = ""
+	else:
+		status = members["proband"]["Status"]
+	parents = [role for role in ["mother", "father"] if members[role] is not None]
+	expected = EXPECTED_PARENTS.get(status, 1)
+	if len(parents) < expected:
+		missing += [role for role in ["mother", "father"] if members[role] is None][:expected - len(parents)]
+	return missing
+
+def family_id(proband):
+	#Decodeur families are named after their prefix (HSJ-XXX), the others after the proband
+	if proband.startswith("HSJ") and proband[-3:] in ("-03", "_03"):
+		return proband[:-3]
+	return proband
+
+def write_plan(plan, config_file, sample_sheet_path):
+	"""
+	Write the samplesheets of the complete families and of the singletons
+	Returns: list of the family ids written
+	"""
+	written = []
+	for proband, members in sorted(plan["families"].items()):
+		if missing_members(members):
+			continue
+		sample_group = {"siblings": [sample_from_row(row, config_file) for row in members["siblings"]]}
+		for role in ["proband", "mother", "father"]:
+			if members[role] is not None:
+				sample_group[role] = sample_from_row(members[role], config_file)
+		family = Family(family_id(proband), sample_group, config_file=config_file)
+		family.write_joint_samplesheet()
+		family.write_family_list()
+		family.write_reuse_report()
+		written.append(family.family_ID)
+	if plan["singletons"]:
+		write_singleton_batch([sample_from_row(row, config_file) for row in plan["singletons"]], sample_sheet_path)
+	return written
+
+def print_plan(plan):
+	complete = {proband: members for proband, members in plan["families"].items() if not missing_members(members)}
+	incomplete = {proband: members for proband, members in plan["families"].items() if missing_members(members)}
+	member_text = lambda row: f"{row['Name']} ({row['run_id']}/{row['Well']})"
+
+	print(f"------Families ready for joint call: {len(complete)}------")
+	for proband, members in sorted(complete.items()):
+		roles = [f"{role}:{member_text(members[role])}" for role in ["proband", "mother", "father"] if members[role] is not None]
+		roles += [f"sibling:{member_text(row)}" for row in members["siblings"]]
+		print(f"{family_id(proband)}\t" + ", ".join(roles))
+	print(f"------Singletons: {len(plan['singletons'])}------")
+	for row in plan["singletons"]:
+		print(member_text(row))
+	print(f"------Incomplete families: {len(incomplete)}------")
+	for proband, members in sorted(incomplete.items()):
+		found = [f"{role}:{member_text(members[role])}" for role in ["proband", "mother", "father"] if members[role] is not None]
+		print(f"{family_id(proband)}\tmissing {', '.join(missing_members(members))}\tfound {', '.join(found)}")
+	for problem in plan["problems"]:
+		logging.warning(problem)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		prog = 'planRuns.py',
+		usage = "python3 %(prog)s [-r run_id [run_id ...]] [--dry-run] [--list sample_list --config config_file (optional)]",
+		description='Group the samples of the given runs into families and write all their joint and singleton samplesheets')
+	parser.add_argument('-r', '--run', nargs='+', help='Run ids already added to the sample list by getSamples.py', required=True)
+	parser.add_argument('--dry-run', action='store_true', help='Only print the plan, do not write samplesheets')
+	parser.add_argument('-l', '--list', nargs='?', const='mySampleList.db', default='mySampleList.db', help='Sample store (see SampleStore.py)')
+	parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
+	args = parser.parse_args(argv)
+
+	configs = load_config(args.config)
+	plan = plan_runs(SampleStore(args.list), args.run)
+	print_plan(plan)
+	if not args.dry_run:
+		written = write_plan(plan, args.config, configs.Paths.sample_sheet_path)
+		print(f"Wrote samplesheets for {len(written)} families and {len(plan['singletons'])} singletons")
+
+if __name__ == "__main__":
+	main()
@@ -3,43 +3,111 @@ import json
 import subprocess
 from Sample import Sample
 from pathlib import Path
-from configurator import Config
 import argparse
-import pandas as pd
-import numpy as np
-from jointCallSampleSheet import retrieve_samples
+from jointCallSampleSheet import retrieve_samples, find_sample, sample_from_row
+from SampleStore import SampleStore
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "Common"))
+from atomicWrite import write_text
+from configLoader import load_config
 
 """
-Generate the WDL samplesheet for given sample.
+Generate the WDL samplesheet for given sample, or for a batch of samples.
 Give the sample info (obtained from the sampleList generated by getSamples.py) as argument and a config file, optionally
 """
-if __name__ == "__main__":
+
+def batch_line(sample):
+	#Line of the {run_id}_samples batch file: name, samplesheet and BAM
+	return f"{sample.name},{sample.run_id}_{sample.well}_{sample.name}.json,{sample.bam_path}"
+
+def update_batch_file(batch_path, samples):
+	"""
+	Add the samples to a {run_id}_samples batch file, written atomically.
+	A sample already in the file has its line replaced instead of being listed twice.
+	"""
+	lines = {}
+	if os.path.isfile(batch_path):
+		with open(batch_path) as fr:
+			for line in fr:
+				line = line.rstrip("\n")
+				if line:
+					lines[line.split(",")[0]] = line
+	for sample in samples:
+		lines[sample.name] = batch_line(sample)
+	write_text(batch_path, "".join(f"{line}\n" for line in lines.values()))
+
+def write_singleton_batch(samples, sample_sheet_path):
+	"""
+	Write the samplesheet of every sample, then update each run's batch file once
+	"""
+	by_run = {}
+	for sample in samples:
+		sample.write_singleton_samplesheet()
+		by_run.setdefault(sample.run_id, []).append(sample)
+	#Write the list of sample name for each run and the path to their samplesheet
+	for run_id, run_samples in by_run.items():
+		update_batch_file(f"{sample_sheet_path}/{run_id}_samples", run_samples)
+
+def main(argv=None):
 	parser = argparse.ArgumentParser(
 		prog = 'singletonSampleSheet.py',
-		usage = "python3 %(prog)s [-p proband_id] [--list sample_list --config config_file (optional)]",	
+		usage = "python3 %(prog)s [-p proband_id | -r run_id [--all-singletons] | --names name_file] [--list sample_list --config config_file (optional)]",
 		description="""
-		given a sample name, retrieve the samples included within. 
+		given a sample name, retrieve the samples included within.
 		Prints them a sample sheet in sample_path (defined in config)
-		and a .txt list of samples from the same run for future use""")
-	parser.add_argument('-p', '--proband',help='proband sample name',required=True)
-	parser.add_argument('-l', '--list', nargs='?', const='mySampleList.txt', default='mySampleList.txt')
+		and a .txt list of samples from the same run for future use.
+		A whole run or a file of names can be given to write all the samplesheets at once""")
+	selection = parser.add_mutually_exclusive_group(required=True)
+	selection.add_argument('-p', '--proband',help='proband sample name')
+	selection.add_argument('-r', '--run',help='write the samplesheets of every sample of this run id')
+	selection.add_argument('--names',help='file containing one sample name per line')
+	parser.add_argument('--all-singletons',action='store_true',help='with --run, only the samples with a Singleton status')
+	parser.add_argument('-l', '--list', nargs='?', const='mySampleList.db', default='mySampleList.db', help='Sample store (see SampleStore.py)')
 	parser.add_argument('-c', '--config', nargs='?', const='.myconf.json', default='.myconf.json')
-	
-	args		= parser.parse_args()
-	configs  	= Config.from_path(args.config)
+
+	args		= parser.parse_args(argv)
+	configs  	= load_config(args.config)
+	if args.all_singletons and args.run is None:
+		parser.error("--all-singletons requires --run")
 
 	#The paths specific to your configuration should be in the Paths section of the configs
 	run_path = configs.Paths.run_path
 	sample_sheet_path = configs.Paths.sample_sheet_path
 
-	sample_list = pd.read_csv(args.list,sep=";",names=["Name","Well","Barcode","run_id","Gender","Status","Role","HPO","BAM","Affected"])
-	sample_list = sample_list.replace({np.nan: ""})
+	sample_list = SampleStore(args.list)
 
-	sample = retrieve_samples(sample_list, args.proband)
-	print(sample)
-	sample.write_singleton_samplesheet()
-	#Write the list of sample name for this run and the path to their samplesheet
-	with open(f"{sample_sheet_path}/{sample.run_id}_samples",'a') as fw:
-		fw.write(f"{sample.name},{sample.run_id}_{sample.well}_{sample.name}.json,{sample.bam_path}\n")
+	if args.proband is not None:
+		sample = retrieve_samples(sample_list, args.proband, args.config)
+		print(sample)
+		write_singleton_batch([sample], sample_sheet_path)
+		sys.exit()
 
+	errors = []
+	if args.run is not None:
+		rows = sample_list.run_samples(args.run)
+		if args.all_singletons:
+			rows = [row for row in rows if row["Status"] == "Singleton"]
+		if len(rows) == 0:
+			print(f"No matching samples of run {args.run} in sample list: {args.list}")
+			sys.exit(1)
+		samples = [sample_from_row(row, args.config) for row in rows]
+	else:
+		with open(args.names) as fr:
+			names = [line.strip() for line in fr if line.strip()]
+		samples = []
+		for name in dict.fromkeys(names):
+			try:
+				samples.append(find_sample(sample_list, name, args.config))
+			except LookupError as e:
+				errors.append(str(e))
 
+	for sample in samples:
+		print(sample)
+	write_singleton_batch(samples, sample_sheet_path)
+	print(f"Wrote {len(samples)} samplesheets")
+	if errors:
+		print(f"{len(errors)} sample(s) could not be written:")
+		for error in errors: print(error)
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
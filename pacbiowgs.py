@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+import os,sys
+import json
+import argparse
+import importlib
+
+"""
+Single entry point for the Preanalysis, Analysis and Postanalysis scripts:
+python3 pacbiowgs.py [-c config_file] <command> [command arguments]
+Only the module of the requested command is imported (pandas, requests... are not loaded for the other commands),
+and the config given with -c is forwarded to the command, which parses it once for the whole process.
+Run "python3 pacbiowgs.py <command> --help" for the arguments of each command.
+"""
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+#command: (folder, module, whether it takes --config, description)
+COMMANDS = {
+	"samples":		("Preanalysis", "getSamples", True, "Retrieve the samples of a run from Emedgene and Phenotips into the sample list"),
+	"singleton":	("Preanalysis", "singletonSampleSheet", True, "Write singleton samplesheets for a sample, a run or a list of names"),
+	"joint":		("Preanalysis", "jointCallSampleSheet", True, "Write the joint samplesheet of a family, or of every family of a pedigree table"),
+	"plan":			("Preanalysis", "planRuns", True, "Group the samples of whole runs into families and write all their samplesheets"),
+	"hpo":			("Preanalysis", "getHPOtermsFromList", True, "Retrieve the Phenotips HPO terms of a list of samples"),
+	"store":		("Preanalysis", "SampleStore", False, "Import or export the sample list in the text format"),
+	"study":		("Preanalysis", "getStudy", False, "Extract the study information of a list of specimens"),
+	"launch":		("Analysis", "launchRuns", True, "Queue and launch the miniwdl runs of families and singletons"),
+	"runtime":		("Analysis", "RuntimeModel", True, "Fit the runtime model of past miniwdl runs, used by launch"),
+	"send":			("Postanalysis", "sendSamplesToGeneYX", True, "Unify the VCFs of a run or family to send them to GeneYX"),
+	"assign":		("Postanalysis", "assignListToGeneYXGroup", True, "Assign a list of samples to a GeneYX group"),
+	"geneyx-list":	("Postanalysis", "getSampleListFromGeneYX", True, "Sync the local catalogue of the samples on GeneYX"),
+}
+
+def config_values(config_file, keys):
+	"""
+	Look up dotted keys (ie Paths.output_path) in the JSON config, without loading the rest of the pipeline
+	- `keys`: List of KEY or NAME=KEY, NAME defaulting to the last part of KEY
+	Returns: List of tuples (NAME, value)
+	"""
+	with open(config_file) as fr:
+		configs = json.load(fr)
+	values = []
+	for key in keys:
+		name, _, path = key.rpartition("=")
+		value = configs
+		for part in path.split("."):
+			if not isinstance(value, dict) or part not in value:
+				raise LookupError(f"{path} not found in {config_file}")
+			value = value[part]
+		values.append((name or path.split(".")[-1], value))
+	return values
+
+def config_command(argv, config_file):
+	parser = argparse.ArgumentParser(
+		prog = 'pacbiowgs.py config',
+		usage = "python3 %(prog)s [--shell] KEY [KEY ...]",
+		description='Print values of the config, one per line. With --shell, print NAME=value lines to eval in a shell script')
+	parser.add_argument('keys', nargs='+', help='Dotted config key (ie Paths.output_path), or NAME=KEY to choose the shell variable name')
+	parser.add_argument('--shell', action='store_true', help='Print shell assignments, quoted')
+	args = parser.parse_args(argv)
+
+	try:
+		values = config_values(config_file, args.keys)
+	except (OSError, ValueError, LookupError) as e:
+		print(f"Could not read config: {e}", file=sys.stderr)
+		sys.exit(1)
+	for name, value in values:
+		text = value if isinstance(value, str) else json.dumps(value)
+		if args.shell:
+			import shlex
+			print(f"{name}={shlex.quote(text)}")
+		else:
+			print(text)
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(
+		prog = 'pacbiowgs.py',
+		usage = "python3 %(prog)s [-c config_file] <command> [command arguments]",
+		description='Commands:\n' + "\n".join(f"  {name:<12}{command[3]}" for name, command in COMMANDS.items()) +
+			"\n  config      Print config values (for shell scripts)",
+		formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('-c', '--config', help='Config file given to the command (default: the command default, .myconf.json)')
+	parser.add_argument('command', choices=[*COMMANDS, "config"], metavar='command')
+	parser.add_argument('arguments', nargs=argparse.REMAINDER)
+	args = parser.parse_args(argv)
+
+	if args.command == "config":
+		config_command(args.arguments, args.config or ".myconf.json")
+		return
+
+	folder, module_name, takes_config, _ = COMMANDS[args.command]
+	for path in [os.path.join(ROOT, "Common"), os.path.join(ROOT, folder)]:
+		if path not in sys.path:
+			sys.path.insert(0, path)
+	command_argv = list(args.arguments)
+	if args.config is not None:
+		if not takes_config:
+			parser.error(f"{args.command} does not take a config file")
+		#Given first, so that a --config after the command still takes precedence
+		command_argv = ["--config", args.config] + command_argv
+	importlib.import_module(module_name).main(command_argv)
+
+if __name__ == "__main__":
+	main()